@@ -13,13 +13,26 @@ results.json, but execute independently.
 
 Note: Analysis.py doesn't connect to the cluster anymore. It only operates on files in work
 directory, and especially reports/.
+
+The plugins of libanalysis.INDEPENDENT_CHECKS only read the reports and add their own results, so
+they run concurrently, each one in a process of its own, by up to `analysis.plugin_workers`
+processes. The other plugins then run in this process, in order. The results of all the plugins
+are added to results.json in the order of `analysis.checks`, whichever finished first, along with
+the wall time, CPU time and peak memory of each plugin, under `plugins`. The peak memory is only
+known for the plugins that ran in a process of their own: it is null for the others.
 """
 import argparse
+import concurrent.futures
+import multiprocessing
+import os
+import resource
 import sys
+import time
 
 import structlog
 
 from test_control import copy_to_reports, print_perf_json
+from libanalysis import util
 from libanalysis.results import ResultsFile
 from common.log import setup_logging
 from common.config import ConfigDict
@@ -27,6 +40,10 @@ from common.workload_output_parser import parse_test_results, get_supported_pars
 
 LOG = structlog.get_logger(__name__)
 
+# The config of the plugins run in worker processes. The workers are forked, so they inherit it
+# rather than unpickle it: a ConfigDict can't be pickled.
+_WORKER_CONFIG = None
+
 
 class ResultsAnalyzer(object):
     """
@@ -45,11 +62,25 @@ class ResultsAnalyzer(object):
         # Note that for simplicity the module name and the function name are the same.
         # Example: from libanalysis.core_files import core_files
         plugins = self._get_plugins()
-        for plugin in plugins:
-            module = __import__('libanalysis')
-            func = getattr(module, plugin)
-            func(self.config, self.results)
-
+        module = __import__('libanalysis')
+        workers = self.config['analysis'].get('plugin_workers', 1) or os.cpu_count()
+        independent = {
+            number: plugin
+            for number, plugin in enumerate(plugins) if plugin in module.INDEPENDENT_CHECKS
+        }
+        outcomes = {}
+        if workers > 1 and len(independent) > 1:
+            outcomes = _run_in_workers(self.config, independent, workers)
+        for number, plugin in enumerate(plugins):
+            if number not in outcomes:
+                outcomes[number] = run_plugin(plugin, self.config, self.results)
+
+        # Whichever plugin finished first, the results are in the order of the checks.
+        for number, plugin in enumerate(plugins):
+            added, stats = outcomes[number]
+            self.results.extend(added)
+            self.results.add_plugin_stats(plugin, **stats)
+            LOG.info("Ran analysis plugin", plugin=plugin, results=len(added), **stats)
         self.failures = self.results.write()
         return self.failures
 
@@ -59,6 +90,94 @@ class ResultsAnalyzer(object):
         return plugins
 
 
+def run_plugin(plugin, config, results, own_process=False):
+    """
+    Run an analysis plugin, and measure the resources it used.
+
+    :param str plugin: The name of the plugin function in libanalysis.
+    :param ConfigDict config: The global config.
+    :param ResultsFile results: The plugin adds its results here. They are removed again, and
+                                returned, so that they can be added in the order of the checks.
+    :param bool own_process: Whether this process was started to run only this plugin.
+    :rtype: (list(dict), dict) The results added by the plugin, and its wall time, CPU time and
+            peak memory. The CPU time includes that of the processes started by the plugin. The
+            peak memory is the largest resident set size of this process, or of the processes the
+            plugin started. It is None unless `own_process`, as it would then include the memory
+            of the plugins that ran before in the same process.
+    """
+    func = getattr(__import__('libanalysis'), plugin)
+    start = len(results.data['results'])
+    before = _cpu_seconds()
+    start_time = time.time()
+    func(config, results)
+    wall_time = time.time() - start_time
+    cpu_time = _cpu_seconds() - before
+    added = results.data['results'][start:]
+    del results.data['results'][start:]
+    peak_memory_mb = None
+    if own_process:
+        # ru_maxrss is in KB on Linux.
+        peak_memory_mb = max(
+            resource.getrusage(who).ru_maxrss
+            for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)) / 1024.0
+    return added, {'wall_time': wall_time, 'cpu_time': cpu_time, 'peak_memory_mb': peak_memory_mb}
+
+
+def _cpu_seconds():
+    """Return the user and system CPU time of this process and of its finished children."""
+    return sum(usage.ru_utime + usage.ru_stime
+               for usage in (resource.getrusage(resource.RUSAGE_SELF),
+                             resource.getrusage(resource.RUSAGE_CHILDREN)))
+
+
+def _run_in_worker(plugin, max_workers):
+    util.MAX_PLUGIN_WORKERS = max_workers
+    return run_plugin(plugin, _WORKER_CONFIG, ResultsFile(_WORKER_CONFIG), own_process=True)
+
+
+def _run_in_workers(config, plugins, workers):
+    """
+    Run `plugins` concurrently, each one in a new process, so that its peak memory is its own.
+
+    :param ConfigDict config: The global config.
+    :param dict(int, str) plugins: The plugins to run, by their position in the checks.
+    :param int workers: The maximum number of plugins running at the same time. The CPUs are
+                        shared between them: each plugin starts at most its share of worker
+                        processes, see util.worker_count().
+    :rtype: dict(int, tuple) The outcome of run_plugin() for each position.
+    """
+    global _WORKER_CONFIG  # pylint: disable=global-statement
+    _WORKER_CONFIG = config
+    context = multiprocessing.get_context('fork')
+    pending = sorted(plugins)
+    max_workers = max(1, os.cpu_count() // min(workers, len(plugins)))
+    running = {}
+    outcomes = {}
+    LOG.debug("Running analysis plugins in worker processes",
+              plugins=list(plugins.values()),
+              workers=workers,
+              max_plugin_workers=max_workers)
+    try:
+        while pending or running:
+            while pending and len(running) < workers:
+                number = pending.pop(0)
+                executor = concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context)
+                running[executor.submit(_run_in_worker, plugins[number],
+                                        max_workers)] = (number, executor)
+            finished, _ = concurrent.futures.wait(running,
+                                                  return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                number, executor = running.pop(future)
+                executor.shutdown()
+                # An exception of the plugin is raised again here, as if it ran in this process.
+                outcomes[number] = future.result()
+    finally:
+        for _, executor in running.values():
+            executor.shutdown()
+        _WORKER_CONFIG = None
+    return outcomes
+
+
 def main(argv):
     """ Main function. Parse command line options, and run analysis.
 
@@ -0,0 +1,292 @@
+"""
+Thread to check the FTDC data of the mongod nodes while a test is running.
+
+The resource rules of libanalysis/ftdc_analysis.py are otherwise only checked by analysis.py, on
+the diagnostic.data that post_test retrieves, hours after e.g. the cache overflowed. When
+test_control.ftdc_tail.enabled is set, this thread polls the diagnostic.data directory of each
+host every `interval_seconds`:
+
+* metrics.<date> files only grow: only the bytes added since the previous poll are read. The data
+  they already hold when the thread starts is skipped without being read.
+* metrics.interim is small and rewritten by mongod, it is read whole.
+
+Only the chunks completed since the previous poll are decoded, and only their samples since the
+start of the test are checked with the resource_rules_ftdc_chunk rules. Failures are logged right
+away. With abort_on_failure, the first failure also aborts the test. Rules checked on the whole
+FTDC file, and rules that need constants only known after the test, are left to analysis.py.
+"""
+import collections
+import copy
+import inspect
+import os
+import threading
+import time
+
+import numpy as np
+import structlog
+
+from common.host_factory import make_host
+from common.host_utils import extract_hosts
+import common.mongodb_setup_helpers
+from libanalysis import ftdc_analysis
+from libanalysis import readers
+from libanalysis import rules
+from libanalysis import util
+
+LOG = structlog.get_logger(__name__)
+
+INTERIM_SUFFIX = '.interim'
+
+
+def start(test, config, abort):
+    """
+    Start a thread that checks the FTDC data of the hosts during a test, if enabled.
+
+    :param ConfigDict test: The configuration for the current test.
+    :param ConfigDict config: The DSI configuration.
+    :param callable abort: Called with a message to abort the test, if abort_on_failure is set.
+    :return: A method that will stop the thread started by this method.
+    """
+    tail_config = config['test_control'].get('ftdc_tail', {})
+    if not tail_config.get('enabled', False):
+        return lambda: None
+    thread = FtdcTailThread(test, config, abort)
+    thread.daemon = True
+    thread.start()
+    return thread.stop
+
+
+def aborts_on_failure(config):
+    """
+    Return whether the thread started by start() may abort the test.
+
+    :param ConfigDict config: The DSI configuration.
+    :rtype: bool
+    """
+    tail_config = config['test_control'].get('ftdc_tail', {})
+    return tail_config.get('enabled', False) and tail_config.get('abort_on_failure', False)
+
+
+def live_chunk_rules(config, constant_values):
+    """
+    Return the resource_rules_ftdc_chunk rules of the variant that can be checked during a test.
+
+    ftdc_replica_lag_check reads the whole FTDC file. Rules that need a constant that is neither
+    in `constant_values` nor read from the FTDC data, e.g. max_thread_level without a configured
+    value, are skipped too.
+
+    :param ConfigDict config: The DSI configuration.
+    :param dict constant_values: The constants known before the test.
+    :rtype: list(str)
+    """
+    variant = config['mongodb_setup']['meta']['mongodb_setup']
+    available = {'chunk', 'times'} | set(rules.FETCH_CONSTANTS) | set(constant_values)
+    checked = []
+    for rule_name in util.get_project_variant_rules(config, variant, 'resource_rules_ftdc_chunk'):
+        # pylint: disable=deprecated-method
+        arguments = inspect.getfullargspec(getattr(rules, rule_name))[0]
+        if rule_name != 'ftdc_replica_lag_check' and set(arguments) <= available:
+            checked.append(rule_name)
+    return checked
+
+
+def new_samples(chunk, after):
+    """
+    Return the samples of an FTDC chunk after time `after`, or None if there are none.
+
+    :param collections.OrderedDict chunk: FTDC chunk.
+    :param int after: Time in ms since the epoch.
+    :rtype: collections.OrderedDict
+    """
+    newer = chunk[rules.FTDC_KEYS['time']] > after
+    if not newer.any():
+        return None
+    if newer.all():
+        return chunk
+    selected = collections.OrderedDict((key, values[newer]) for key, values in chunk.items())
+    selected.nsamples = int(np.count_nonzero(newer))
+    selected.chunk_len = chunk.chunk_len
+    return selected
+
+
+class FtdcTail(object):  # pylint: disable=too-many-instance-attributes
+    """
+    The FTDC data of one host, read and checked incrementally.
+    """
+    def __init__(self, host, path, chunk_rules, constant_values, start_ms):  # pylint: disable=too-many-arguments
+        """
+        :param Host host: The host, its files are read with list_dir() and read_file().
+        :param str path: The diagnostic.data directory on the host.
+        :param list(str) chunk_rules: The rules checked on each chunk.
+        :param dict constant_values: Constants of the rules. Each host gets its own copy.
+        :param int start_ms: Only samples after this time, in ms since the epoch, are checked.
+        """
+        self.host = host
+        self.path = path
+        self.chunk_rules = chunk_rules
+        self.constant_values = copy.deepcopy(constant_values)
+        self.last_sample_ms = start_ms
+        self.samples = 0
+        self.offsets = {}
+        self.pending = {}
+
+    def skip_existing(self):
+        """
+        Start reading the metrics.<date> files from their current end. mongod appends whole
+        chunks, and their samples all precede the start of the test.
+        """
+        for name in self.host.list_dir(self.path):
+            if not name.startswith('.') and not name.endswith(INTERIM_SUFFIX):
+                self.offsets[name] = self.host.file_size(os.path.join(self.path, name))
+
+    def poll(self):
+        """
+        Check the samples added since the previous poll.
+
+        :return: The failure messages, one per failed rule and chunk.
+        :rtype: list(str)
+        """
+        failures = []
+        # metrics.interim sorts after the metrics.<date> files, and holds the newest samples.
+        for name in sorted(self.host.list_dir(self.path)):
+            if not name.startswith('.'):
+                for chunk in self._read_chunks(name):
+                    failures.extend(self._check(chunk))
+        return failures
+
+    def _read_chunks(self, name):
+        remote_path = os.path.join(self.path, name)
+        if name.endswith(INTERIM_SUFFIX):
+            chunks, _ = readers.read_ftdc_bytes(self.host.read_file(remote_path),
+                                                keys=rules.FTDC_RULE_KEYS)
+            return chunks
+        offset = self.offsets.get(name, 0)
+        data = self.host.read_file(remote_path, offset)
+        self.offsets[name] = offset + len(data)
+        # A chunk that was being written at the previous poll is completed by the new bytes.
+        data = self.pending.pop(name, b'') + data
+        chunks, used = readers.read_ftdc_bytes(data, keys=rules.FTDC_RULE_KEYS)
+        if used < len(data):
+            self.pending[name] = data[used:]
+        return chunks
+
+    def _check(self, chunk):
+        if not chunk or rules.FTDC_KEYS['time'] not in chunk:
+            return []
+        chunk = new_samples(chunk, self.last_sample_ms)
+        if chunk is None:
+            return []
+        self.last_sample_ms = int(chunk[rules.FTDC_KEYS['time']][-1])
+        self.samples += chunk.nsamples
+        failures = ftdc_analysis.check_chunk(chunk, self.chunk_rules, self.constant_values)
+        return [
+            'RULE {0}{1}'.format(rule_name, ftdc_analysis.failure_message(output, self.samples))
+            for rule_name, output in failures.items()
+        ]
+
+
+class FtdcTailThread(threading.Thread):  # pylint: disable=too-many-instance-attributes
+    """
+    Thread object to check the FTDC data of the hosts during a test
+    """
+    def __init__(self, test, config, abort):
+        """
+        :param ConfigDict test: The configuration for the current test.
+        :param ConfigDict config: The DSI configuration.
+        :param callable abort: Called with a message to abort the test, if abort_on_failure is set.
+        """
+        threading.Thread.__init__(self)
+        self._stop_signal = threading.Event()
+        self.test = test
+        self.config = config
+        self.abort = abort
+        self.tail_config = config['test_control']['ftdc_tail']
+        self.start_ms = int(time.time() * 1000)
+        self.failures = []
+
+    def stop(self):
+        """
+        Signal this thread to stop, and wait for it.
+        """
+        if self.is_alive():
+            LOG.info("Stopping ftdc_tail thread...")
+            self._stop_signal.set()
+            self.join()
+            LOG.info("Stopped ftdc_tail thread.", failures=len(self.failures))
+
+    def run(self):
+        """
+        Main method for the thread.
+        """
+        try:
+            tails = self._make_tails()
+        except Exception:  # pylint: disable=broad-except
+            # The checks are best effort: analysis.py checks the retrieved files anyway.
+            LOG.warning("Couldn't start checking FTDC data during test",
+                        test=self.test['id'],
+                        exc_info=1)
+            return
+        interval = self.tail_config.get('interval_seconds', 30)
+        try:
+            while not self._stop_signal.wait(interval):
+                if self._poll(tails) and self.tail_config.get('abort_on_failure', False):
+                    message = 'Aborted test {0}: FTDC resource rules failed during the test'.format(
+                        self.test['id'])
+                    LOG.error(message)
+                    self.abort(message)
+                    return
+        finally:
+            for tail in tails:
+                tail.host.close()
+
+    def _poll(self, tails):
+        """
+        Poll each host once.
+
+        :return: Whether a rule failed.
+        """
+        failed = False
+        for tail in tails:
+            try:
+                failures = tail.poll()
+            except Exception:  # pylint: disable=broad-except
+                # The checks are best effort: analysis.py checks the retrieved files anyway.
+                LOG.warning("Couldn't check FTDC data during test",
+                            host=tail.host.alias,
+                            exc_info=1)
+                continue
+            for failure in failures:
+                LOG.warning("FTDC resource rule failed during test",
+                            test=self.test['id'],
+                            host=tail.host.alias,
+                            failure=failure)
+            self.failures.extend(failures)
+            failed = failed or bool(failures)
+        return failed
+
+    def _make_tails(self):
+        constants = self.config['analysis']['rules']['constants']
+        constant_values = {'test_times': None}
+        max_thread_level = constants.get('variant', {}).get('max_thread_level')
+        if max_thread_level is not None:
+            constant_values['max_thread_level'] = max_thread_level
+        chunk_rules = live_chunk_rules(self.config, constant_values)
+        LOG.info("Checking FTDC during test", test=self.test['id'], rules=chunk_rules)
+
+        mongodb_auth_settings = common.mongodb_setup_helpers.mongodb_auth_settings(self.config)
+        use_tls = common.mongodb_setup_helpers.mongodb_tls_configured(
+            self.config['mongodb_setup']['meta'])
+        tails = []
+        try:
+            for target in self.tail_config.get('hosts', ['mongod', 'configsvr']):
+                for host_info in extract_hosts(target, self.config):
+                    host = make_host(host_info, mongodb_auth_settings, use_tls)
+                    tail = FtdcTail(host, self.tail_config.get('path', 'data/dbs/diagnostic.data'),
+                                    chunk_rules, constant_values, self.start_ms)
+                    tails.append(tail)
+                    tail.skip_existing()
+        except BaseException:
+            for tail in tails:
+                tail.host.close()
+            raise
+        return tails
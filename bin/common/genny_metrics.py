@@ -0,0 +1,231 @@
+"""
+Time series of genny's per-operation metrics.
+
+When run with an FTDC metrics format (e.g. `-m cedar` or `-m csv-ftdc`), genny records every
+operation of every actor in FTDC files, one file per actor and operation, e.g.
+`CedarMetrics/InsertRemove.Insert.ftdc`. Each sample is one event and holds running totals:
+
+    ts              time of the event (epoch ms)
+    counters.n      number of events so far
+    counters.ops    number of operations (documents, queries...) so far
+    counters.errors number of errors so far
+    timers.dur      time spent in the operation so far, in nanoseconds
+    gauges.workers  number of actor threads
+
+The files are decoded with libanalysis/readers.py. Throughput and latency percentiles are computed
+over fixed windows, which shows warm-up, steady state and stalls that a single average for the
+whole run hides.
+"""
+
+import csv
+import logging
+import os
+
+import numpy as np
+
+from common import latency_distribution
+from libanalysis import readers
+
+LOG = logging.getLogger(__name__)
+
+FTDC_SUFFIX = '.ftdc'
+
+TIMESTAMP = ('ts', )
+EVENTS = ('counters', 'n')
+OPS = ('counters', 'ops')
+ERRORS = ('counters', 'errors')
+DURATION = ('timers', 'dur')
+WORKERS = ('gauges', 'workers')
+
+NANOSECONDS_PER_MICROSECOND = 1000.0
+
+
+def find_metrics_files(path):
+    """
+    Return the genny FTDC files at `path`, which is either such a file or a directory of them.
+
+    :param str path: A file or directory in the reports directory of a test.
+    :rtype: list(str)
+    """
+    if os.path.isdir(path):
+        found = []
+        for root, _, files in os.walk(path):
+            found.extend(os.path.join(root, name) for name in files if name.endswith(FTDC_SUFFIX))
+        return sorted(found)
+    if path.endswith(FTDC_SUFFIX) and os.path.isfile(path):
+        return [path]
+    return []
+
+
+def operation_name(path):
+    """
+    Return the name of the actor and operation recorded in the file at `path`.
+
+    >>> operation_name('reports/genny/CedarMetrics/InsertRemove.Insert.ftdc')
+    'InsertRemove.Insert'
+    """
+    return os.path.basename(path)[:-len(FTDC_SUFFIX)]
+
+
+def read_samples(path):
+    """
+    Read the samples of a genny FTDC file.
+
+    :param str path: The FTDC file.
+    :rtype: dict(tuple, numpy.ndarray) The values of each of TIMESTAMP, EVENTS, OPS, ERRORS,
+                                       DURATION and WORKERS. Missing metrics are all zeros.
+    """
+    keys = (TIMESTAMP, EVENTS, OPS, ERRORS, DURATION, WORKERS)
+    values = {key: [] for key in keys}
+    for chunk in readers.read_ftdc(path, keys=keys):
+        if not chunk or TIMESTAMP not in chunk:
+            continue
+        for key in keys:
+            values[key].append(chunk.get(key, [0] * chunk.nsamples))
+    return {
+        key: np.concatenate(chunks).astype(np.int64) if chunks else np.zeros(0, dtype=np.int64)
+        for key, chunks in values.items()
+    }
+
+
+def event_latencies(samples):
+    """
+    Return the latency of the events in each sample and the number of events it holds.
+
+    Samples without a new event are dropped.
+
+    :param dict samples: See read_samples().
+    :rtype: (numpy.ndarray, numpy.ndarray, numpy.ndarray) The timestamp of each sample, its
+                                                          latency in microseconds and its number of
+                                                          events.
+    """
+    events = np.diff(samples[EVENTS], prepend=0)
+    duration = np.diff(samples[DURATION], prepend=0)
+    new_events = events > 0
+    latencies = duration[new_events] / events[new_events] / NANOSECONDS_PER_MICROSECOND
+    return samples[TIMESTAMP][new_events], latencies, events[new_events]
+
+
+def weighted_percentiles(values, weights, percentiles):
+    """
+    Return the values at `percentiles` when each value occurs as many times as its weight.
+
+    Like HdrHistogram, this returns the smallest value with at least that percentile of the samples
+    at or below it.
+
+    >>> weighted_percentiles(np.array([3.0, 1.0, 2.0]), np.array([1, 1, 2]), [50, 100])
+    [2.0, 3.0]
+
+    :param numpy.ndarray values: The values.
+    :param numpy.ndarray weights: Number of occurrences of each value.
+    :param list(float) percentiles: Percentiles between 0 and 100.
+    :rtype: list(float)
+    """
+    order = np.argsort(values, kind='stable')
+    cumulative = np.cumsum(weights[order])
+    targets = np.asarray(percentiles, dtype=float) / 100.0 * cumulative[-1]
+    indexes = np.minimum(np.searchsorted(cumulative, targets, side='left'), len(values) - 1)
+    return [float(value) for value in values[order][indexes]]
+
+
+def windowed_stats(samples, window_seconds, percentiles):  # pylint: disable=too-many-locals
+    """
+    Compute throughput and latency percentiles over consecutive windows of a run.
+
+    Windows start at the first sample. A window without events, e.g. during a stall, has 0 ops and
+    no latencies. The last window is usually shorter than `window_seconds`.
+
+    :param dict samples: See read_samples().
+    :param float window_seconds: Length of each window.
+    :param list(float) percentiles: Latency percentiles to compute.
+    :rtype: list(dict) One row per window, with keys start (epoch seconds), seconds, ops,
+                       ops_per_sec, errors and latency_us_p<N> for each of `percentiles`.
+    """
+    timestamps = samples[TIMESTAMP]
+    if not timestamps.size:
+        return []
+    window_ms = int(window_seconds * 1000)
+    first = int(timestamps.min())
+    windows = (timestamps - first) // window_ms
+    nwindows = int(windows.max()) + 1
+    ops = np.bincount(windows, weights=np.diff(samples[OPS], prepend=0), minlength=nwindows)
+    errors = np.bincount(windows, weights=np.diff(samples[ERRORS], prepend=0), minlength=nwindows)
+
+    event_times, latencies, events = event_latencies(samples)
+    order = np.argsort(event_times, kind='stable')
+    latencies, events = latencies[order], events[order]
+    event_windows = (event_times[order] - first) // window_ms
+    bounds = np.searchsorted(event_windows, np.arange(nwindows + 1), side='left')
+
+    rows = []
+    for window in range(nwindows):
+        start_ms = first + window * window_ms
+        seconds = window_seconds
+        if window == nwindows - 1 and timestamps.max() > start_ms:
+            seconds = min(window_seconds, (timestamps.max() - start_ms) / 1000.0)
+        row = {
+            'start': start_ms / 1000.0,
+            'seconds': float(seconds),
+            'ops': int(ops[window]),
+            'ops_per_sec': float(ops[window] / seconds),
+            'errors': int(errors[window])
+        }
+        low, high = bounds[window], bounds[window + 1]
+        if high > low:
+            values = weighted_percentiles(latencies[low:high], events[low:high], percentiles)
+            for percentile, value in zip(percentiles, values):
+                row['latency_us_' + latency_distribution.percentile_key(percentile)] = value
+        rows.append(row)
+    return rows
+
+
+def latency_summary(samples, percentiles):
+    """
+    Return the latency distribution of a whole run.
+
+    :param dict samples: See read_samples().
+    :param list(float) percentiles: Latency percentiles to compute.
+    :rtype: dict A distribution, see common/latency_distribution.py, or None without events.
+    """
+    _, latencies, events = event_latencies(samples)
+    if not latencies.size:
+        return None
+    values = weighted_percentiles(latencies, events, list(percentiles) + [0, 100])
+    reported = dict(zip(percentiles, values))
+    reported['min'] = values[-2]
+    reported['max'] = values[-1]
+    return latency_distribution.from_percentiles(reported, int(events.sum()))
+
+
+def write_timeseries(path, rows_by_operation, percentiles):
+    """
+    Write the windowed stats of each operation to a CSV file, one row per operation and window.
+
+    :param str path: The CSV file to write.
+    :param dict(str, list(dict)) rows_by_operation: Rows from windowed_stats(), by operation name.
+    :param list(float) percentiles: Latency percentiles in the rows.
+    """
+    latency_columns = [
+        'latency_us_' + latency_distribution.percentile_key(percentile)
+        for percentile in percentiles
+    ]
+    columns = ['operation', 'start', 'seconds', 'ops', 'ops_per_sec', 'errors'] + latency_columns
+    LOG.info("Writing genny time series to %s", path)
+    with open(path, 'w') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(columns)
+        for operation, rows in sorted(rows_by_operation.items()):
+            for row in rows:
+                writer.writerow([operation] + [_format(row.get(column)) for column in columns[1:]])
+
+
+def _format(value):
+    """Keep the time series file compact: 6 significant digits, ms for timestamps, empty if
+    missing."""
+    if value is None:
+        return ''
+    if isinstance(value, float):
+        if value.is_integer():
+            return '{:.0f}'.format(value)
+        return '{:.6g}'.format(value) if abs(value) < 1e6 else '{:.3f}'.format(value)
+    return value
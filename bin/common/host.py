@@ -324,6 +324,24 @@ class Host(object):
         """
         raise NotImplementedError()
 
+    def list_dir(self, remote_path):
+        """
+        List the names of the files in a directory on the host
+        """
+        raise NotImplementedError()
+
+    def read_file(self, remote_path, offset=0):
+        """
+        Read the bytes of a file on the host, from `offset` to its current end
+        """
+        raise NotImplementedError()
+
+    def file_size(self, remote_path):
+        """
+        Return the current size in bytes of a file on the host
+        """
+        raise NotImplementedError()
+
     def checkout_repos(self, source, target, branch=None, verbose=False):
         """
         Clone repository from GitHub into target directory.
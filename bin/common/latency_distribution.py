@@ -0,0 +1,210 @@
+"""
+Latency distributions stored in perf.json.
+
+Scalar results are averaged when a test is repeated, which hides regressions in the tail. A
+distribution is stored next to the scalar metrics of a test and thread level, under the key
+`<metric>_distribution`, and is merged instead of averaged. It is a plain dict, so that it can be
+written to perf.json as is:
+
+    {
+        "count": 10004119,
+        "runs": 1,
+        "percentiles": {"min": 555, "p50": 1210, "p95": 2000, "p99": 3000, "max": 1664453},
+        "histogram": {"bounds": [1000, 2000, 3000], "counts": [2148184, 6814276, 895268]}
+    }
+
+`count` and `histogram` are optional. Histogram buckets are HdrHistogram style: counts[i] is the
+number of samples with a value <= bounds[i] and > bounds[i-1]. Empty buckets are not stored.
+
+Merging sums counts and histogram buckets. Percentiles are merged as quantiles of the mixture of
+the runs' distributions, weighted by sample count (or by number of runs when counts are unknown).
+Each run's CDF is interpolated linearly between its known percentiles.
+"""
+
+import numpy as np
+
+DISTRIBUTION_SUFFIX = '_distribution'
+
+# Percentiles derived from a histogram when the parser doesn't report them itself.
+STANDARD_PERCENTILES = (50, 90, 99, 99.9)
+
+
+def is_distribution_key(metric):
+    """Return True if `metric` is a key holding a distribution in perf.json."""
+    return metric.endswith(DISTRIBUTION_SUFFIX)
+
+
+def percentile_key(percentile):
+    """
+    Return the key used for `percentile` in a percentiles dict.
+
+    >>> percentile_key(99.9)
+    'p99.9'
+    >>> percentile_key(50.0)
+    'p50'
+    """
+    return 'p{:g}'.format(float(percentile))
+
+
+def key_to_fraction(key):
+    """
+    Return the fraction of samples at or below the percentile named `key`.
+
+    >>> key_to_fraction('p95')
+    0.95
+    >>> key_to_fraction('max')
+    1.0
+    """
+    if key == 'min':
+        return 0.0
+    if key == 'max':
+        return 1.0
+    return float(key[1:]) / 100.0
+
+
+def from_percentiles(percentiles, count=None):
+    """
+    Create a distribution from a set of percentiles.
+
+    :param dict percentiles: Values keyed by percentile: 50, '50' or 'p50', 'min', 'max'.
+    :param int count: Number of samples, if known.
+    :rtype: dict
+    """
+    distribution = {'runs': 1, 'percentiles': {}}
+    for key, value in percentiles.items():
+        if not isinstance(key, str) or key[:1].isdigit():
+            key = percentile_key(key)
+        distribution['percentiles'][key] = float(value)
+    if count is not None:
+        distribution['count'] = int(count)
+    return distribution
+
+
+def from_histogram(bounds, counts, percentiles=None):
+    """
+    Create a distribution from histogram buckets.
+
+    The standard percentiles and max are derived from the histogram, unless given in
+    `percentiles`, which take precedence since they are usually more precise than a bucket bound.
+
+    :param list(float) bounds: Upper bound of each bucket, in increasing order.
+    :param list(int) counts: Number of samples in each bucket.
+    :param dict percentiles: Percentiles reported by the benchmark itself, see from_percentiles().
+    :rtype: dict
+    """
+    # Empty buckets are dropped: the bounds remain upper bounds of the samples in each bucket.
+    buckets = [(float(bound), int(count)) for bound, count in zip(bounds, counts) if int(count)]
+    bounds = [bound for bound, _ in buckets]
+    counts = [count for _, count in buckets]
+    total = sum(counts)
+    derived = {}
+    if total:
+        for percentile in STANDARD_PERCENTILES:
+            derived[percentile_key(percentile)] = value_at_percentile(bounds, counts, percentile)
+        derived['max'] = value_at_percentile(bounds, counts, 100)
+    derived.update(from_percentiles(percentiles or {})['percentiles'])
+    distribution = from_percentiles(derived, total)
+    distribution['histogram'] = {'bounds': bounds, 'counts': counts}
+    return distribution
+
+
+def value_at_percentile(bounds, counts, percentile):
+    """
+    Return the upper bound of the bucket that contains `percentile`.
+
+    >>> value_at_percentile([1, 2, 4], [50, 40, 10], 90)
+    2.0
+    >>> value_at_percentile([1, 2, 4], [50, 40, 10], 90.1)
+    4.0
+    """
+    cumulative = np.cumsum(counts)
+    target = cumulative[-1] * percentile / 100.0
+    index = int(np.searchsorted(cumulative, target - 1e-9 * cumulative[-1], side='left'))
+    return float(bounds[min(index, len(bounds) - 1)])
+
+
+def merge(existing, new):
+    """
+    Merge two distributions of the same metric, e.g. from repeated runs of a test.
+
+    :param dict existing: The distribution already in perf.json.
+    :param dict new: The distribution to merge into it.
+    :rtype: dict A new distribution.
+    """
+    merged = {'runs': existing.get('runs', 1) + new.get('runs', 1)}
+    if 'count' in existing and 'count' in new:
+        merged['count'] = existing['count'] + new['count']
+        weights = (existing['count'], new['count'])
+    else:
+        weights = (existing.get('runs', 1), new.get('runs', 1))
+    merged['percentiles'] = _merge_percentiles((existing['percentiles'], new['percentiles']),
+                                               weights)
+    if 'histogram' in existing and 'histogram' in new:
+        merged['histogram'] = _merge_histograms(existing['histogram'], new['histogram'])
+    return merged
+
+
+def _merge_histograms(first, second):
+    bounds = np.union1d(first['bounds'], second['bounds'])
+    counts = np.zeros(len(bounds), dtype=np.int64)
+    for histogram in (first, second):
+        counts[np.searchsorted(bounds, histogram['bounds'])] += histogram['counts']
+    return {'bounds': bounds.tolist(), 'counts': counts.tolist()}
+
+
+def _merge_percentiles(percentile_sets, weights):
+    """
+    Quantiles of the weighted mixture of the distributions described by `percentile_sets`.
+
+    Distributions without percentiles are left out. If all the weights are 0, e.g. runs that
+    reported a count of 0, the distributions weigh the same.
+
+    :param list(dict) percentile_sets: Percentiles of each distribution.
+    :param list(float) weights: Weight of each distribution.
+    :rtype: dict
+    """
+    weighted = [(percentiles, weight) for percentiles, weight in zip(percentile_sets, weights)
+                if percentiles]
+    if not weighted:
+        return {}
+    percentile_sets = [percentiles for percentiles, _ in weighted]
+    weights = [float(weight) for _, weight in weighted]
+    if not sum(weights):
+        weights = [1.0] * len(weights)
+    keys = set()
+    for percentiles in percentile_sets:
+        keys.update(percentiles)
+    knots = []
+    for percentiles in percentile_sets:
+        ordered = sorted(percentiles.items(), key=lambda item: key_to_fraction(item[0]))
+        values = np.maximum.accumulate([value for _, value in ordered])
+        fractions = np.array([key_to_fraction(key) for key, _ in ordered])
+        knots.append((values, fractions))
+
+    grid = np.unique(np.concatenate([values for values, _ in knots]))
+    total_weight = sum(weights)
+    cdf = np.zeros(len(grid))
+    for (values, fractions), weight in zip(knots, weights):
+        cdf += weight / total_weight * np.interp(grid, values, fractions, left=0.0, right=1.0)
+
+    merged = {}
+    for key in keys:
+        if key == 'min':
+            merged[key] = min(p[key] for p in percentile_sets if key in p)
+        elif key == 'max':
+            merged[key] = max(p[key] for p in percentile_sets if key in p)
+        else:
+            merged[key] = _invert_cdf(grid, cdf, key_to_fraction(key))
+    return merged
+
+
+def _invert_cdf(grid, cdf, fraction):
+    """Smallest value where the piecewise linear `cdf` over `grid` reaches `fraction`."""
+    index = int(np.searchsorted(cdf, fraction - 1e-12, side='left'))
+    if index == 0:
+        return float(grid[0])
+    if index >= len(grid):
+        return float(grid[-1])
+    low, high = cdf[index - 1], cdf[index]
+    position = (fraction - low) / (high - low) if high > low else 1.0
+    return float(grid[index - 1] + position * (grid[index] - grid[index - 1]))
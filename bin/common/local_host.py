@@ -3,6 +3,7 @@ Provide abstraction over running commands on local machines, extending the base
 """
 
 from datetime import datetime
+import os
 import shutil
 import socket
 import subprocess
@@ -111,6 +112,26 @@ class LocalHost(common.host.Host):
             LOG.warning('Retrieving file locally to same path. Skipping step')
         shutil.copyfile(remote_path, local_path)
 
+    def list_dir(self, remote_path):
+        """
+        List the names of the files in a directory
+        """
+        return os.listdir(remote_path)
+
+    def read_file(self, remote_path, offset=0):
+        """
+        Read a file from `offset` to its current end
+        """
+        with open(remote_path, 'rb') as local_file:
+            local_file.seek(offset)
+            return local_file.read()
+
+    def file_size(self, remote_path):
+        """
+        Return the current size of a file in bytes
+        """
+        return os.path.getsize(remote_path)
+
     def open_reverse_tunnel(self, bind_addr, port):
         """
         Open reverse ssh tunnel
@@ -218,6 +218,37 @@ class RemoteHost(common.host.Host):
         else:
             self._retrieve_file(remote_path, local_path)
 
+    def list_dir(self, remote_path):
+        """
+        List the names of the files in a remote directory.
+
+        :param str remote_path: The remote directory.
+        :rtype: list(str)
+        """
+        return self.ftp.listdir(remote_path)
+
+    def read_file(self, remote_path, offset=0):
+        """
+        Read a remote file from `offset` to its current end, e.g. the bytes added to a file that is
+        still written to since it was last read.
+
+        :param str remote_path: The remote file.
+        :param int offset: The number of bytes to skip.
+        :rtype: bytes
+        """
+        with self.ftp.open(remote_path, 'rb') as remote_file:
+            remote_file.seek(offset)
+            return remote_file.read()
+
+    def file_size(self, remote_path):
+        """
+        Return the current size of a remote file.
+
+        :param str remote_path: The remote file.
+        :rtype: int
+        """
+        return self.ftp.stat(remote_path).st_size
+
     def close(self):
         """
         Close the ssh connection
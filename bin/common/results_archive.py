@@ -0,0 +1,168 @@
+"""
+Columnar archive of the results of a task.
+
+perf.json is a nested document, which has to be walked result by result, thread level by thread
+level to compare runs. Every finished task therefore also writes its results as a flat table, one
+row per test, thread level and metric, to perf.npz in its reports directory:
+
+    test      str    The name of the test, i.e. the "name" of a perf.json result.
+    workload  str    The "workload" of the perf.json result.
+    threads   int    The thread level. Results without a numeric thread level, e.g. the 'None' key
+                     of parsers without a configured thread count, aren't archived.
+    metric    str    ops_per_sec, ... Each percentile of a latency distribution is a metric of its
+                     own, e.g. latency_us_p99.
+    value     float
+
+plus `run`, the name of the reports directory, as a 0-d array. Strings are stored as NumPy unicode
+arrays, so the file is read without pickle. np.load() reads the arrays of an .npz file lazily, so
+only the columns that are used are read. Each run has its own file: adding a run never rewrites the
+others.
+"""
+
+import json
+import logging
+import os
+
+import numpy as np
+
+from common import latency_distribution
+
+LOG = logging.getLogger(__name__)
+
+ARCHIVE_FILE = 'perf.npz'
+COLUMNS = ('test', 'workload', 'threads', 'metric', 'value')
+DTYPES = {'test': str, 'workload': str, 'threads': np.int32, 'metric': str, 'value': np.float64}
+
+
+def scalar_metrics(thread_results):
+    """
+    Return the scalar metrics of one thread level of a perf.json result, as (metric, value) pairs.
+
+    Lists of values of each run are skipped. Each percentile of a latency distribution becomes a
+    metric of its own, named after the distribution and the percentile.
+
+    >>> sorted(scalar_metrics({'ops_per_sec': 10.0, 'ops_per_sec_values': [10.0],
+    ...                        'latency_us_distribution': {'runs': 1,
+    ...                                                    'percentiles': {'p99': 7.0}}}))
+    [('latency_us_p99', 7.0), ('ops_per_sec', 10.0)]
+
+    :param dict thread_results: The metrics of one thread level.
+    :rtype: list(tuple(str, float))
+    """
+    metrics = []
+    for metric, value in thread_results.items():
+        if latency_distribution.is_distribution_key(metric) and isinstance(value, dict):
+            name = metric[:-len(latency_distribution.DISTRIBUTION_SUFFIX)]
+            for key, percentile in value.get('percentiles', {}).items():
+                metrics.append(("{}_{}".format(name, key), percentile))
+        elif not isinstance(value, (list, dict)) and not metric.endswith("_values"):
+            metrics.append((metric, value))
+    return metrics
+
+
+def from_perf_json(perf_json):
+    """
+    Flatten the results of a perf.json document into columns.
+
+    :param dict perf_json: The contents of a perf.json file.
+    :rtype: dict(str, numpy.ndarray) One array per column in COLUMNS.
+    """
+    rows = {column: [] for column in COLUMNS}
+    for result in perf_json.get('results', []):
+        for threads, thread_results in result.get('results', {}).items():
+            try:
+                threads = int(threads)
+            except ValueError:
+                LOG.debug("Not archiving results without a thread level: %s %s", result['name'],
+                          threads)
+                continue
+            for metric, value in scalar_metrics(thread_results):
+                rows['test'].append(result['name'])
+                rows['workload'].append(result.get('workload', ''))
+                rows['threads'].append(threads)
+                rows['metric'].append(metric)
+                rows['value'].append(value)
+    return {column: np.array(values, dtype=DTYPES[column]) for column, values in rows.items()}
+
+
+def write(path, columns, run):
+    """
+    Write an archive.
+
+    :param str path: The file to write, usually <reports dir>/perf.npz.
+    :param dict columns: See from_perf_json().
+    :param str run: The name of the run, usually the name of its reports directory.
+    """
+    LOG.debug("Writing results archive %s", path)
+    # np.savez() adds .npz to names without it, write to a file object to use `path` as is.
+    with open(path, 'wb') as archive_file:
+        np.savez(archive_file, run=np.array(run), **columns)
+
+
+def write_from_perf_json(perf_json_path, reports_dir):
+    """
+    Write the archive of the perf.json file at `perf_json_path` into `reports_dir`.
+
+    :param str perf_json_path: The perf.json file of the task.
+    :param str reports_dir: The reports directory of the task. Its name is the name of the run.
+    :return: The path of the archive.
+    """
+    with open(perf_json_path) as perf_json_file:
+        perf_json = json.load(perf_json_file)
+    path = os.path.join(reports_dir, ARCHIVE_FILE)
+    write(path, from_perf_json(perf_json), run_name(reports_dir))
+    return path
+
+
+def run_name(reports_dir):
+    """
+    Return the name of the run whose results are in `reports_dir`.
+
+    `reports` is usually a symlink to the reports-<timestamp> directory of the most recent run.
+    """
+    return os.path.basename(os.path.realpath(reports_dir.rstrip(os.sep)))
+
+
+def read(path, columns=COLUMNS, tests=None, metrics=None):
+    """
+    Read an archive.
+
+    :param str path: The archive file.
+    :param list(str) columns: The columns to read.
+    :param list(str) tests: If given, only read the rows of these tests.
+    :param list(str) metrics: If given, only read the rows of these metrics.
+    :rtype: dict(str, numpy.ndarray) The requested columns, and `run`.
+    """
+    with np.load(path, allow_pickle=False) as archive:
+        # Each access to an array of the archive reads it from the file again.
+        table = {column: archive[column] for column in columns}
+        mask = None
+        for column, wanted in (('test', tests), ('metric', metrics)):
+            if wanted is not None:
+                values = table[column] if column in table else archive[column]
+                selected = np.isin(values, list(wanted))
+                mask = selected if mask is None else mask & selected
+        if mask is not None:
+            table = {column: values[mask] for column, values in table.items()}
+        table['run'] = str(archive['run'])
+    return table
+
+
+def load(paths, columns=COLUMNS, tests=None, metrics=None):
+    """
+    Read the archives of many runs into one table.
+
+    :param list(str) paths: The archive files.
+    :param list(str) columns: The columns to read. See read() for `tests` and `metrics`.
+    :rtype: dict(str, numpy.ndarray) The requested columns and a `run` column.
+    """
+    tables = [read(path, columns, tests, metrics) for path in paths]
+    table = {
+        column:
+        np.concatenate([part[column]
+                        for part in tables]) if tables else np.array([], dtype=DTYPES[column])
+        for column in columns
+    }
+    runs = [np.full(len(part[columns[0]]), part['run']) for part in tables] if columns else []
+    table['run'] = np.concatenate(runs) if runs else np.array([], dtype=str)
+    return table
@@ -2,11 +2,13 @@
 Utility function.
 """
 import configparser as ConfigParser
+import contextlib
 import os
 import errno
 import logging
 import re
 import subprocess
+import tempfile
 
 LOG = logging.getLogger(__name__)
 
@@ -25,6 +27,33 @@ def mkdir_p(path):
             raise
 
 
+@contextlib.contextmanager
+def atomic_write(path, mode='w', suffix=''):
+    """
+    Write the file at `path` through a temporary file in the same directory, which replaces it once
+    the block is done, so that a concurrent reader never sees a partial file. If the block or the
+    replace fails, the temporary file is removed and the exception raised again.
+
+        with atomic_write(path, 'wb') as file_handle:
+            np.savez(file_handle, ...)
+
+    :param str path: The file to write.
+    :param str mode: The mode of the temporary file, 'w' or 'wb'.
+    :param str suffix: The suffix of the name of the temporary file.
+    """
+    handle, temporary = tempfile.mkstemp(suffix=suffix, dir=os.path.dirname(path) or '.')
+    try:
+        with os.fdopen(handle, mode) as file_handle:
+            yield file_handle
+        os.replace(temporary, path)
+    except BaseException:
+        try:
+            os.remove(temporary)
+        except OSError:
+            pass
+        raise
+
+
 def touch(filename):
     """
     Create an empty file (like shell touch command). It will not
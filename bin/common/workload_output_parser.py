@@ -3,15 +3,20 @@ Parser classes for parsing test output into a perf.json file. One parser for eac
 
 See SUPPORTED_TYPES below for a list of types you can use.
 """
+# pylint: disable=too-many-lines
 
 import csv
 import json
 import logging
+import mmap
 import os
 import re
 
 from nose.tools import nottest
 
+from common import genny_metrics
+from common import latency_distribution
+
 LOG = logging.getLogger(__name__)
 
 
@@ -77,40 +82,69 @@ class Results(object):
         assert isinstance(name, str)
         assert isinstance(threads, str)
         metric_type_values = metric_type + '_values'
-        existing_entry = self._find_existing_result(name)
-        if existing_entry:
-            existing_thread = threads in existing_entry['results']
-            if existing_thread:
-                existing_metric = metric_type in existing_entry['results'][threads]
-                if existing_metric:
-                    existing_entry['results'][threads][metric_type_values].append(result)
-                    values = existing_entry['results'][threads][metric_type_values]
-                    existing_entry['results'][threads][metric_type] = sum(values) / \
-                                                                      float(len(values))
-                else:
-                    existing_entry['results'][threads][metric_type] = result
-                    existing_entry['results'][threads][metric_type_values] = [result]
-            else:
-                existing_entry['results'][threads] = {
-                    metric_type: result,
-                    metric_type_values: [result]
-                }
+        thread_results = self._thread_results(test_type, start, end, name, threads)
+        if metric_type in thread_results:
+            thread_results[metric_type_values].append(result)
+            values = thread_results[metric_type_values]
+            thread_results[metric_type] = sum(values) / float(len(values))
+        else:
+            thread_results[metric_type] = result
+            thread_results[metric_type_values] = [result]
+
+    # pylint: disable=too-many-arguments
+    def add_distribution(self,
+                         test_type,
+                         start,
+                         end,
+                         name,
+                         distribution,
+                         threads="1",
+                         metric_type="latency_us"):
+        """
+        Merge a latency distribution into (potentially) existing perf_json structure.
 
+        The distribution is stored as [metric_type]_distribution next to the scalar results for
+        name+threads. If one already exists, for example from a previous run of the same test, the
+        two are merged rather than averaged. See common/latency_distribution.py for the format.
+
+        :param str name: Unique name for this test result.
+        :param dict distribution: See latency_distribution.from_percentiles() and from_histogram().
+                                  Values are positive, unlike latencies passed to add_result().
+        :param str threads: The number of client threads the test (name) was run with.
+        :param str metric_type: Name of the metric, including its unit.
+        """
+        assert isinstance(name, str)
+        assert isinstance(threads, str)
+        key = metric_type + latency_distribution.DISTRIBUTION_SUFFIX
+        thread_results = self._thread_results(test_type, start, end, name, threads)
+        if key in thread_results:
+            thread_results[key] = latency_distribution.merge(thread_results[key], distribution)
         else:
-            new_entry = {
-                "workload": test_type,
-                "name": name,
-                "start": start,
-                "end": end,
-                "results": {
-                    threads: {
-                        metric_type: result,
-                        metric_type_values: [result]
-                    }
-                }
-            } # yapf: disable
-            self.results.append(new_entry)
-            LOG.debug(new_entry)
+            thread_results[key] = distribution
+
+    # pylint: disable=too-many-arguments
+    def _thread_results(self, test_type, start, end, name, threads):
+        """
+        Return the dict holding the results for name+threads, adding it if it doesn't exist yet.
+        """
+        existing_entry = self._find_existing_result(name)
+        if existing_entry:
+            if threads not in existing_entry['results']:
+                existing_entry['results'][threads] = {}
+            return existing_entry['results'][threads]
+
+        new_entry = {
+            "workload": test_type,
+            "name": name,
+            "start": start,
+            "end": end,
+            "results": {
+                threads: {}
+            }
+        } # yapf: disable
+        self.results.append(new_entry)
+        LOG.debug(new_entry)
+        return new_entry['results'][threads]
 
     def _find_existing_result(self, name):
         """
@@ -134,6 +168,41 @@ class Results(object):
             json.dump(to_serialize, file_handle, indent=4, separators=[',', ':'], sort_keys=True)
 
 
+TIMER_START_LINE_BEGIN = "Test started at (seconds):"
+TIMER_END_LINE_BEGIN = "Test ended at (seconds):"
+
+
+def _mapped_lines(buf, line_begin):
+    """
+    Yield (start, end) byte offsets of each line in `buf` that starts with `line_begin`.
+
+    :param mmap.mmap buf: The memory mapped file.
+    :param bytes line_begin: Line prefix to search for.
+    """
+    if buf[:len(line_begin)] == line_begin:
+        yield 0, _line_end(buf, 0)
+    needle = b"\n" + line_begin
+    at = buf.find(needle)
+    while at >= 0:
+        yield at + 1, _line_end(buf, at + 1)
+        at = buf.find(needle, at + 1)
+
+
+def _line_end(buf, start):
+    """Offset just past the newline ending the line at `start`, or the end of `buf`."""
+    end = buf.find(b"\n", start)
+    return len(buf) if end < 0 else end + 1
+
+
+def _line_start(buf, at):
+    """Offset of the first byte of the line containing offset `at`."""
+    return buf.rfind(b"\n", 0, at) + 1
+
+
+def _decode(buf, start, end):
+    return buf[start:end].decode("utf-8", errors="replace").replace("\r\n", "\n")
+
+
 class ResultParser(object):
     """Parent class for all parser types"""
 
@@ -171,6 +240,79 @@ class ResultParser(object):
                 self._parse_timer(line)
                 yield line
 
+    def _map_input_log(self):
+        """
+        Memory-map self.input_log for reading.
+
+        :return: An mmap.mmap (close it when done), or None if the file is empty.
+        """
+        if self.input_log is None:
+            raise NotImplementedError("self.input_log must be specified by child class.")
+
+        LOG.debug("Trying to map %s", self.input_log)
+        with open(self.input_log, "rb") as file_handle:
+            if os.fstat(file_handle.fileno()).st_size == 0:
+                return None
+            return mmap.mmap(file_handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _find_timer_lines(self, buf):
+        """Feed the timer lines in `buf`, if any, to self._parse_timer()."""
+        if self.timer and self.timer.get('start') and self.timer.get('end'):
+            return
+        for line_begin in (TIMER_START_LINE_BEGIN, TIMER_END_LINE_BEGIN):
+            for start, end in _mapped_lines(buf, line_begin.encode()):
+                self._parse_timer(_decode(buf, start, end))
+
+    def find_input_lines(self, line_begins):
+        """
+        Return the lines of self.input_log that start with any of `line_begins`, in file order.
+
+        Use this instead of load_input_log() when only a few marker lines of a possibly huge log
+        are needed. The file is memory-mapped and searched with bytes.find(), so only the matching
+        lines are ever decoded.
+
+        :param list(str) line_begins: Line prefixes to search for.
+        :rtype: list(str) Matching lines, including their newline.
+        """
+        buf = self._map_input_log()
+        if buf is None:
+            return []
+        try:
+            self._find_timer_lines(buf)
+            offsets = set()
+            for line_begin in line_begins:
+                offsets.update(_mapped_lines(buf, line_begin.encode()))
+            return [_decode(buf, start, end) for start, end in sorted(offsets)]
+        finally:
+            buf.close()
+
+    def find_input_block(self, start_marker, end_marker):
+        """
+        Return the text between the last line containing `start_marker` and the next line after it
+        that contains `end_marker`, both excluded.
+
+        The block is located by scanning backwards from the end of self.input_log, which is where
+        benchmarks print their summaries.
+
+        :param str start_marker: Substring of the line preceding the block.
+        :param str end_marker: Substring of the line following the block.
+        :rtype: str The lines in the block, or "" if there is no such block.
+        """
+        buf = self._map_input_log()
+        if buf is None:
+            return ""
+        try:
+            self._find_timer_lines(buf)
+            at = buf.rfind(start_marker.encode())
+            if at < 0:
+                return ""
+            block_start = _line_end(buf, at)
+            at = buf.find(end_marker.encode(), block_start)
+            block_end = len(buf) if at < 0 else _line_start(buf, at)
+            return _decode(buf, block_start, block_end)
+        finally:
+            buf.close()
+
     def parse_and_save(self):
         """Parse self.input_log and merge it into self.perf_json.
 
@@ -187,6 +329,13 @@ class ResultParser(object):
         self.results.add_result(self.test_type, self.timer['start'], self.timer['end'], name,
                                 result, threads, metric_type)
 
+    def add_distribution(self, name, distribution, threads="1", metric_type="latency_us"):
+        """
+        For parameters/returns, see :method: `Results.add_distribution`
+        """
+        self.results.add_distribution(self.test_type, self.timer['start'], self.timer['end'], name,
+                                      distribution, threads, metric_type)
+
     def parse(self):
         """
         Common code to call _parse and handle errors and sanity checking. The sub class needs to
@@ -215,19 +364,17 @@ class ResultParser(object):
         raise NotImplementedError()
 
     def _parse_timer(self, line):
-        start_line_begin = "Test started at (seconds):"
-        end_line_begin = "Test ended at (seconds):"
         if self.timer is None:
             self.timer = {'start': None, 'end': None}
 
         if not self.timer['start']:
-            if line.startswith(start_line_begin):
-                self.timer['start'] = float(line[start_line_begin:])
+            if line.startswith(TIMER_START_LINE_BEGIN):
+                self.timer['start'] = float(line[len(TIMER_START_LINE_BEGIN):])
                 LOG.debug("Found start time")
 
         if not self.timer['end']:
-            if line.startswith(end_line_begin):
-                self.timer['end'] = float(line[end_line_begin:])
+            if line.startswith(TIMER_END_LINE_BEGIN):
+                self.timer['end'] = float(line[len(TIMER_END_LINE_BEGIN):])
                 LOG.debug("Found end time")
 
 
@@ -239,6 +386,16 @@ class GennyResultsParser(ResultParser):
     """
     Genny's output doesn't require a parser so this just merges
     genny's output to the configured perf.json path.
+
+    Other output_files that are genny FTDC metrics files, or directories of them, are read as time
+    series, see common/genny_metrics.py. For each operation this adds the latency distribution and
+    the lowest and highest throughput over all windows to perf.json, and writes the windowed
+    throughput and latency percentiles to a CSV file in the test's reports directory. Configured
+    by test_control.genny.timeseries:
+
+        window_seconds: 10
+        percentiles: [50, 95, 99]
+        output_file: genny-timeseries.csv
     """
     def __init__(self, test, config, timer):
         """
@@ -253,17 +410,63 @@ class GennyResultsParser(ResultParser):
         if not output_files:
             raise InvalidConfigurationException(
                 'Need single output_files entry. Got {}'.format(output_files))
-        if output_files and len(output_files) > 1:
-            LOG.info("Got files %s but will only report on first one", output_files)
         self.genny_results_path = os.path.join(input_dir, os.path.basename(output_files[0]))
+        self.input_dir = input_dir
+        self.metrics_paths = [
+            os.path.join(input_dir, os.path.basename(output_file))
+            for output_file in output_files[1:]
+        ]
+        if self.metrics_paths:
+            LOG.info("Reading %s as genny time series", self.metrics_paths)
+        timeseries = config['test_control'].get('genny', {}).get('timeseries', {})
+        self.window_seconds = timeseries.get('window_seconds', 10)
+        self.percentiles = list(timeseries.get('percentiles', [50, 95, 99]))
+        self.timeseries_file = timeseries.get('output_file', 'genny-timeseries.csv')
 
     def _parse(self):
+        self._parse_legacy_report()
+        self._parse_timeseries()
+
+    def _parse_legacy_report(self):
         with open(self.genny_results_path) as file_handle:
             for result in json.load(file_handle)['results']:
                 name = result['name']
                 threads = list(result['results'].keys())[0]
-                result = list(result['results'].values())[0]['ops_per_sec']
-                self.add_result(name, result, threads)
+                thread_results = list(result['results'].values())[0]
+                self.add_result(name, thread_results['ops_per_sec'], threads)
+                # Genny may also report latency distributions in the same format as perf.json.
+                for metric, value in thread_results.items():
+                    if latency_distribution.is_distribution_key(metric) and isinstance(value, dict):
+                        self.add_distribution(
+                            name, value, threads,
+                            metric[:-len(latency_distribution.DISTRIBUTION_SUFFIX)])
+
+    def _parse_timeseries(self):
+        rows_by_operation = {}
+        for metrics_path in self.metrics_paths:
+            for path in genny_metrics.find_metrics_files(metrics_path):
+                name = genny_metrics.operation_name(path)
+                LOG.debug("Reading genny time series %s", path)
+                samples = genny_metrics.read_samples(path)
+                rows = genny_metrics.windowed_stats(samples, self.window_seconds, self.percentiles)
+                if not rows:
+                    continue
+                rows_by_operation[name] = rows
+                workers = samples[genny_metrics.WORKERS]
+                threads = str(int(workers.max()) if workers.max() > 0 else 1)
+
+                # The last window is usually cut short, so leave it out unless it's the only one.
+                full_windows = [row for row in rows if row['seconds'] == self.window_seconds]
+                throughputs = [row['ops_per_sec'] for row in full_windows or rows]
+                self.add_result(name, min(throughputs), threads, "min_window_ops_per_sec")
+                self.add_result(name, max(throughputs), threads, "max_window_ops_per_sec")
+                distribution = genny_metrics.latency_summary(samples, self.percentiles)
+                if distribution:
+                    self.add_distribution(name, distribution, threads, "latency_us")
+
+        if rows_by_operation:
+            genny_metrics.write_timeseries(os.path.join(self.input_dir, self.timeseries_file),
+                                           rows_by_operation, self.percentiles)
 
 
 class TPCCResultParser(ResultParser):
@@ -329,6 +532,27 @@ class LinkbenchResultParser(ResultParser):
 
             self.add_result(row['op'], result, str(row['threads']))
 
+            distribution = self._latency_distribution(row)
+            if distribution:
+                self.add_distribution(row['op'], distribution, str(row['threads']), "latency_us")
+
+    @staticmethod
+    def _latency_distribution(row):
+        """
+        Linkbench reports each percentile as the bucket it falls in, p50_low to p50_high, in
+        microseconds. Like HdrHistogram, use the highest value of the bucket, but no more than max.
+        """
+        percentiles = {}
+        for column, value in row.items():
+            if column.startswith('p') and column.endswith('_high') and value:
+                percentiles[float(column[1:-len('_high')])] = float(value)
+        if row.get('max'):
+            percentiles = {key: min(value, float(row['max'])) for key, value in percentiles.items()}
+            percentiles['max'] = float(row['max'])
+        if not percentiles:
+            return None
+        return latency_distribution.from_percentiles(percentiles, row.get('count') or None)
+
 
 class MongoShellParser(ResultParser):
     """A ResultParser of mongoshell tests"""
@@ -345,11 +569,8 @@ class MongoShellParser(ResultParser):
         Example line:
         ">>> contended_update : 18154.473077825252 64"
         """
-        for line in self.load_input_log():
-            # This is the magic marker for results emitted by mongoshell kind of test
-            if not line.startswith(">>> "):
-                continue
-
+        # This is the magic marker for results emitted by mongoshell kind of test
+        for line in self.find_input_lines([">>> "]):
             parts = line.rstrip().split(" ")
             name = str(parts[1])
             result = float(parts[3])
@@ -357,6 +578,9 @@ class MongoShellParser(ResultParser):
             self.add_result(name, result, threads)
 
 
+YCSB_PERCENTILE_FIELD = re.compile(r"^([0-9.]+)thPercentileLatency\(us\)$")
+
+
 class YcsbParser(ResultParser):
     """A ResultParser of ycsb tests (aka industry benchmarks)"""
     def __init__(self, test, config, timer):
@@ -375,7 +599,8 @@ class YcsbParser(ResultParser):
             -P workloads/workloadEvergreen_50read50update -threads 64 -t
         [OVERALL], Throughput(ops/sec), 47494.99521487923
         """
-        for line in self.load_input_log():
+        latencies = {}
+        for line in self.find_input_lines(["Command line:", "["]):
             if line.startswith("Command line:"):
                 parts = line.rstrip().split(" ")
                 for index, part in enumerate(parts):
@@ -386,6 +611,8 @@ class YcsbParser(ResultParser):
                 result = float(parts[2])
                 name = self.test_id
                 self.add_result(name, result, self.threads, "ops_per_sec")
+            else:
+                self._collect_latency(line, latencies)
 
             if line.startswith("[READ], 95thPercentileLatency(us), "):
                 parts = line.rstrip().split(", ")
@@ -405,6 +632,62 @@ class YcsbParser(ResultParser):
                 name = self.test_id
                 self.add_result(name, result, self.threads, "average_read_latency_us")
 
+        for operation in sorted(latencies):
+            distribution = self._latency_distribution(latencies[operation])
+            if distribution:
+                self.add_distribution(self.test_id, distribution, self.threads,
+                                      operation.lower() + "_latency_us")
+
+    @staticmethod
+    def _collect_latency(line, latencies):
+        """
+        Collect the latency summary and histogram lines of each operation type.
+
+        Example lines:
+        [READ], Operations, 9995881
+        [READ], 95thPercentileLatency(us), 2100.937896666666
+        [READ], 0, 2148184
+        [READ], >1000, 37
+
+        Histogram bucket N counts the operations that took N to N+1 milliseconds.
+        """
+        parts = line.rstrip().split(", ")
+        if len(parts) != 3 or not parts[0].startswith("[") or not parts[0].endswith("]"):
+            return
+        operation = parts[0][1:-1]
+        if operation in ("OVERALL", "CLEANUP"):
+            return
+        stats = latencies.setdefault(operation, {'percentiles': {}, 'histogram': []})
+        field, value = parts[1], parts[2]
+        percentile = YCSB_PERCENTILE_FIELD.match(field)
+        if field == "Operations":
+            stats['count'] = int(value)
+        elif field == "MinLatency(us)":
+            stats['percentiles']['min'] = float(value)
+        elif field == "MaxLatency(us)":
+            stats['percentiles']['max'] = float(value)
+        elif percentile:
+            stats['percentiles'][float(percentile.group(1))] = float(value)
+        elif field.isdigit():
+            stats['histogram'].append(((int(field) + 1) * 1000.0, int(value)))
+        elif field.startswith(">") and field[1:].isdigit():
+            stats['overflow'] = int(value)
+
+    @staticmethod
+    def _latency_distribution(stats):
+        """Turn what _collect_latency() found for one operation into a distribution, or None."""
+        if stats['histogram']:
+            stats['histogram'].sort()
+            bounds = [bound for bound, _ in stats['histogram']]
+            counts = [count for _, count in stats['histogram']]
+            if stats.get('overflow'):
+                bounds.append(max(stats['percentiles'].get('max', 0), bounds[-1] + 1000.0))
+                counts.append(stats['overflow'])
+            return latency_distribution.from_histogram(bounds, counts, stats['percentiles'])
+        if stats['percentiles']:
+            return latency_distribution.from_percentiles(stats['percentiles'], stats.get('count'))
+        return None
+
 
 class SysbenchResultParser(ResultParser):
     """A ResultParser for sysbench tests"""
@@ -419,27 +702,12 @@ class SysbenchResultParser(ResultParser):
         """
         We use our own sysbench report hook that prints json inside a start and end delimiter
         """
-        read_options = False
-        read_results = False
-        options_str = ""
-        results_str = ""
-
-        for line in self.load_input_log():
-            if "--- sysbench json options start ---" in line:
-                read_options = True
-            elif "--- sysbench json options end ---" in line:
-                read_options = False
-            elif read_options:
-                assert not read_results
-                options_str += line
-
-            elif "--- sysbench json results start ---" in line:
-                read_results = True
-            elif "--- sysbench json results end ---" in line:
-                read_results = False
-            elif read_results:
-                assert not read_options
-                results_str += line
+        options_str = self.find_input_block("--- sysbench json options start ---",
+                                            "--- sysbench json options end ---")
+        results_str = self.find_input_block("--- sysbench json results start ---",
+                                            "--- sysbench json results end ---")
+        stats_str = self.find_input_block("--- sysbench json stats start ---",
+                                          "--- sysbench json stats end ---")
 
         options = json.loads(options_str)
         self.threads = options['threads']
@@ -451,6 +719,25 @@ class SysbenchResultParser(ResultParser):
             self.add_result(self.test_id + "_" + name, sign * float(results[name]),
                             str(self.threads))
 
+        if stats_str:
+            self._add_latency_distribution(json.loads(stats_str), options.get('percentile'))
+
+    def _add_latency_distribution(self, stats, percentile):
+        """
+        Add the latency distribution from the sysbench stats block. Latencies there are in seconds,
+        latency_pct is the latency at the --percentile option.
+        """
+        percentiles = {}
+        for key, stat in (('min', 'latency_min'), ('max', 'latency_max'), (percentile,
+                                                                           'latency_pct')):
+            if key is not None and stat in stats:
+                percentiles[key] = stats[stat] * 1000.0
+        if percentiles:
+            self.add_distribution(
+                self.test_id, latency_distribution.from_percentiles(percentiles,
+                                                                    stats.get('events')),
+                str(self.threads), "latency_ms")
+
 
 class FioParser(ResultParser):
     """A ResultParser of fio results in fio.json"""
@@ -541,6 +828,104 @@ class IperfParser(ResultParser):
         self.add_result("NetworkBandwidth", result)
 
 
+class _GenericPattern(object):
+    """
+    One entry of an options: or results: section of analysis.generic_parser.patterns.
+
+    The pattern is prepared once, so that matching a line is just a few str.find() calls.
+    """
+    def __init__(self, name, pattern):
+        self.name = name
+        self.line_begin = pattern.get("line_begin")
+        self.begin_marker = pattern.get("begin_marker", self.line_begin)
+        assert self.begin_marker is not None
+        if not self.begin_marker:
+            raise InvalidConfigurationException("Empty begin_marker for {}".format(name))
+        # A pattern without an end_marker never matches anything.
+        self.end_marker = pattern.get("end_marker") or None
+        # Optionally, the value is also a percentile of a latency distribution.
+        self.distribution = pattern.get("distribution")
+        self.percentile = pattern.get("percentile")
+
+    def match(self, line):
+        """
+        Return the value found between begin_marker and end_marker, or None.
+
+        The value is the text after the first begin_marker, up to the first end_marker, where the
+        end_marker must come before a possible second begin_marker.
+
+        :param str line: A line with trailing whitespace already stripped.
+        """
+        if self.line_begin is not None and not line.startswith(self.line_begin):
+            return None
+        begin = line.find(self.begin_marker)
+        if begin < 0 or self.end_marker is None:
+            return None
+        begin += len(self.begin_marker)
+        next_begin = line.find(self.begin_marker, begin)
+        segment_end = next_begin if next_begin >= 0 else len(line)
+        end = line.find(self.end_marker, begin, segment_end)
+        if end < 0:
+            return None
+        return line[begin:end]
+
+
+class _GenericSection(object):
+    """
+    The options or results half of a generic_parser pattern: start and end marker lines plus the
+    patterns to match while inside the section.
+    """
+    def __init__(self, start, end, patterns):
+        self.active = not start
+        self.start = self._as_list(start)
+        self.end = self._as_list(end)
+        self.start_found = 0
+        self.end_found = 0
+        self.patterns = [_GenericPattern(name, pattern) for name, pattern in patterns.items()]
+        # Every match needs its begin_marker somewhere in the line. One regex search over all the
+        # markers rejects most lines without looking at the patterns one by one.
+        self.candidate = None
+        if self.patterns:
+            self.candidate = re.compile('|'.join(
+                re.escape(pattern.begin_marker) for pattern in self.patterns))
+
+    @staticmethod
+    def _as_list(markers):
+        if isinstance(markers, list):
+            return markers
+        return [] if markers is None else [markers]
+
+    def feed(self, line):
+        """
+        Advance the start/end state machine with `line` and return the matches within it.
+
+        :param str line: The next line of input, as read from the file.
+        :rtype: list(tuple(str, str)) (name, value) for each pattern that matched.
+        """
+        if not self.active and self.start and self.start[self.start_found] in line:
+            self.start_found += 1
+            if len(self.start) == self.start_found:
+                self.active = True
+                LOG.debug("Section start: %s", line.rstrip())
+                self.end_found = 0
+        elif self.active and self.end and self.end[self.end_found] in line:
+            self.end_found += 1
+            if len(self.end) == self.end_found:
+                self.active = False
+                LOG.debug("Section end: %s", line.rstrip())
+                self.start_found = 0
+
+        if not self.active or self.candidate is None or not self.candidate.search(line):
+            return []
+        line = line.rstrip()
+        matches = []
+        for pattern in self.patterns:
+            value = pattern.match(line)
+            if value is not None:
+                matches.append((pattern.name, value))
+        return matches
+
+
 class GenericResultParser(ResultParser):
     """ResultParser to end all result parsers? Use configuration to express where to find results"""
     def __init__(self, test, config, timer):
@@ -556,10 +941,6 @@ class GenericResultParser(ResultParser):
         LOG.debug(self.input_log)
         LOG.debug(self.patterns)
 
-    # pylint: disable=too-many-nested-blocks
-    # pylint: disable=too-many-statements
-    # pylint: disable=too-many-branches
-    # pylint: disable=too-many-locals
     def _parse(self):
         """
         Parse results
@@ -580,125 +961,62 @@ class GenericResultParser(ResultParser):
                 line_begin: ***
                 begin_marker: ***
                 end_marker: " "
+                # Optional: metric1 is also the given percentile (50, 99.9, min, max) of the
+                # latency distribution called latency_ms.
+                distribution: latency_ms
+                percentile: 50
+
+        The input log is read once. All options and all metrics are matched against each line in
+        the same pass. Options are applied before any results are added, so the last threads value
+        in the file is used for every metric, and each metric's values are added in file order.
+        """
+        options = _GenericSection(self.patterns.get("options_start", []),
+                                  self.patterns.get("options_end", []),
+                                  self.patterns.get("options") or {})
+        results = _GenericSection(self.patterns.get("results_start", []),
+                                  self.patterns.get("results_end", []),
+                                  self.patterns.get("results") or {})
+        option_values = {pattern.name: [] for pattern in options.patterns}
+        metric_values = {pattern.name: [] for pattern in results.patterns}
 
+        for line in self.load_input_log():
+            for option_name, value in options.feed(line):
+                option_values[option_name].append(value)
+            for metric_name, value in results.feed(line):
+                metric_values[metric_name].append(value)
+
+        for option_name, values in option_values.items():
+            for value in values:
+                if option_name == "threads":
+                    self.threads = value
+                else:
+                    LOG.info("Unused option: %s=%s", option_name, value)
+
+        for metric_name, values in metric_values.items():
+            for value in values:
+                self.add_result(self.test_id, float(value), str(self.threads), metric_name)
+
+        self._add_distributions(results.patterns, metric_values)
+
+    def _add_distributions(self, patterns, metric_values):
+        """
+        Add the distributions some of the metrics are percentiles of. The Nth value of each
+        percentile of a distribution together make up its Nth run.
         """
-        options_start = self.patterns.get("options_start", [])
-        read_options = not options_start
-        if not isinstance(options_start, list):
-            options_start = [] if options_start is None else [options_start]
-        options_end = self.patterns.get("options_end", [])
-        if not isinstance(options_end, list):
-            options_end = [] if options_end is None else [options_end]
-
-        results_start = self.patterns.get("results_start", [])
-        read_results = not results_start
-        if not isinstance(results_start, list):
-            results_start = [] if results_start is None else [results_start]
-        results_end = self.patterns.get("results_end", [])
-        if not isinstance(results_end, list):
-            results_end = [] if results_end is None else [results_end]
-
-        LOG.debug(options_start)
-        LOG.debug(options_end)
-        for option_name, pattern in self.patterns.get("options", {}).items():
-            read_options = not options_start
-            options_start_lines_found = 0
-            options_end_lines_found = 0
-            for line in self.load_input_log():
-                if not read_options and options_start and options_start[
-                        options_start_lines_found] in line:
-                    options_start_lines_found += 1
-                    if len(options_start) > options_start_lines_found:
-                        pass
-                    elif len(options_start) == options_start_lines_found:
-                        read_options = True
-                        LOG.debug("read_options True")
-                        options_end_lines_found = 0
-                    elif len(options_start) < options_start_lines_found:
-                        assert False, "not possible"
-
-                elif read_options and options_end and options_end[options_end_lines_found] in line:
-                    options_end_lines_found += 1
-                    if len(options_end) > options_end_lines_found:
-                        pass
-                    elif len(options_end) == options_end_lines_found:
-                        read_options = False
-                        LOG.debug("read_options False")
-                        options_start_lines_found = 0
-                    elif len(options_end) < options_end_lines_found:
-                        assert False, "not possible"
-
-                if read_options:
-                    line_begin = pattern.get("line_begin")
-                    if line_begin is None or line.startswith(line_begin):
-                        begin_marker = pattern.get("begin_marker", line_begin)
-                        assert begin_marker is not None
-                        end_marker = pattern["end_marker"] if "end_marker" in pattern else None
-
-                        parts = line.rstrip().split(begin_marker)
-                        if len(parts) > 1:
-                            parts2 = parts[1].split(end_marker) if end_marker else [parts[1]]
-                            if len(parts2) > 1:
-                                value = parts2[0]
-                                if option_name == "threads":
-                                    self.threads = value
-                                else:
-                                    LOG.info("Unused option: %s=%s", option_name, value)
-
-        LOG.debug(results_start)
-        LOG.debug(results_end)
-        for metric_name, pattern in self.patterns.get("results", {}).items():
-            read_results = not results_start
-            results_start_lines_found = 0
-            results_end_lines_found = 0
-            for line in self.load_input_log():
-                if not read_results and results_start and results_start[
-                        results_start_lines_found] in line:
-                    print(line[:-1])
-                    results_start_lines_found += 1
-                    if len(results_start) > results_start_lines_found:
-                        pass
-                    elif len(results_start) == results_start_lines_found:
-                        read_results = True
-                        LOG.debug(
-                            "read_results TRUE .................................................")
-                        results_end_lines_found = 0
-                    elif len(results_start) < results_start_lines_found:
-                        assert False, "not possible"
-
-                elif read_results and results_end and results_end[results_end_lines_found] in line:
-                    results_end_lines_found += 1
-                    if len(results_end) > results_end_lines_found:
-                        pass
-                    elif len(results_end) == results_end_lines_found:
-                        read_results = False
-                        LOG.debug(
-                            "read_results FALSE..................................................")
-                        results_start_lines_found = 0
-                    elif len(results_end) < results_end_lines_found:
-                        assert False, "not possible"
-
-                if read_results:
-                    line_begin = pattern.get("line_begin")
-
-                    if line_begin is None or line.startswith(line_begin):
-                        begin_marker = pattern.get("begin_marker", line_begin)
-                        assert begin_marker is not None
-                        end_marker = pattern["end_marker"] if "end_marker" in pattern else None
-                        parts = line.rstrip().split(begin_marker)
-                        if len(parts) > 1:
-                            parts2 = parts[1].split(end_marker) if end_marker else [parts[1]]
-                            if len(parts2) > 1:
-                                value = parts2[0]
-                                print(line)
-                                self.add_result(self.test_id, float(value), str(self.threads),
-                                                metric_name)
-
-            #
-            # LOG.debug("read_options=%s options_start_lines_found=%s options_end_lines_found=%s",
-            #             read_options, options_start_lines_found, options_end_lines_found)
-            # LOG.debug("read_results=%s results_start_lines_found=%s results_end_lines_found=%s",
-            #            read_results, results_start_lines_found, results_end_lines_found)
+        distributions = {}
+        for pattern in patterns:
+            if pattern.distribution is None or pattern.percentile is None:
+                continue
+            runs = distributions.setdefault(pattern.distribution, [])
+            for index, value in enumerate(metric_values[pattern.name]):
+                if index == len(runs):
+                    runs.append({})
+                runs[index][pattern.percentile] = float(value)
+        for distribution_name, runs in distributions.items():
+            for percentiles in runs:
+                self.add_distribution(self.test_id,
+                                      latency_distribution.from_percentiles(percentiles),
+                                      str(self.threads), distribution_name)
 
 
 # Map test['type'] to a ResultParser class.
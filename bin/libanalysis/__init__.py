@@ -9,7 +9,18 @@ from .dummy_plugin import dummy
 # pylint: disable=redefined-builtin, redefined-outer-name
 from .exit_status import exit
 from .ftdc_analysis import ftdc
+from .ftdc_timeseries_export import ftdc_timeseries
 from .log_analysis import log
+from .slow_query_analysis import slow_query
 from .ycsb_throughput_analysis import ycsb_throughput
 from .compare_multiple_reports import compare_reports
+from .change_point_detection import change_points
+from .noise_analysis import noise
 from .csv import json2csv
+
+# The plugins that only read the reports, and add their own results, and so can run concurrently in
+# worker processes. See analysis.py.
+INDEPENDENT_CHECKS = frozenset([
+    'change_points', 'compare_reports', 'core', 'db_correctness', 'dummy', 'exit', 'ftdc',
+    'ftdc_timeseries', 'json2csv', 'log', 'noise', 'slow_query', 'ycsb_throughput'
+])
@@ -0,0 +1,313 @@
+"""
+analysis.py plugin: Detect change points in the history of each metric.
+
+compare_reports puts the reports-* directories of the runs side by side, and the other plugins only
+check one run against fixed thresholds. This plugin reads the results of all the runs, from the
+perf.npz results archive of each run, or its perf.json, and looks for the runs where each series,
+i.e. each test, thread level and metric, changed.
+
+Change points are found with E-divisive means, as in Matteson and James, "A Nonparametric Approach
+for Multiple Change Point Analysis of Multivariate Data", 2014. The series is split where the
+energy distance between the values before and after the split, see q_values(), is the largest.
+The split is kept if a permutation test finds it significant: the values of each segment are
+shuffled, and the probability of a split at least as large in the shuffled series is estimated.
+Then the segments are split again, until a split isn't significant. The permutations of a segment
+are evaluated together, as arrays of shape (permutations, length, length), and a test stops as
+soon as it can't be significant any more.
+
+The change points, with the probability that they are real (1 - the p-value of the permutation
+test), are added to results.json, and written to change_points.csv in the reports directory.
+"""
+
+import collections
+import csv
+import glob
+import json
+import os
+
+import numpy as np
+import structlog
+
+from common import results_archive
+
+LOGGER = structlog.get_logger(__name__)
+
+COLUMNS = ('test', 'threads', 'metric', 'value')
+CSV_FILE = 'change_points.csv'
+CSV_COLUMNS = ('test', 'threads', 'metric', 'run', 'previous_run', 'index', 'before', 'after',
+               'change_percent', 'q', 'p_value', 'confidence')
+# The permutations of a segment are evaluated in batches of at most this many distances.
+MAX_BATCH_ELEMENTS = 1 << 22
+# The permutation tests stop early, after a multiple of this many permutations, when they can't be
+# significant any more.
+PERMUTATION_STEP = 20
+
+ChangePoint = collections.namedtuple('ChangePoint', ['index', 'q', 'p_value'])
+
+
+def change_points(config, results):  # pylint: disable=too-many-locals
+    """
+    analysis.py plugin: Detect change points in the history of each test, thread level and metric.
+
+    :param ConfigDict config: The global config.
+    :param ResultsFile results: Object to add results to.
+    """
+    detection_config = config['analysis'].get('change_points', {})
+    history = detection_config.get('history', ['reports-*'])
+    runs, series = load_history(history)
+    LOGGER.info("Detecting change points.", runs=len(runs), series=len(series))
+    random = np.random.RandomState(detection_config.get('seed', 1))
+    detected = []
+    for (test, threads, metric), (indexes, values) in sorted(series.items()):
+        points = e_divisive(values,
+                            permutations=detection_config.get('permutations', 99),
+                            pvalue=detection_config.get('pvalue', 0.05),
+                            min_size=detection_config.get('min_size', 3),
+                            random=random)
+        for row in describe(points, values):
+            row.update(test=test,
+                       threads=threads,
+                       metric=metric,
+                       run=runs[indexes[row['index']]],
+                       previous_run=runs[indexes[row['index'] - 1]])
+            detected.append(row)
+
+    reports = config['test_control']['reports_dir_basename']
+    csv_path = os.path.join(reports, detection_config.get('csv_file', CSV_FILE))
+    with open(csv_path, 'w') as csv_file:
+        writer = csv.DictWriter(csv_file, CSV_COLUMNS)
+        writer.writeheader()
+        writer.writerows(detected)
+    LOGGER.info("Wrote change points", path=csv_path, change_points=len(detected))
+    results.add('change-points',
+                'pass',
+                log_raw=format_change_points(detected, len(runs), len(series)),
+                change_points=detected)
+
+
+def load_history(patterns):
+    """
+    Read the results of the runs matching `patterns`, and split them into series.
+
+    :param list(str) patterns: Glob patterns of reports directories or of perf.npz files. A reports
+                               directory without perf.npz is read from its perf.json.
+    :rtype: (list(str), dict) The names of the runs, in order, and for each (test, threads, metric),
+            the indexes of the runs that have it, and its values in these runs, as arrays.
+    """
+    tables = {}
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            table = _read_run(path)
+            if table is not None:
+                tables.setdefault(table['run'], table)
+    runs = sorted(tables)
+
+    rows = collections.defaultdict(lambda: ([], []))
+    for index, run in enumerate(runs):
+        table = tables[run]
+        for key in zip(table['test'].tolist(), table['threads'].tolist(), table['metric'].tolist(),
+                       table['value'].tolist()):
+            indexes, values = rows[key[:3]]
+            # A metric reported twice by a run, e.g. by a repeated test, counts once.
+            if not indexes or indexes[-1] != index:
+                indexes.append(index)
+                values.append(key[3])
+    series = {}
+    for key, (indexes, values) in rows.items():
+        values = np.array(values, dtype=float)
+        finite = np.isfinite(values)
+        series[key] = (np.array(indexes)[finite], values[finite])
+    return runs, series
+
+
+def _read_run(path):
+    """
+    Read the results of one run, from a perf.npz file, or from a reports directory.
+
+    :return: The COLUMNS and `run` of the results archive, or None if there are no results.
+    """
+    if os.path.isdir(path):
+        archive = os.path.join(path, results_archive.ARCHIVE_FILE)
+        if not os.path.isfile(archive):
+            perf_json = os.path.join(path, 'perf.json')
+            try:
+                with open(perf_json) as perf_json_file:
+                    table = results_archive.from_perf_json(json.load(perf_json_file))
+            except (IOError, ValueError):
+                LOGGER.debug("No results in reports directory", path=path)
+                return None
+            table['run'] = results_archive.run_name(path)
+            return table
+        path = archive
+    return results_archive.read(path, COLUMNS)
+
+
+def q_values(series, min_size):
+    """
+    Return the E-divisive means statistic of each split of each series.
+
+    The split at tau divides a series of length n into x[:tau] and x[tau:], of lengths m and
+    n - m. Its statistic is
+
+        q(tau) = m (n - m) / n * (2 / (m (n - m)) * sum(|x_i - x_j|, i < tau <= j)
+                                  - 1 / C(m, 2) * sum(|x_i - x_k|, i < k < tau)
+                                  - 1 / C(n - m, 2) * sum(|x_j - x_k|, tau <= j < k))
+
+    The three sums of all the splits are read from cumulative sums of the distances between the
+    values.
+
+    :param numpy.ndarray series: Shape (batch, n), e.g. the permutations of a series.
+    :param int min_size: The minimum length of each side of a split, at least 2.
+    :rtype: numpy.ndarray Shape (batch, n - 2 * min_size + 1), the statistic of the splits at
+            tau = min_size, ..., n - min_size.
+    """
+    length = series.shape[1]
+    # rows[:, i, k] is the sum of |x_i - x_j| for j <= k.
+    rows = np.abs(series[:, :, np.newaxis] - series[:, np.newaxis, :]).cumsum(axis=2)
+    # The sum of the distances of the pairs i < k < tau, and of all the pairs of i < tau.
+    pairs = np.concatenate((np.zeros(
+        (len(series), 1)), rows[:, 1:, :-1].diagonal(axis1=1, axis2=2)),
+                           axis=1).cumsum(axis=1)
+    totals = rows[:, :, -1].cumsum(axis=1)
+    taus = np.arange(min_size, length - min_size + 1)
+    within_left = pairs[:, taus - 1]
+    between = totals[:, taus - 1] - 2 * within_left
+    within_right = (totals[:, -1:] / 2 - within_left) - between
+    left = taus.astype(float)
+    right = length - left
+    return (2 * between - 2 * right * within_left / (left - 1) - 2 * left * within_right /
+            (right - 1)) / length
+
+
+class _Segment(object):
+    """
+    A segment of a series, its best split, and the largest splits of its permutations, which are
+    only computed as the permutation tests need them.
+    """
+    def __init__(self, values, start, min_size):
+        self.values = values
+        self.min_size = min_size
+        q = q_values(values[np.newaxis, :], min_size)[0]
+        best = int(np.argmax(q))
+        self.index = start + min_size + best
+        self.q = float(q[best])
+        self.maxima = np.empty(0)
+
+    def permutation_maxima(self, count, random):
+        """
+        Return the largest statistic of the splits of each of the first `count` shuffles of the
+        segment.
+        """
+        length = len(self.values)
+        batch = max(1, MAX_BATCH_ELEMENTS // (length * length))
+        while len(self.maxima) < count:
+            shuffles = min(batch, count - len(self.maxima))
+            order = np.argsort(random.random_sample((shuffles, length)), axis=1)
+            self.maxima = np.concatenate((self.maxima, q_values(self.values[order],
+                                                                self.min_size).max(axis=1)))
+        return self.maxima[:count]
+
+
+def _permutation_test(segments, q, permutations, pvalue, random):
+    """
+    Return the p-value of the split with statistic `q`, or None if it isn't significant.
+
+    The permutations are evaluated in steps of PERMUTATION_STEP. The test stops as soon as enough
+    permutations have a split at least as large that the p-value can't be significant any more,
+    which is after a few steps for a series without a change point.
+    """
+    probability = None
+    for count in list(range(PERMUTATION_STEP, permutations, PERMUTATION_STEP)) + [permutations]:
+        maxima = np.max([segment.permutation_maxima(count, random) for segment in segments], axis=0)
+        probability = (int(np.count_nonzero(maxima >= q)) + 1) / float(permutations + 1)
+        if probability > pvalue:
+            return None
+    return probability
+
+
+def e_divisive(values, permutations=99, pvalue=0.05, min_size=3, random=None):
+    """
+    Find the change points of a series with E-divisive means.
+
+    The segments of the series are split one at a time, at the split with the largest statistic,
+    see q_values(), as long as the permutation test finds it significant: its p-value is the
+    fraction of the permutations, plus the split itself, in which the largest split of all the
+    segments, each shuffled on its own, is at least as large.
+
+    :param numpy.ndarray values: The series.
+    :param int permutations: The number of permutations of each test.
+    :param float pvalue: The largest p-value of a significant change point.
+    :param int min_size: The minimum length of a segment, at least 2.
+    :param numpy.random.RandomState random: The source of the permutations.
+    :rtype: list(ChangePoint) The change points, in order. Each one is the index of the first value
+            after the change.
+    """
+    random = np.random.RandomState() if random is None else random
+    values = np.asarray(values, dtype=float)
+    # A segment that isn't split again keeps its best split and its permutations.
+    segments = {}
+    bounds = [0, len(values)]
+    points = []
+    while True:
+        candidates = []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            if end - start >= 2 * min_size:
+                if (start, end) not in segments:
+                    segments[(start, end)] = _Segment(values[start:end], start, min_size)
+                candidates.append(segments[(start, end)])
+        if not candidates:
+            break
+        best = max(candidates, key=lambda segment: segment.q)
+        if best.q <= 0:
+            break
+        probability = _permutation_test(candidates, best.q, permutations, pvalue, random)
+        if probability is None:
+            break
+        points.append(ChangePoint(best.index, best.q, probability))
+        bounds = sorted(bounds + [best.index])
+    return sorted(points)
+
+
+def describe(points, values):
+    """
+    Return a row for the CSV file for each change point: its index, the means of the segments
+    before and after it, the change in percent of the mean before, its statistic, p-value and
+    confidence.
+
+    :param list(ChangePoint) points: See e_divisive().
+    :param numpy.ndarray values: The series.
+    :rtype: list(dict)
+    """
+    bounds = [0] + [point.index for point in points] + [len(values)]
+    rows = []
+    for number, point in enumerate(points):
+        before = float(np.mean(values[bounds[number]:point.index]))
+        after = float(np.mean(values[point.index:bounds[number + 2]]))
+        rows.append({
+            'index': point.index,
+            'before': before,
+            'after': after,
+            'change_percent': 100.0 * (after - before) / before if before else None,
+            'q': point.q,
+            'p_value': point.p_value,
+            'confidence': 1.0 - point.p_value
+        })
+    return rows
+
+
+def format_change_points(detected, runs, series):
+    """
+    Return a table of the change points.
+
+    :param list(dict) detected: The rows of the CSV file.
+    :param int runs: The number of runs.
+    :param int series: The number of series.
+    :rtype: str
+    """
+    lines = ['{0} change points in {1} series over {2} runs.'.format(len(detected), series, runs)]
+    for row in detected:
+        change = row['change_percent']
+        lines.append('{0} {1} threads {2}: {3:g} -> {4:g} ({5}) at {6}, confidence {7:.3f}'.format(
+            row['test'], row['threads'], row['metric'], row['before'], row['after'],
+            '-' if change is None else '{0:+.1f}%'.format(change), row['run'], row['confidence']))
+    return '\n'.join(lines) + '\n'
@@ -5,21 +5,31 @@ This plugin will traverse all directories called reports-*/, collect perf.json r
 and then output CSV / pandas data frame summaries and also save some nice matplotlibs.
 
 All output files are stored under a new directory `./compare_reports/`
+
+The results of each reports-* directory are kept in a summary index, compare_reports/index.npz,
+with the modification time of the directory and of its results files. A later run only reads the
+directories that are new or changed since, and builds the CSV files and graphs from the index.
 """
 import json
 import os
-import ruamel.yaml as yaml
+import zipfile
 
 import structlog
 import pandas as pd
 import numpy as np
 from matplotlib import pyplot as plt
 
-from common.utils import mkdir_p
+from common import results_archive
+from common.utils import atomic_write, mkdir_p
 
 LOGGER = structlog.get_logger(__name__)
 
 OUTPUT_DIR = "compare_reports"
+INDEX_FILE = os.path.join(OUTPUT_DIR, "index.npz")
+# Bump when the layout of the index changes, older indexes are then built again.
+INDEX_VERSION = 1
+COLUMNS = ("test", "threads", "metric", "value")
+RESULTS_FILES = (results_archive.ARCHIVE_FILE, "perf.json")
 
 
 # pylint: disable=too-many-nested-blocks
@@ -42,7 +52,6 @@ def compare_reports(config, results):
     # reports-YYYY-MM-DDThh:... with the original "reports" now a symlink to the most recent
     # reports-timestamp directory.
     results_prefix = "reports-"
-    result_data = {}
     csv_results = {}
     metrics = []
     tasks = []
@@ -50,55 +59,28 @@ def compare_reports(config, results):
 
     mkdir_p(OUTPUT_DIR)
 
-    for result_dir in list(filter(lambda x: results_prefix == x[:8], os.listdir("./"))):
+    result_dirs = sorted(filter(lambda x: results_prefix == x[:8], os.listdir("./")))
+    index = update_index(result_dirs)
+    for result_dir in result_dirs:
         isotimestamp = result_dir[8:]
         day_minute = isotimestamp[5:16].replace(":", "").replace("-", "")
-        # The main output file with throughput, latency, and other metrics in one nice place
-        perf_json = os.path.join(result_dir, "perf.json")
-        result_data[result_dir] = {"perf_json": None}
-        try:
-            with open(perf_json) as perf_json_fh:
-                dsi_results = json.load(perf_json_fh)
-                result_data[result_dir]["perf_json"] = dsi_results
-        except FileNotFoundError as e:
-            LOGGER.debug(str(type(e)) + " " + str(e))
+        table = index[result_dir][1]
+        if table is None:
             continue
-        except json.decoder.JSONDecodeError:
-            LOGGER.warn("Couldn't open the perf.json file.", file_name=perf_json)
-            return
-
-        test_control = os.path.join(result_dir, "test_control.yml")
-        try:
-            with open(test_control) as tc_fh:
-                tc = yaml.load(tc_fh, Loader=yaml.Loader)
-                result_data[result_dir]["test_control"] = tc
-        except FileNotFoundError as e:
-            LOGGER.warning(str(type(e)) + " " + str(e))
-        except json.decoder.JSONDecodeError:
-            LOGGER.warn("Couldn't open the perf.json file.", file_name=perf_json)
-            return
 
         task = config["test_control"]["task_name"] + "_" + day_minute
         tasks.append(task)
 
-        for result in result_data[result_dir]["perf_json"]["results"]:
-            workload = result["name"]
-            for k, v in result.items():
-                if k == "results":
-                    for kk, vv in v.items():
-                        threads = int(kk)
-                        for metric, value in vv.items():
-                            if isinstance(value, list) or metric[-7:] == "_values":
-                                continue
-
-                            if workload not in csv_results:
-                                csv_results[workload] = {}
-                            if metric not in csv_results[workload]:
-                                csv_results[workload][metric] = {}
-                            if task not in csv_results[workload][metric]:
-                                csv_results[workload][metric][task] = {}
-                            csv_results[workload][metric][task][threads] = value
-                            metrics.append(metric)
+        for workload, threads, metric, value in zip(*(table[column].tolist()
+                                                      for column in COLUMNS)):
+            if workload not in csv_results:
+                csv_results[workload] = {}
+            if metric not in csv_results[workload]:
+                csv_results[workload][metric] = {}
+            if task not in csv_results[workload][metric]:
+                csv_results[workload][metric][task] = {}
+            csv_results[workload][metric][task][threads] = value
+            metrics.append(metric)
 
     LOGGER.info("Comparing reports for following tasks: ", tasks=tasks)
     metrics = list(set(metrics))
@@ -139,6 +121,136 @@ def compare_reports(config, results):
     LOGGER.info("Wrote comparison data and graphs at...", out_dirs=sorted(list(set(out_dirs))))
 
 
+def update_index(result_dirs, index_path=INDEX_FILE):
+    """
+    Return the results of `result_dirs`, read from the summary index at `index_path`, or from the
+    directories that are new or changed since the index was written.
+
+    The index is written again if it changed. Directories that are gone are dropped from it.
+
+    :param list(str) result_dirs: The reports directories.
+    :param str index_path: The index file.
+    :rtype: dict(str, (int, dict)) For each directory, its modification time, see _mtime(), and
+            the columns of its results, or None if it has no results.
+    """
+    index = load_index(index_path)
+    updated = {}
+    read = []
+    for result_dir in result_dirs:
+        mtime = _mtime(result_dir)
+        if result_dir in index and index[result_dir][0] == mtime:
+            updated[result_dir] = index[result_dir]
+        else:
+            LOGGER.debug("Reading results", result_dir=result_dir)
+            updated[result_dir] = (mtime, _read_results(result_dir))
+            read.append(result_dir)
+    if read or set(updated) != set(index):
+        LOGGER.info("Updating compare_reports index",
+                    path=index_path,
+                    read=len(read),
+                    runs=len(updated))
+        save_index(index_path, updated)
+    return updated
+
+
+def _mtime(result_dir):
+    """
+    Return the latest modification time, in ns, of `result_dir` and of its results files.
+
+    Adding a perf.npz or a perf.json changes the directory, rewriting one changes the file.
+    """
+    mtime = os.stat(result_dir).st_mtime_ns
+    for name in RESULTS_FILES:
+        try:
+            mtime = max(mtime, os.stat(os.path.join(result_dir, name)).st_mtime_ns)
+        except FileNotFoundError:
+            pass
+    return mtime
+
+
+def load_index(index_path):
+    """
+    Read the summary index at `index_path`.
+
+    The index holds the COLUMNS of all the runs one after the other, and for each run, its
+    directory, its modification time and its number of rows, -1 for a run without results.
+
+    :return: See update_index(). Empty if there is no index, or it can't be read.
+    """
+    try:
+        with np.load(index_path, allow_pickle=False) as index_file:
+            if int(index_file["version"]) != INDEX_VERSION:
+                return {}
+            columns = {column: index_file[column] for column in COLUMNS}
+            dirs, mtimes, counts = (index_file[key] for key in ("dirs", "mtimes", "counts"))
+    except FileNotFoundError:
+        return {}
+    except (IOError, ValueError, KeyError, zipfile.BadZipFile):
+        LOGGER.warning("Ignoring unreadable compare_reports index", path=index_path, exc_info=1)
+        return {}
+    index = {}
+    end = 0
+    for result_dir, mtime, count in zip(dirs.tolist(), mtimes.tolist(), counts.tolist()):
+        table = None
+        if count >= 0:
+            table = {column: values[end:end + count] for column, values in columns.items()}
+            end += count
+        index[result_dir] = (mtime, table)
+    return index
+
+
+def save_index(index_path, index):
+    """
+    Write the summary index. See load_index().
+
+    The index is only an optimization: if it can't be written, the results are read again next time.
+    """
+    dirs = sorted(index)
+    tables = [index[result_dir][1] for result_dir in dirs]
+    columns = {
+        column: np.concatenate([np.empty(0, dtype=results_archive.DTYPES[column])] +
+                               [table[column] for table in tables if table is not None])
+        for column in COLUMNS
+    }
+    try:
+        with atomic_write(index_path, "wb") as index_file:
+            np.savez(index_file,
+                     version=np.array(INDEX_VERSION),
+                     dirs=np.array(dirs, dtype=str),
+                     mtimes=np.array([index[result_dir][0] for result_dir in dirs], dtype=np.int64),
+                     counts=np.array(
+                         [-1 if table is None else len(table["value"]) for table in tables],
+                         dtype=np.int64),
+                     **columns)
+    except (IOError, OSError):
+        LOGGER.warning("Couldn't write compare_reports index", path=index_path, exc_info=1)
+
+
+def _read_results(result_dir):
+    """
+    Read the results of the run in `result_dir`.
+
+    Runs since the results archive was added have a perf.npz, which is much faster to read than
+    perf.json. Older runs only have perf.json.
+
+    :return: The columns of the results archive, or None if the run has no results.
+    """
+    archive = os.path.join(result_dir, results_archive.ARCHIVE_FILE)
+    if os.path.isfile(archive):
+        return results_archive.read(archive, COLUMNS)
+
+    # The main output file with throughput, latency, and other metrics in one nice place
+    perf_json = os.path.join(result_dir, "perf.json")
+    try:
+        with open(perf_json) as perf_json_fh:
+            return results_archive.from_perf_json(json.load(perf_json_fh))
+    except FileNotFoundError as e:
+        LOGGER.debug(str(type(e)) + " " + str(e))
+    except json.decoder.JSONDecodeError:
+        LOGGER.warn("Couldn't open the perf.json file.", file_name=perf_json)
+    return None
+
+
 def _graph(workload, metric, labels, thread_levels, rows):
     title = workload + " " + metric
     out_dir = OUTPUT_DIR + "/" + workload
@@ -10,10 +10,14 @@ import pandas as pd
 import numpy as np
 from matplotlib import pyplot as plt
 
+from common import results_archive
 from common.utils import mkdir_p
 
 LOGGER = structlog.get_logger(__name__)
 
+COLUMNS = ("test", "threads", "metric", "value")
+
+
 # pylint: disable=too-many-nested-blocks
 # pylint: disable=too-many-branches
 # pylint: disable=too-many-statements
@@ -26,39 +30,29 @@ def json2csv(config, results):
     :param ResultsFile results: Object to add results to. (Not used)
     """
 
-    result_data = {}
     csv_results = {}
     metrics = []
     tasks = []
     result_dir = config['test_control']['reports_dir_basename']
-    # The main output file with throughput, latency, and other metrics in one nice place
-    perf_json = os.path.join(result_dir, "perf.json")
-    result_data = None
-    try:
-        with open(perf_json) as perf_json_fh:
-            dsi_results = json.load(perf_json_fh)
-            result_data = dsi_results
-    except json.decoder.JSONDecodeError:
-        LOGGER.warn("Couldn't open the perf.json file.", file_name=perf_json)
-        return
-
-    task = config["test_control"]["task_name"]
-
-    for result in result_data["results"]:
-        workload = result["name"]
-        for k, v in result.items():
-            if k == "results":
-                for kk, vv in v.items():
-                    threads = int(kk)
-                    for metric, value in vv.items():
-                        if isinstance(value, list) or metric[-7:] == "_values":
-                            continue
+    archive = os.path.join(result_dir, results_archive.ARCHIVE_FILE)
+    if os.path.isfile(archive):
+        table = results_archive.read(archive, COLUMNS)
+    else:
+        # The main output file with throughput, latency, and other metrics in one nice place
+        perf_json = os.path.join(result_dir, "perf.json")
+        try:
+            with open(perf_json) as perf_json_fh:
+                table = results_archive.from_perf_json(json.load(perf_json_fh))
+        except json.decoder.JSONDecodeError:
+            LOGGER.warn("Couldn't open the perf.json file.", file_name=perf_json)
+            return
 
-                        if workload not in csv_results:
-                            csv_results[workload] = {}
-                        if metric not in csv_results[workload]:
-                            csv_results[workload][metric] = {}
-                        csv_results[workload][metric][threads] = value
+    for workload, threads, metric, value in zip(*(table[column].tolist() for column in COLUMNS)):
+        if workload not in csv_results:
+            csv_results[workload] = {}
+        if metric not in csv_results[workload]:
+            csv_results[workload][metric] = {}
+        csv_results[workload][metric][threads] = value
 
     metrics = []
     thread_levels = []
@@ -5,12 +5,15 @@ Functions for analyzing `FTDC` diagnostic data. Parse files to do some resource
 """
 
 from __future__ import print_function
+import collections
+import concurrent.futures
 import copy
 import inspect
 import os
 
 import structlog
 
+from . import ftdc_cache
 from . import readers
 from . import rules
 from . import util
@@ -236,6 +239,9 @@ def resource_rules(config, dir_path, variant, constant_values=None, perf_file_pa
     :param dict constant_values: some rules take in constants to compare current values against
     :param str perf_file_path: set `perf_file_path` to the path of the performance results file
     (probably `perf.json`) generated by the test runner, which contains relevant timestamp data.
+
+    Each FTDC file is checked in a process of its own, by up to `analysis.ftdc_workers` processes
+    (one per CPU if 0). Failures are reported in the order of the host and test names.
     """
     result = {'end': 1, 'start': 0}
     if not constant_values:
@@ -252,40 +258,36 @@ def resource_rules(config, dir_path, variant, constant_values=None, perf_file_pa
         result['status'] = 'pass'
         result['log_raw'] = '\nNo FTDC metrics files found. Skipping resource sanity checks.'
     else:
-        configured_rules = util.get_project_variant_rules(config, variant,
-                                                          'resource_rules_ftdc_chunk')
-        configured_rules += util.get_project_variant_rules(config, variant,
-                                                           'resource_rules_ftdc_file')
-        LOGGER.info("Checking rules:", rules=configured_rules)
+        chunk_rules = list(
+            util.get_project_variant_rules(config, variant, 'resource_rules_ftdc_chunk'))
+        file_rules = list(
+            util.get_project_variant_rules(config, variant, 'resource_rules_ftdc_file'))
+        LOGGER.info("Checking rules:", rules=chunk_rules + file_rules)
         # depending on variant, there can be multiple hosts and therefore multiple FTDC data files
-        full_log_raw = ''
-        # This loop iterates the nested dictionary, `ftdc_files_dict`, returned by
-        # `_get_ftdc_file_paths`. Each host will have one or more tests and each test has one FTDC
-        # file path associated with it.
-        #
         # `ftdc_files_dict` has the following structure:
         #   key: <host_alias> str
         #   value: dict with key: <test_name> str
         #                    value: <ftdc_file_path> str
-        for host_alias, test_names in ftdc_files_dict.items():
-            for test_name, ftdc_file_path in test_names.items():
-                LOGGER.debug('Reading FTDC file', filename=ftdc_file_path)
-
-                # Some of the rules, such as below_configured_oplog_size, treat certain values read
-                # from FTDC as constants. An example would be the maximum oplog size. The first time
-                # the code needs the maximum oplog size, it reads it from the FTDC data and saves it
-                # in the constant_values dict. At the very least, the data may be different on
-                # different hosts, as demontrated by BF-7261. By copying the "constants" here, we
-                # ensure that a value from one host isn't used for another host.
-                #
-                # Filed PERF-1182 to follow-up and fix this properly.
-                my_constant_values = copy.deepcopy(constant_values)
-                (passed_checks, log_raw) = _process_ftdc_file(ftdc_file_path, config, variant,
-                                                              my_constant_values)
-                if not passed_checks:
-                    full_log_raw += ('Failed resource sanity check {0} for host {1}').format(
-                        test_name, host_alias)
-                    full_log_raw += log_raw
+        #
+        # Some of the rules, such as below_configured_oplog_size, treat certain values read from
+        # FTDC as constants. An example would be the maximum oplog size. The first time the code
+        # needs the maximum oplog size, it reads it from the FTDC data and saves it in the
+        # constant_values dict. At the very least, the data may be different on different hosts,
+        # as demontrated by BF-7261. Each file therefore gets its own copy of the "constants", so
+        # that a value from one host isn't used for another host.
+        #
+        # Filed PERF-1182 to follow-up and fix this properly.
+        files = [(host_alias, test_name, ftdc_file_path)
+                 for host_alias, test_names in sorted(ftdc_files_dict.items())
+                 for test_name, ftdc_file_path in sorted(test_names.items())]
+        outcomes = _check_ftdc_files([path for _, _, path in files], chunk_rules, file_rules,
+                                     constant_values, config)
+        full_log_raw = ''
+        for (host_alias, test_name, _), (passed_checks, log_raw) in zip(files, outcomes):
+            if not passed_checks:
+                full_log_raw += ('Failed resource sanity check {0} for host {1}').format(
+                    test_name, host_alias)
+                full_log_raw += log_raw
         if full_log_raw:
             result['status'] = 'fail'
             result['exit_code'] = 1
@@ -298,28 +300,91 @@ def resource_rules(config, dir_path, variant, constant_values=None, perf_file_pa
     return result
 
 
-def _process_ftdc_file(path_to_ftdc_file, config, variant, constant_values):  # pylint: disable=too-many-locals
+def _check_ftdc_files(paths, chunk_rules, file_rules, constant_values, config):
+    """
+    Check the resource rules on each FTDC file, in a pool of processes.
+
+    :param list(str) paths: FTDC metrics files
+    :param list(str) chunk_rules: rules checked on each chunk
+    :param list(str) file_rules: rules checked on the whole file
+    :param dict constant_values: some rules take in constants to compare current values against
+    :param ConfigDict config: Global configuration, for the number of processes and the cache
+    :rtype: list(tuple(bool, str)) the outcome of _process_ftdc_file() for each of `paths`
+    """
+    cache = ftdc_cache.from_config(config)
+    workers = util.worker_count(config, 'ftdc_workers')
+    workers = min(workers, len(paths))
+    LOGGER.debug('Checking FTDC files', files=len(paths), workers=workers)
+    if workers <= 1:
+        previous_cache = readers.set_cache(cache)
+        try:
+            outcomes = [
+                _process_ftdc_file(path, chunk_rules, file_rules, copy.deepcopy(constant_values))
+                for path in paths
+            ]
+        finally:
+            readers.set_cache(previous_cache)
+    else:
+        cache_settings = (cache.directory, cache.max_bytes) if cache else None
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            checked = list(
+                executor.map(_check_ftdc_file, paths, [chunk_rules] * len(paths),
+                             [file_rules] * len(paths), [constant_values] * len(paths),
+                             [cache_settings] * len(paths)))
+        outcomes = []
+        for passed_checks, log_raw, cache_stats in checked:
+            outcomes.append((passed_checks, log_raw))
+            if cache:
+                for stat, value in cache_stats.items():
+                    cache.stats[stat] += value
+    if cache:
+        LOGGER.info("FTDC cache", directory=cache.directory, **cache.stats)
+    return outcomes
+
+
+def _check_ftdc_file(path_to_ftdc_file, chunk_rules, file_rules, constant_values, cache_settings):
+    """
+    Check the resource rules on a single FTDC file in a worker process.
+
+    :param tuple cache_settings: the directory and maximum size of the FTDC cache, or None
+    :rtype: tuple(bool, str, dict) the outcome of _process_ftdc_file() and the cache stats
+    """
+    cache = ftdc_cache.FtdcCache(*cache_settings) if cache_settings else None
+    readers.set_cache(cache)
+    passed_checks, log_raw = _process_ftdc_file(path_to_ftdc_file, chunk_rules, file_rules,
+                                                constant_values)
+    return passed_checks, log_raw, cache.stats if cache else {}
+
+
+def _process_ftdc_file(path_to_ftdc_file, chunk_rules, file_rules, constant_values):
     """
     Iterates through chunks in a single FTDC metrics file and checks the resource rules.
 
+    The file is decoded once: the chunk rules and the rules checked on the whole file are visitors
+    of the same chunks, see ChunkRuleCheck and rules.FILE_RULE_VISITORS.
+
     :param str path_to_ftdc_file: path to a FTDC metrics file
-    :param ConfigDict config: Global configuration
-    :param str variant: build variant to check
+    :param list(str) chunk_rules: rules checked on each chunk
+    :param list(str) file_rules: rules checked on the whole file
     :param dict constant_values: some rules take in constants to compare current values against
     :rtype: tuple(bool, str)
             bool: whether the checks passed/failed for a host
             str: raw log information
     """
-    failures_per_chunk = {}
-    task_run_time = 0
-
-    try:  #pylint: disable=too-many-nested-blocks
-        for chunk in readers.read_ftdc(path_to_ftdc_file):
+    LOGGER.debug('Reading FTDC file', filename=path_to_ftdc_file)
+    chunk_check = ChunkRuleCheck(chunk_rules, constant_values, path_to_ftdc_file)
+    file_checks = collections.OrderedDict(
+        (function_name, rules.FILE_RULE_VISITORS[function_name](constant_values['test_times']))
+        for function_name in file_rules)
+    visitors = [chunk_check] + list(file_checks.values())
+
+    try:
+        for chunk in readers.read_ftdc(path_to_ftdc_file, keys=rules.FTDC_RULE_KEYS):
             # a couple of asserts to make sure the chunk is not malformed
             assert all(len(list(chunk.values())[0]) == len(v) for v in chunk.values()), \
                 ('Metrics from file {0} do not all have same number of collected '
                  'samples in the chunk').format(os.path.basename(path_to_ftdc_file))
-            assert list(chunk.values())[0], \
+            assert len(list(chunk.values())[0]), \
                                              ('No data captured in chunk from file {0}').format(
                                                  os.path.basename(path_to_ftdc_file))
             assert rules.FTDC_KEYS['time'] in chunk, \
@@ -327,30 +392,8 @@ def _process_ftdc_file(path_to_ftdc_file, config, variant, constant_values):  #
                     os.path.basename(path_to_ftdc_file))
 
             # proceed with rule-checking.
-            times = chunk[rules.FTDC_KEYS['time']]
-            task_run_time += len(times)
-            for function_name in util.get_project_variant_rules(config, variant,
-                                                                'resource_rules_ftdc_chunk'):
-                # Get the configured function from rules.py
-                chunk_rule = getattr(rules, function_name)
-                build_args = {'chunk': chunk, 'times': times}
-                if function_name == 'ftdc_replica_lag_check':
-                    build_args = {'path_to_ftdc_file': path_to_ftdc_file}
-                # TODO: All of this is legacy code, should use ConfigDict much more directly.
-                # pylint: disable=deprecated-method
-                arguments_needed = inspect.getfullargspec(chunk_rule)[0]
-                # gather any missing arguments
-                (build_args,
-                 constant_values) = _fetch_constant_arguments(chunk, arguments_needed, build_args,
-                                                              constant_values)
-                if len(build_args) < len(arguments_needed):
-                    continue  # could not find all the necessary metrics in this chunk
-                output = chunk_rule(**build_args)
-                if output:
-                    rule_name = chunk_rule.__name__
-                    if rule_name not in failures_per_chunk:
-                        failures_per_chunk[rule_name] = []
-                        failures_per_chunk[rule_name].append(output)
+            for visitor in visitors:
+                visitor.visit(chunk)
 
     # reader.py throws a general exception
     except Exception:  #pylint: disable=broad-except
@@ -358,17 +401,92 @@ def _process_ftdc_file(path_to_ftdc_file, config, variant, constant_values):  #
         LOGGER.error("Stack trace:", exc_info=1)
         return (False, '\nFailed to read FTDC data for {0}'.format(path_to_ftdc_file))
 
-    # check rules that require data from the whole FTDC run (rather than by chunk)
-    file_rule_failures = _ftdc_file_rule_evaluation(path_to_ftdc_file, config, variant,
-                                                    constant_values['test_times'])
+    # rules that require data from the whole FTDC run (rather than by chunk)
+    file_rule_failures = {}
+    for function_name, file_check in file_checks.items():
+        check_failed = file_check.failures()
+        if check_failed:
+            file_rule_failures[function_name] = check_failed
 
+    failures_per_chunk = chunk_check.failures()
     if not failures_per_chunk and not file_rule_failures:
         return (True, '\nPassed resource sanity checks.')
     log_raw = _ftdc_log_raw(file_rule_failures, unify_chunk_failures(failures_per_chunk),
-                            task_run_time)
+                            chunk_check.task_run_time)
     return (False, log_raw)
 
 
+class ChunkRuleCheck(object):
+    """
+    The chunk rules, as a visitor of the chunks of an FTDC file. Only the first failure of each
+    rule is kept.
+    """
+    def __init__(self, chunk_rules, constant_values, path_to_ftdc_file=None):
+        """
+        :param list(str) chunk_rules: rules checked on each chunk
+        :param dict constant_values: some rules take in constants to compare current values
+        against, see check_chunk().
+        :param str path_to_ftdc_file: path to the FTDC metrics file of the chunks, if any
+        """
+        self.chunk_rules = chunk_rules
+        self.constant_values = constant_values
+        self.path_to_ftdc_file = path_to_ftdc_file
+        self.failures_per_chunk = {}
+        self.task_run_time = 0
+
+    def visit(self, chunk):
+        """
+        Check the rules on a chunk.
+
+        :param collections.OrderedDict chunk: FTDC chunk
+        """
+        self.task_run_time += len(chunk[rules.FTDC_KEYS['time']])
+        chunk_failures = check_chunk(chunk, self.chunk_rules, self.constant_values,
+                                     self.path_to_ftdc_file)
+        for rule_name, output in chunk_failures.items():
+            if rule_name not in self.failures_per_chunk:
+                self.failures_per_chunk[rule_name] = [output]
+
+    def failures(self):
+        """
+        :rtype: dict the first failure info of each rule that failed, in a list, by rule name
+        """
+        return self.failures_per_chunk
+
+
+def check_chunk(chunk, chunk_rules, constant_values, path_to_ftdc_file=None):
+    """
+    Check the resource rules on a single chunk of FTDC data.
+
+    :param collections.OrderedDict chunk: FTDC chunk
+    :param list(str) chunk_rules: rules checked on each chunk
+    :param dict constant_values: some rules take in constants to compare current values against.
+    Constants read from the FTDC data are added to it.
+    :param str path_to_ftdc_file: path to the FTDC metrics file of the chunk, if any
+    :rtype: dict the failure info of each rule that failed, by rule name
+    """
+    times = chunk[rules.FTDC_KEYS['time']]
+    failures = {}
+    for function_name in chunk_rules:
+        # Get the configured function from rules.py
+        chunk_rule = getattr(rules, function_name)
+        build_args = {'chunk': chunk, 'times': times}
+        if function_name == 'ftdc_replica_lag_check':
+            build_args = {'path_to_ftdc_file': path_to_ftdc_file}
+        # TODO: All of this is legacy code, should use ConfigDict much more directly.
+        # pylint: disable=deprecated-method
+        arguments_needed = inspect.getfullargspec(chunk_rule)[0]
+        # gather any missing arguments
+        (build_args, constant_values) = _fetch_constant_arguments(chunk, arguments_needed,
+                                                                  build_args, constant_values)
+        if len(build_args) < len(arguments_needed):
+            continue  # could not find all the necessary metrics in this chunk
+        output = chunk_rule(**build_args)
+        if output:
+            failures[chunk_rule.__name__] = output
+    return failures
+
+
 def _fetch_constant_arguments(chunk, arguments_needed, arguments_present, constant_values):
     """
     Helper to update arguments_present and constant_values. Uses mapping in rules.FETCH_CONSTANTS
@@ -413,25 +531,6 @@ def _ftdc_log_raw(file_rule_failures, chunk_rule_failures, task_run_time):
     return log_raw
 
 
-def _ftdc_file_rule_evaluation(path_to_ftdc_file, config, variant, test_times):
-    """
-    Some rules require data from the entire FTDC run.
-
-    :type path_to_ftdc_file: str
-    :type config: ConfigDict
-    :type variant: str
-    :rtype: dict
-    """
-    file_rules = util.get_project_variant_rules(config, variant, 'resource_rules_ftdc_file')
-    file_rule_failures = {}
-    for function_name in file_rules:
-        resource_rule = getattr(rules, function_name)
-        check_failed = resource_rule(path_to_ftdc_file, test_times)
-        if check_failed:
-            file_rule_failures[resource_rule.__name__] = check_failed
-    return file_rule_failures
-
-
 def _ftdc_file_failure_raw(failures_dict, task_run_time):
     """
     Helper to output log raw message for rules checked across the whole FTDC file, rather than
@@ -483,7 +582,10 @@ def _get_ftdc_file_paths(dir_path):
             host_alias = os.path.basename(root_directory)
             test_id = os.path.basename(os.path.dirname(root_directory))
             ftdc_files = os.listdir(os.path.join(root_directory, find_directory))
-            files = [file_name for file_name in ftdc_files if not file_name.endswith(".interim")]
+            files = [
+                file_name for file_name in ftdc_files
+                if not file_name.endswith(".interim") and not file_name.startswith(".")
+            ]
             if not files:
                 LOGGER.warning('No FTDC metrics files found. Expected at least one. Skipping.',
                                path=(test_id + '/' + host_alias))
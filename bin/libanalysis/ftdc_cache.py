@@ -0,0 +1,203 @@
+"""
+Cache of decoded FTDC metrics.
+
+analysis.py decodes every FTDC file in reports/ each time it runs, e.g. again with
+recompute_perf_json or after a change to the rules. The decoded chunks of a file are therefore
+stored in a cache directory, one .npz file per FTDC file and selection of metrics, and read back
+instead of decoding the file again.
+
+An entry is keyed by the path, size and mtime of the FTDC file, so that finding it doesn't read the
+file, and by the metrics that were read. A changed file, or a different selection of metrics, is a
+cache miss. Only selective reads (see the
+`keys` of readers.read_ftdc) are cached: all metrics of a file are too large to store. Once the
+entries exceed the maximum size, the least recently used ones are evicted.
+"""
+
+import collections
+import hashlib
+import json
+import os
+import zipfile
+
+import numpy as np
+import structlog
+
+from common.utils import atomic_write
+
+LOGGER = structlog.get_logger(__name__)
+
+ENTRY_SUFFIX = '.npz'
+MB = 1024 * 1024
+
+
+def from_config(config):
+    """
+    Return the FtdcCache configured in analysis.ftdc_cache, or None if it is disabled.
+
+    :param ConfigDict config: The global config.
+    :rtype: FtdcCache|None
+    """
+    cache_config = config['analysis'].get('ftdc_cache', {})
+    if not cache_config.get('enabled', False):
+        return None
+    return FtdcCache(cache_config.get('directory', 'ftdc_cache'),
+                     cache_config.get('max_size_mb', 1024) * MB)
+
+
+class FtdcCache(object):
+    """
+    Decoded FTDC chunks, stored as .npz files in a directory.
+    """
+    def __init__(self, directory, max_bytes):
+        """
+        :param str directory: The cache directory, created if it doesn't exist.
+        :param int max_bytes: Evict the least recently used entries above this total size.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def read(self, path, first_only, keys, decode):
+        """
+        Yield the chunks of the FTDC file at `path`, from the cache if possible.
+
+        On a miss, the chunks are decoded with `decode(path, first_only, keys)` and stored once
+        all of them have been read.
+
+        :param str path: An FTDC file.
+        :param bool first_only: See readers.read_ftdc().
+        :param keys: See readers.read_ftdc().
+        :param callable decode: Decodes the chunks of a file.
+        """
+        entry = os.path.join(self.directory, entry_name(path, first_only, keys))
+        chunks = self._load(entry)
+        if chunks is not None:
+            self.stats['hits'] += 1
+            for chunk in chunks:
+                yield chunk
+            return
+
+        self.stats['misses'] += 1
+        chunks = []
+        for chunk in decode(path, first_only, keys):
+            chunks.append(chunk)
+            yield chunk
+        self._store(entry, chunks)
+
+    def _load(self, entry):
+        try:
+            chunks = load_chunks(entry)
+            # The modification time of an entry is the time it was last used.
+            os.utime(entry)
+        except FileNotFoundError:
+            # Not cached yet, or evicted by another process.
+            return None
+        except (IOError, ValueError, KeyError, zipfile.BadZipFile):
+            LOGGER.warning("Ignoring unreadable FTDC cache entry", entry=entry, exc_info=1)
+            return None
+        return chunks
+
+    def _store(self, entry, chunks):
+        # The cache is only an optimization: if an entry can't be written, e.g. on a full disk,
+        # the file is decoded again next time.
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with atomic_write(entry, 'wb', suffix='.tmp') as entry_file:
+                store_chunks(entry_file, chunks)
+            self._evict(keep=entry)
+        except OSError:
+            LOGGER.warning("Couldn't write FTDC cache entry", entry=entry, exc_info=1)
+
+    def _evict(self, keep):
+        # Other processes, see ftdc_analysis.py, may evict the same entries concurrently.
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(ENTRY_SUFFIX):
+                entry = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(entry)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry))
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if entry != keep:
+                total -= size
+                try:
+                    os.remove(entry)
+                except FileNotFoundError:
+                    continue
+                self.stats['evictions'] += 1
+
+
+def entry_name(path, first_only, keys):
+    """
+    Return the name of the cache entry for the FTDC file at `path`.
+
+    :param str path: An FTDC file.
+    :param bool first_only: See readers.read_ftdc().
+    :param keys: See readers.read_ftdc().
+    :rtype: str
+    """
+    stat = os.stat(path)
+    digest = hashlib.sha1()
+    digest.update('{} {} {} {} {}'.format(os.path.realpath(path), stat.st_size, stat.st_mtime_ns,
+                                          bool(first_only),
+                                          sorted(repr(key) for key in keys)).encode())
+    return digest.hexdigest() + ENTRY_SUFFIX
+
+
+def store_chunks(entry_file, chunks):
+    """
+    Write decoded chunks to `entry_file`.
+
+    All chunks share one table of metric names, each a JSON list of the fields of its key. Chunk i
+    is stored as keys_i, the indexes of its metrics in that table, and values_i, one row of values
+    per metric. readers.read_ftdc() yields None for a bad chunk, which is stored with a chunk_len
+    of -1.
+
+    :param file entry_file: A file opened for writing in binary mode.
+    :param list chunks: The chunks of an FTDC file, as yielded by readers.read_ftdc().
+    """
+    names = collections.OrderedDict()
+    arrays = {
+        'chunk_len': np.full(len(chunks), -1, dtype=np.int64),
+        'nsamples': np.zeros(len(chunks), dtype=np.int64)
+    }
+    for index, chunk in enumerate(chunks):
+        if chunk is None:
+            continue
+        arrays['chunk_len'][index] = chunk.chunk_len
+        arrays['nsamples'][index] = chunk.nsamples
+        arrays['keys_{}'.format(index)] = np.array(
+            [names.setdefault(key, len(names)) for key in chunk], dtype=np.int64)
+        arrays['values_{}'.format(index)] = np.array(list(
+            chunk.values()), dtype=np.int64) if chunk else np.zeros((0, 0), dtype=np.int64)
+    arrays['names'] = np.array([json.dumps(key) for key in names], dtype=str)
+    np.savez_compressed(entry_file, **arrays)
+
+
+def load_chunks(entry):
+    """
+    Read the chunks written by store_chunks().
+
+    :param str entry: The cache entry.
+    :rtype: list(collections.OrderedDict|None)
+    """
+    with np.load(entry, allow_pickle=False) as archive:
+        arrays = dict(archive)
+    names = [tuple(json.loads(str(name))) for name in arrays['names']]
+    chunks = []
+    for index, (chunk_len, nsamples) in enumerate(zip(arrays['chunk_len'], arrays['nsamples'])):
+        if chunk_len < 0:
+            chunks.append(None)
+            continue
+        chunk = collections.OrderedDict()
+        chunk.chunk_len = int(chunk_len)
+        chunk.nsamples = int(nsamples)
+        for key, values in zip(arrays['keys_{}'.format(index)], arrays['values_{}'.format(index)]):
+            chunk[names[key]] = values
+        chunks.append(chunk)
+    return chunks
@@ -0,0 +1,265 @@
+"""
+analysis.py plugin: Export time series of FTDC metrics.
+
+The FTDC diagnostic.data of each node is only used by the resource rules. For dashboards, this
+plugin exports the metrics configured in analysis.ftdc_timeseries, e.g. CPU, cache, connections,
+opcounters and replication lag, over the whole run. Each node gets two files next to its
+diagnostic.data directory:
+
+    ftdc_timeseries.csv  One row per metric and point: metric, time_ms, value.
+    ftdc_timeseries.npz  Arrays time.<metric> and value.<metric>, readable without pickle.
+
+Counters, e.g. opcounters, are converted to rates per second. Each metric is then downsampled to at
+most `max_points` points with Largest-Triangle-Three-Buckets (LTTB), which keeps the peaks and dips
+that an average over windows would flatten.
+"""
+
+import csv
+import os
+
+import numpy as np
+import structlog
+
+from . import readers
+from . import rules
+
+LOGGER = structlog.get_logger(__name__)
+
+DIAGNOSTIC_DATA = 'diagnostic.data'
+CSV_FILE = 'ftdc_timeseries.csv'
+NPZ_FILE = 'ftdc_timeseries.npz'
+REPL_LAG = 'repl_lag_ms'
+MS = 1000.0
+
+PRIMARY = 1
+SECONDARY = 2
+
+
+def ftdc_timeseries(config, results):  # pylint: disable=unused-argument
+    """
+    analysis.py plugin: Export downsampled time series of FTDC metrics for each node.
+
+    :param ConfigDict config: The global config.
+    :param ResultsFile results: Object to add results to. (Not used)
+    """
+    export_config = config['analysis'].get('ftdc_timeseries', {})
+    metrics = [(metric['name'], tuple(metric['key']), metric.get('counter', False))
+               for metric in export_config.get('metrics', [])]
+    repl_lag = export_config.get('repl_lag', True)
+    max_points = export_config.get('max_points', 2000)
+    reports = config['test_control']['reports_dir_basename']
+    LOGGER.info("Exporting FTDC time series.", reports=reports)
+    for directory in find_diagnostic_data(reports):
+        series = read_series(ftdc_files(directory), metrics, repl_lag)
+        if series:
+            node_dir = os.path.dirname(directory)
+            write_series(node_dir, downsample_series(series, max_points))
+            LOGGER.info("Wrote FTDC time series", path=node_dir, metrics=len(series))
+
+
+def find_diagnostic_data(reports_dir):
+    """
+    Return the diagnostic.data directories under `reports_dir`, usually one per test and node.
+
+    :param str reports_dir: The reports directory.
+    :rtype: list(str)
+    """
+    found = []
+    for root, directories, _ in os.walk(reports_dir):
+        if DIAGNOSTIC_DATA in directories:
+            found.append(os.path.join(root, DIAGNOSTIC_DATA))
+    return sorted(found)
+
+
+def ftdc_files(directory):
+    """
+    Return the FTDC metrics files in `directory`, oldest first.
+
+    The metrics.interim file only repeats the latest samples, and hidden files are the time indexes
+    of readers.read_index().
+
+    :param str directory: A diagnostic.data directory.
+    :rtype: list(str)
+    """
+    return [
+        os.path.join(directory, name) for name in sorted(os.listdir(directory))
+        if not name.endswith('.interim') and not name.startswith('.')
+    ]
+
+
+def read_series(paths, metrics, repl_lag=True):  # pylint: disable=too-many-locals
+    """
+    Read the time series of `metrics` from FTDC files.
+
+    :param list(str) paths: FTDC files, oldest first.
+    :param list(tuple(str, tuple, bool)) metrics: The name, FTDC key and whether it is a counter of
+                                                  each metric.
+    :param bool repl_lag: Also compute the replication lag, see chunk_repl_lag().
+    :rtype: dict(str, (numpy.ndarray, numpy.ndarray)) The times, in ms since the epoch, and the
+                                                       float values of each metric that is in the
+                                                       files. Counters are rates per second.
+    """
+    time_key = rules.FTDC_KEYS['time']
+    keys = [time_key] + [key for _, key, _ in metrics]
+    if repl_lag:
+        keys.append(rules.REPL_MEMBERS_PREFIX)
+    names = [name for name, _, _ in metrics] + ([REPL_LAG] if repl_lag else [])
+    times = []
+    values = {name: [] for name in names}
+    for path in paths:
+        LOGGER.debug("Reading FTDC file", path=path)
+        for chunk in readers.read_ftdc(path, keys=keys):
+            if not chunk or time_key not in chunk:
+                continue
+            times.append(chunk[time_key])
+            missing = np.full(chunk.nsamples, np.nan)
+            for name, key, _ in metrics:
+                values[name].append(chunk[key].astype(float) if key in chunk else missing)
+            if repl_lag:
+                values[REPL_LAG].append(chunk_repl_lag(chunk))
+    if not times:
+        return {}
+
+    times = np.concatenate(times)
+    counters = {name for name, _, counter in metrics if counter}
+    series = {}
+    for name in names:
+        metric_values = np.concatenate(values[name])
+        present = ~np.isnan(metric_values)
+        if not present.any():
+            continue
+        metric_times, metric_values = times[present], metric_values[present]
+        if name in counters:
+            metric_times, metric_values = counter_rates(metric_times, metric_values)
+        series[name] = (metric_times, metric_values)
+    return series
+
+
+def chunk_repl_lag(chunk):
+    """
+    Return the replication lag seen by a node in each sample of a chunk: how far, in ms, the
+    optimeDate of the furthest behind secondary is behind that of the primary.
+
+    The lag is NaN without replSetGetStatus data, or when there is no primary or no secondary.
+
+    :param collections.OrderedDict chunk: FTDC chunk.
+    :rtype: numpy.ndarray
+    """
+    lag = np.full(chunk.nsamples, np.nan)
+    members = rules.get_repl_members(chunk)
+    optimes = [('replSetGetStatus', 'members', member, 'optimeDate') for member in members]
+    states = [('replSetGetStatus', 'members', member, 'state') for member in members]
+    members = [
+        index for index, key in enumerate(optimes) if key in chunk and states[index] in chunk
+    ]
+    if not members:
+        return lag
+    optime = np.array([chunk[optimes[index]] for index in members], dtype=float)
+    state = np.array([chunk[states[index]] for index in members])
+    primary = np.where(state == PRIMARY, optime, -np.inf).max(axis=0)
+    secondary = np.where(state == SECONDARY, optime, np.inf).min(axis=0)
+    both = np.isfinite(primary) & np.isfinite(secondary)
+    lag[both] = np.maximum(primary[both] - secondary[both], 0)
+    return lag
+
+
+def counter_rates(times, values):
+    """
+    Convert the samples of a counter to rates per second.
+
+    Each rate is the increase since the previous sample, at the time of the later sample. A counter
+    that goes down was reset, e.g. by a restart of mongod, and counted up from 0 since. Samples
+    with the same time as the previous one are dropped.
+
+    >>> counter_rates(np.array([0, 1000, 2000, 3000]), np.array([5., 15., 35., 10.]))[1].tolist()
+    [10.0, 20.0, 10.0]
+
+    :param numpy.ndarray times: The times of the samples, in ms.
+    :param numpy.ndarray values: The counter at each sample.
+    :rtype: (numpy.ndarray, numpy.ndarray) The times and rates.
+    """
+    elapsed = np.diff(times) / MS
+    increase = np.diff(values)
+    increase = np.where(increase < 0, values[1:], increase)
+    later = elapsed > 0
+    return times[1:][later], increase[later] / elapsed[later]
+
+
+def lttb(x, y, max_points):  # pylint: disable=too-many-locals
+    """
+    Return the indexes of at most `max_points` points of (x, y) that keep its shape, chosen with
+    Largest-Triangle-Three-Buckets.
+
+    The first and last points are kept. The points in between are split into max_points - 2
+    buckets, and the point of each bucket that makes the largest triangle with the point kept from
+    the previous bucket and the average of the next bucket is kept.
+
+    >>> lttb(np.arange(5.0), np.array([0., 5., 0., 0., 0.]), 3).tolist()
+    [0, 1, 4]
+
+    :param numpy.ndarray x: Increasing x values, e.g. times.
+    :param numpy.ndarray y: The y values.
+    :param int max_points: The maximum number of points to keep.
+    :rtype: numpy.ndarray
+    """
+    npoints = len(x)
+    if max_points >= npoints or max_points < 3:
+        return np.arange(npoints)
+    x = x.astype(float)
+    y = y.astype(float)
+    nbuckets = max_points - 2
+    # Bucket i is x[bounds[i]:bounds[i + 1]], the last point is a bucket of its own.
+    bounds = (np.arange(nbuckets + 1) * (npoints - 2) // nbuckets + 1).tolist() + [npoints]
+    sum_x = np.concatenate(([0.0], np.cumsum(x)))
+    sum_y = np.concatenate(([0.0], np.cumsum(y)))
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0] = 0
+    previous = 0
+    for bucket in range(nbuckets):
+        start, end, next_end = bounds[bucket], bounds[bucket + 1], bounds[bucket + 2]
+        average_x = (sum_x[next_end] - sum_x[end]) / (next_end - end)
+        average_y = (sum_y[next_end] - sum_y[end]) / (next_end - end)
+        areas = np.abs((x[previous] - average_x) * (y[start:end] - y[previous]) -
+                       (x[previous] - x[start:end]) * (average_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    selected[-1] = npoints - 1
+    return selected
+
+
+def downsample_series(series, max_points):
+    """
+    Downsample each time series of `series` to at most `max_points` points, see lttb().
+
+    :param dict series: See read_series().
+    :param int max_points: The maximum number of points per metric.
+    :rtype: dict
+    """
+    downsampled = {}
+    for name, (times, values) in series.items():
+        kept = lttb(times, values, max_points)
+        downsampled[name] = (times[kept], values[kept])
+    return downsampled
+
+
+def write_series(directory, series):
+    """
+    Write time series to the CSV and .npz files in `directory`.
+
+    :param str directory: The directory of a node, which holds its diagnostic.data.
+    :param dict series: See read_series().
+    """
+    with open(os.path.join(directory, CSV_FILE), 'w') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(['metric', 'time_ms', 'value'])
+        for name, (times, values) in sorted(series.items()):
+            writer.writerows(
+                zip([name] * len(times), times.tolist(),
+                    ('{:.6g}'.format(value) for value in values.tolist())))
+    arrays = {}
+    for name, (times, values) in series.items():
+        arrays['time.' + name] = times.astype(np.int64)
+        arrays['value.' + name] = values
+    # np.savez() adds .npz to names without it, write to a file object to use the name as is.
+    with open(os.path.join(directory, NPZ_FILE), 'wb') as npz_file:
+        np.savez_compressed(npz_file, **arrays)
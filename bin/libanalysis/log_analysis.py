@@ -1,18 +1,43 @@
 """
 analysis.py plugin: Analyze mongod.log files for suspect messages.
+
+Besides mongod.log, the rotated logs of a node (mongod.log.<suffix>) and compressed logs
+(mongod.log*.gz and mongod.log*.zst) are analyzed. Compressed logs are decompressed as a stream, and
+the bad messages of all the logs of a node are reported together, in timestamp order.
+
+With analysis.log_incremental, each log file gets a checkpoint, the hidden file
+.<log file name>.checkpoint next to it. It records how far the file was scanned and the bad
+messages found so far. The next run, e.g. of a longevity task that analyzes its logs
+periodically, only scans what was appended since. A log that was rotated, truncated or rewritten,
+or a change to the rules or the test times, falls back to a full scan.
 """
 
+import collections
+import concurrent.futures
+import gzip
+import hashlib
+import heapq
+import io
+import json
+import locale
 import os
 import os.path
+import subprocess
 import time
 
 import structlog
 
+from common.utils import atomic_write
 from . import rules
 from . import util
 
 LOGGER = structlog.get_logger(__name__)
 KEEPALIVE_TIME = time.time()
+LOG_FILENAME = "mongod.log"
+COMPRESSED_SUFFIXES = (".gz", ".zst")
+CHECKPOINT_SUFFIX = ".checkpoint"
+# The checkpoint hashes the beginning of a log file, to notice that it was rewritten.
+CHECKPOINT_PREFIX_BYTES = 4096
 
 
 def log(config, results):
@@ -27,18 +52,31 @@ def log(config, results):
     perf_json = config['test_control']['perf_json']['path']
     task = config['test_control']['task_name']
     rules_config = config['analysis']['rules']
-    new_results, _ = analyze_logs(reports, rules_config, perf_file_path=perf_json, task=task)
+    workers = util.worker_count(config, 'log_workers')
+    new_results, _ = analyze_logs(reports,
+                                  rules_config,
+                                  perf_file_path=perf_json,
+                                  task=task,
+                                  workers=workers,
+                                  incremental=config['analysis'].get('log_incremental', False))
     results.extend(new_results)
 
 
-def analyze_logs(reports_dir_path, rules_config, perf_file_path=None, task=None):
+def analyze_logs(reports_dir_path,
+                 rules_config,
+                 perf_file_path=None,
+                 task=None,
+                 workers=1,
+                 incremental=False):
+    # pylint: disable=too-many-arguments
     """
     Analyze all the "mongod.log" logs in the directory tree rooted at `reports_dir_path`,
     and return a list of test-result dictionaries ready to be placed in the report JSON generated
     by `post_run_check`/`perf_regression_check`. If you want to only analyze log messages generated
     during the time of an actual test run, and not test setup/transition, then set `perf_file_path`
     to the path of the performance results file (probably `perf.json`) generated by the test runner
-    (benchrun or mission-control), which contains relevant timestamp data.
+    (benchrun or mission-control), which contains relevant timestamp data. The log files are
+    scanned by up to `workers` processes, and only from their checkpoint if `incremental` is set.
     """
 
     results = []
@@ -52,7 +90,8 @@ def analyze_logs(reports_dir_path, rules_config, perf_file_path=None, task=None)
         except IOError:
             LOGGER.error("Failed to read file", filename=perf_file_path)
 
-    bad_logs = _get_bad_log_lines(reports_dir_path, rules_config, test_times, task)
+    bad_logs = _get_bad_log_lines(reports_dir_path, rules_config, test_times, task, workers,
+                                  incremental)
 
     for _, (log_path, bad_lines) in enumerate(bad_logs):
         result = {
@@ -83,45 +122,279 @@ def _format_log_raw(path, bad_lines):
     return msg_path_header + msg_body
 
 
-def _get_bad_log_lines(reports_dir_path, config_rules, test_times=None, task=None):
+def _get_bad_log_lines(reports_dir_path,
+                       config_rules,
+                       test_times=None,
+                       task=None,
+                       workers=1,
+                       incremental=False):
+    # pylint: disable=too-many-arguments
     """
-    Recursively search the directory `reports_dir_path` for files called "mongod.log" and identify
-    bad messages in each. `test_times` is a list of `(start, end)` `datetime` tuples specifying the
-    start and end times of the actual tests that ran, so that we can ignore log messages generated
-    during a test setup/transition phase. Return a list of (path, bad_messages) tuples, where `path`
-    is the path of the `mongod.log` and `bad_messages` is a list of the bad messages.
+    Recursively search the directory `reports_dir_path` for "mongod.log" files, rotated or
+    compressed ones included, and identify bad messages in each. `test_times` is a list of
+    `(start, end)` `datetime` tuples specifying the start and end times of the actual tests that
+    ran, so that we can ignore log messages generated during a test setup/transition phase. Return
+    a list of (path, bad_messages) tuples, one per node, where `path` is the path of the node's
+    `mongod.log` and `bad_messages` is a list of the bad messages of all its log files, in
+    timestamp order.
+
+    Each log file is scanned in a process of its own, by up to `workers` processes. With
+    `incremental`, only from its checkpoint.
     """
 
+    if test_times is not None:
+        test_times = rules.time_windows(test_times)
+    # Only what is_log_line_bad() reads from the rules, as a plain dict for the worker processes.
+    scan_rules = {
+        'bad_log_types': list(config_rules['bad_log_types']),
+        'bad_messages': list(rules.get_bad_messages(config_rules, task))
+    }
+    paths = _get_log_file_paths(reports_dir_path)
+    workers = min(workers, len(paths))
+    if workers <= 1:
+        scanned = dict(
+            _scan_log_file(path, scan_rules, test_times, task, incremental) for path in paths)
+    else:
+        LOGGER.debug("Analyzing log files", files=len(paths), workers=workers)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            scanned = dict(
+                executor.map(_scan_log_file, paths, [scan_rules] * len(paths),
+                             [test_times] * len(paths), [task] * len(paths),
+                             [incremental] * len(paths)))
+
     bad_messages_per_log = []
-    for path in _get_log_file_paths(reports_dir_path):
-        LOGGER.debug("Analyzing log file", path=path)
-        bad_messages = []
-        with open(path) as log_file:
-            # Not using list comprehension due to the need to call _print_keepalive_msg()
-            for line in log_file:
-                if line != "\n" and rules.is_log_line_bad(line, config_rules, test_times, task):
+    for node_log_path, node_paths in _group_log_files(paths).items():
+        # Each log is in timestamp order, and the bad lines always have a timestamp.
+        bad_messages = heapq.merge(*[scanned[path] for path in node_paths],
+                                   key=lambda line: rules.log_line_time(line) or 0)
+        bad_messages_per_log.append((node_log_path, list(bad_messages)))
+    return bad_messages_per_log
+
+
+def _scan_log_file(path, config_rules, test_times=None, task=None, incremental=False):
+    """
+    Return `(path, bad_messages)` for the log file at `path`, see _get_bad_log_lines(). Only the
+    lines that pass the cheap rules.log_line_prefilter() are parsed by rules.is_log_line_bad().
+    With `incremental`, the scan resumes from the checkpoint of the file, see
+    _scan_from_checkpoint().
+    """
+
+    LOGGER.debug("Analyzing log file", path=path)
+    could_be_bad = rules.log_line_prefilter(config_rules, task)
+
+    def is_bad(line):
+        return (line != "\n" and (could_be_bad is None or could_be_bad(line))
+                and rules.is_log_line_bad(line, config_rules, test_times, task))
+
+    if incremental:
+        scan_key = _scan_key(config_rules, test_times, task)
+        return path, _scan_from_checkpoint(path, is_bad, scan_key)
+    bad_messages = []
+    with open_log_file(path) as log_file:
+        # Not using list comprehension due to the need to call _print_keepalive_msg()
+        for line in log_file:
+            if is_bad(line):
+                bad_messages.append(line)
+            _print_keepalive_msg(path)
+    return path, bad_messages
+
+
+def _scan_key(config_rules, test_times, task):
+    """
+    Return a hash of what the bad messages of a log depend on, besides the log itself.
+    """
+
+    windows = None if test_times is None else [test_times.starts, test_times.ends]
+    key = json.dumps([config_rules, windows, task], sort_keys=True)
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def _checkpoint_path(path):
+    """
+    Return the path of the checkpoint of the log file at `path`.
+    """
+
+    return os.path.join(os.path.dirname(path), "." + os.path.basename(path) + CHECKPOINT_SUFFIX)
+
+
+def _prefix_hash(path, length):
+    """
+    Return the SHA-1 of the first `length` bytes of the file at `path`.
+    """
+
+    with open(path, "rb") as log_file:
+        return hashlib.sha1(log_file.read(length)).hexdigest()
+
+
+def _resume_offset(path, stat, checkpoint, scan_key):
+    """
+    Return the offset to resume scanning the log file at `path` from, or 0 if it must be scanned
+    again from the start.
+    """
+
+    if (checkpoint is None or checkpoint.get("scan_key") != scan_key
+            or checkpoint.get("inode") != stat.st_ino or stat.st_size < checkpoint["offset"]):
+        # No checkpoint, different rules, rotated or truncated.
+        return 0
+    if path.endswith(COMPRESSED_SUFFIXES) and stat.st_size != checkpoint["offset"]:
+        # A compressed log can't be resumed in the middle.
+        return 0
+    if _prefix_hash(path, checkpoint["prefix_length"]) != checkpoint["prefix_hash"]:
+        # Rewritten.
+        return 0
+    return checkpoint["offset"]
+
+
+def _scan_from_checkpoint(path, is_bad, scan_key):
+    """
+    Return the bad messages of the log file at `path`: those recorded in its checkpoint, and those
+    found in what was appended since. The checkpoint is then updated.
+
+    The checkpoint only covers complete lines. A last line that is still being written is checked,
+    and checked again once complete by the next scan. It may end in the middle of a character: its
+    undecodable bytes are replaced.
+    """
+
+    checkpoint = None
+    try:
+        with open(_checkpoint_path(path)) as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+    except FileNotFoundError:
+        pass
+    except (IOError, ValueError):
+        LOGGER.warning("Ignoring unreadable log checkpoint", path=path, exc_info=1)
+    stat = os.stat(path)
+    offset = _resume_offset(path, stat, checkpoint, scan_key)
+    bad_messages = list(checkpoint["bad_messages"]) if offset else []
+    LOGGER.debug("Resuming log scan", path=path, offset=offset)
+
+    if path.endswith(COMPRESSED_SUFFIXES):
+        if not offset:
+            with open_log_file(path) as log_file:
+                bad_messages = [line for line in log_file if is_bad(line)]
+            offset = stat.st_size
+        complete = len(bad_messages)
+    else:
+        # Read as bytes to know the offset of each line, decoded as open() decodes text.
+        encoding = locale.getpreferredencoding(False)
+        complete = len(bad_messages)
+        with open(path, "rb") as log_file:
+            log_file.seek(offset)
+            for raw_line in log_file:
+                complete_line = raw_line.endswith(b"\n")
+                line = raw_line.decode(encoding, "strict" if complete_line else "replace")
+                line = line.replace("\r\n", "\n")
+                if is_bad(line):
                     bad_messages.append(line)
+                if complete_line:
+                    offset += len(raw_line)
+                    complete = len(bad_messages)
                 _print_keepalive_msg(path)
-        bad_messages_per_log.append((path, bad_messages))
+    _save_checkpoint(
+        path, {
+            "scan_key": scan_key,
+            "inode": stat.st_ino,
+            "offset": offset,
+            "prefix_length": min(offset, CHECKPOINT_PREFIX_BYTES),
+            "prefix_hash": _prefix_hash(path, min(offset, CHECKPOINT_PREFIX_BYTES)),
+            "bad_messages": bad_messages[:complete]
+        })
+    return bad_messages
 
-    return bad_messages_per_log
+
+def _save_checkpoint(path, checkpoint):
+    """
+    Write the checkpoint of the log file at `path`. The analysis goes on without it if it can't be
+    written, e.g. in a read-only directory.
+    """
+
+    checkpoint_path = _checkpoint_path(path)
+    try:
+        with atomic_write(checkpoint_path) as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file)
+    except (IOError, OSError):
+        LOGGER.warning("Couldn't write log checkpoint", path=checkpoint_path, exc_info=1)
+
+
+def node_log_files(reports_dir_path):
+    """
+    Return the log files under `reports_dir_path`, grouped by node, see _group_log_files().
+    """
+
+    return _group_log_files(_get_log_file_paths(reports_dir_path))
+
+
+def open_log_file(path):
+    """
+    Open a log file as text, decompressing .gz files with gzip, and .zst files with the zstd
+    command, as a stream.
+    """
+
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt")
+    if path.endswith(".zst"):
+        return _ZstdLogFile(path)
+    return open(path)
+
+
+class _ZstdLogFile(object):
+    """
+    The lines of a .zst log file, decompressed by a `zstd` process.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.process = subprocess.Popen(["zstd", "--decompress", "--stdout", "--quiet", path],
+                                        stdout=subprocess.PIPE)
+        self.lines = io.TextIOWrapper(self.process.stdout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        completed = args[0] is None
+        if not completed:
+            self.process.kill()
+        self.lines.close()
+        if self.process.wait() != 0 and completed:
+            raise IOError("Failed to decompress {0}: zstd exited with {1}".format(
+                self.path, self.process.returncode))
+
+    def __iter__(self):
+        return iter(self.lines)
 
 
 def _get_log_file_paths(dir_path):
     """
-    Recursively search `dir_path` for files called "mongod.log" and return a list of their fully
-    qualified paths.
+    Recursively search `dir_path` for files called "mongod.log", rotated logs called
+    "mongod.log.<suffix>", and compressed logs, and return a list of their fully qualified paths.
     """
 
-    log_filename = "mongod.log"
     log_paths = []
     for sub_dir_path, _, filenames in os.walk(dir_path):
-        if log_filename in filenames:
-            log_paths.append(os.path.join(sub_dir_path, log_filename))
+        for filename in sorted(filenames):
+            if filename == LOG_FILENAME or filename.startswith(LOG_FILENAME + "."):
+                log_paths.append(os.path.join(sub_dir_path, filename))
 
     return log_paths
 
 
+def _group_log_files(paths):
+    """
+    Group log files by node, i.e. by directory. Return an OrderedDict from the path of the node's
+    "mongod.log" to its log files: the rotated logs in the order of their names, then the current
+    log, compressed or not.
+    """
+
+    current_logs = {LOG_FILENAME + suffix for suffix in ("", ".gz", ".zst")}
+    nodes = collections.OrderedDict()
+    for path in paths:
+        node_log_path = os.path.join(os.path.dirname(path), LOG_FILENAME)
+        nodes.setdefault(node_log_path, []).append(path)
+    for node_paths in nodes.values():
+        node_paths.sort(key=lambda path: (os.path.basename(path) in current_logs, path))
+    return nodes
+
+
 def _print_keepalive_msg(path):
     """Print a log message every 15 minutes to prevent evergreen timeouts
 
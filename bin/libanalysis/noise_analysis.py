@@ -0,0 +1,236 @@
+"""
+analysis.py plugin: Noise of the repeated runs of each test.
+
+workload_output_parser keeps each repetition of a test, thread level and metric in the
+<metric>_values list of perf.json, and reports their mean. This plugin measures how noisy they
+are, from two kinds of samples:
+
+* repetitions: the <metric>_values lists of this run, with at least 2 values.
+* runs: the value of the metric in each run found by the `history` patterns, read as in
+  change_point_detection.py, with at least `min_runs` runs.
+
+Each sample gets its mean, its coefficient of variation, a bootstrap confidence interval of the
+mean, and its outliers: the values farther than `outlier_iqr` times the interquartile range from
+the quartiles. The bootstrap resamples of all the samples of the same length are drawn together:
+each resample is a vector of counts, how many times each value was drawn, and the means of all
+the resamples of all the samples are one matrix product.
+
+A sample is noisy if its coefficient of variation is larger than `max_cv`. `repetitions` is the
+number of repetitions, or runs, for which the confidence interval would be +/- `ci_percent` of the
+mean, assuming it shrinks with the square root of the count: stable tests that are repeated more
+than that waste cluster time.
+
+The statistics of every sample are written to noise.json in the reports directory, and the noisy
+ones are added to results.json.
+"""
+
+import json
+import os
+
+import numpy as np
+import structlog
+
+from . import change_point_detection
+
+LOGGER = structlog.get_logger(__name__)
+
+DATA_FILE = 'noise.json'
+VALUES_SUFFIX = '_values'
+# The resamples of the samples of one length are evaluated in batches of at most this many counts.
+MAX_BATCH_ELEMENTS = 1 << 22
+
+
+def noise(config, results):  # pylint: disable=too-many-locals
+    """
+    analysis.py plugin: Measure the noise of the repetitions of each test, thread level and metric.
+
+    :param ConfigDict config: The global config.
+    :param ResultsFile results: Object to add results to.
+    """
+    noise_config = config['analysis'].get('noise', {})
+    random = np.random.RandomState(noise_config.get('seed', 1))
+    perf_json_path = config['test_control']['perf_json']['path']
+    perf_json = {}
+    try:
+        with open(perf_json_path) as perf_json_file:
+            perf_json = json.load(perf_json_file)
+    except IOError:
+        LOGGER.warning("Couldn't read perf.json, only checking the noise between runs.",
+                       path=perf_json_path)
+    except ValueError:
+        LOGGER.warning("Couldn't parse perf.json, only checking the noise between runs.",
+                       path=perf_json_path,
+                       exc_info=1)
+    repetitions = repetition_samples(perf_json)
+    runs, series = change_point_detection.load_history(noise_config.get('history', ['reports-*']))
+    min_runs = noise_config.get('min_runs', 5)
+    LOGGER.info("Analyzing noise.", repetitions=len(repetitions), runs=len(runs))
+
+    runs_samples = {key: values for key, (_, values) in series.items() if len(values) >= min_runs}
+    run_names = {key: [runs[index] for index in indexes] for key, (indexes, _) in series.items()}
+    rows = (_sample_rows('repetitions', repetitions, noise_config, random) +
+            _sample_rows('runs', runs_samples, noise_config, random))
+    for row in rows[len(repetitions):]:
+        key = (row['test'], row['threads'], row['metric'])
+        row['outliers'] = [run_names[key][index] for index in row['outliers']]
+    if not rows:
+        LOGGER.info("No repeated results found.")
+        return
+
+    data_path = os.path.join(config['test_control']['reports_dir_basename'],
+                             noise_config.get('data_file', DATA_FILE))
+    with open(data_path, 'w') as data_file:
+        json.dump(rows, data_file, separators=(',', ':'), sort_keys=True)
+    noisy = [row for row in rows if row['noisy']]
+    LOGGER.info("Wrote noise statistics", path=data_path, samples=len(rows), noisy=len(noisy))
+    results.add('noise-analysis',
+                'pass',
+                log_raw=format_noise(rows, noisy, noise_config.get('max_listed', 10)),
+                noisy=noisy)
+
+
+def _sample_rows(source, samples, noise_config, random):
+    """Return the statistics of each sample of `source`, flagged, in the order of their keys."""
+    keys = sorted(samples)
+    statistics = noise_statistics([samples[key] for key in keys],
+                                  resamples=noise_config.get('resamples', 1000),
+                                  confidence=noise_config.get('confidence', 0.9),
+                                  outlier_iqr=noise_config.get('outlier_iqr', 1.5),
+                                  random=random)
+    for (test, threads, metric), row in zip(keys, statistics):
+        row.update(test=test, threads=threads, metric=metric, source=source)
+        _flag(row, noise_config.get('max_cv', 0.1), noise_config.get('ci_percent', 5.0))
+    return statistics
+
+
+def repetition_samples(perf_json):
+    """
+    Return the <metric>_values lists of a perf.json document with at least 2 values.
+
+    Results under a thread level that isn't a number, e.g. 'None' for tests without thread levels,
+    are skipped, as in the results archive that the runs samples are read from.
+
+    :param dict perf_json: The contents of a perf.json file.
+    :rtype: dict((str, int, str), numpy.ndarray) The values of each (test, threads, metric).
+    """
+    samples = {}
+    for result in perf_json.get('results', []):
+        for threads, thread_results in result.get('results', {}).items():
+            try:
+                threads = int(threads)
+            except ValueError:
+                LOGGER.debug("Skipping results without a thread level",
+                             test=result['name'],
+                             threads=threads)
+                continue
+            for key, values in thread_results.items():
+                if key.endswith(VALUES_SUFFIX) and isinstance(values, list) and len(values) > 1:
+                    metric = key[:-len(VALUES_SUFFIX)]
+                    samples[(result['name'], threads, metric)] = np.array(values, dtype=float)
+    return samples
+
+
+def bootstrap_means(samples, resamples, random):
+    """
+    Return the means of `resamples` bootstrap resamples of each sample.
+
+    Each resample draws n values with replacement, the same draws for all the samples. A resample
+    is represented by how many times it drew each value, so the means are a matrix product.
+
+    :param numpy.ndarray samples: Shape (k, n), k samples of n values.
+    :param int resamples: The number of resamples.
+    :param numpy.random.RandomState random: The source of the draws.
+    :rtype: numpy.ndarray Shape (k, resamples).
+    """
+    length = samples.shape[1]
+    means = []
+    batch = max(1, MAX_BATCH_ELEMENTS // length)
+    for start in range(0, resamples, batch):
+        count = min(batch, resamples - start)
+        draws = random.randint(0, length, (count, length))
+        # counts[r, i] is the number of times resample r drew value i.
+        counts = np.bincount((draws + length * np.arange(count)[:, np.newaxis]).ravel(),
+                             minlength=count * length).reshape(count, length)
+        means.append(samples.dot(counts.T) / float(length))
+    return np.concatenate(means, axis=1)
+
+
+def noise_statistics(samples, resamples=1000, confidence=0.9, outlier_iqr=1.5, random=None):
+    # pylint: disable=too-many-locals
+    """
+    Return the noise statistics of each sample.
+
+    :param list(numpy.ndarray) samples: Samples of at least 2 values.
+    :param int resamples: The number of bootstrap resamples.
+    :param float confidence: The confidence level of the interval of the mean.
+    :param float outlier_iqr: Values farther than this many interquartile ranges from the
+                              quartiles are outliers.
+    :param numpy.random.RandomState random: The source of the resamples.
+    :rtype: list(dict) In the order of `samples`: the count, mean, standard deviation and
+            coefficient of variation (None if the mean is 0), the confidence interval and the
+            indexes of the outliers.
+    """
+    random = np.random.RandomState() if random is None else random
+    statistics = []
+    by_length = {}
+    for number, sample in enumerate(samples):
+        by_length.setdefault(len(sample), []).append(number)
+    tail = 50.0 * (1 - confidence)
+    for length, numbers in sorted(by_length.items()):
+        values = np.array([samples[number] for number in numbers], dtype=float).reshape(-1, length)
+        means = values.mean(axis=1)
+        deviations = values.std(axis=1, ddof=1)
+        ci_low, ci_high = np.percentile(bootstrap_means(values, resamples, random),
+                                        [tail, 100 - tail],
+                                        axis=1)
+        first, third = np.percentile(values, [25, 75], axis=1)
+        spread = outlier_iqr * (third - first)
+        outliers = (values < (first - spread)[:, np.newaxis]) | (values >
+                                                                 (third + spread)[:, np.newaxis])
+        for row, number in enumerate(numbers):
+            mean = float(means[row])
+            statistics.append((number, {
+                'count': length,
+                'mean': mean,
+                'stddev': float(deviations[row]),
+                'cv': float(deviations[row]) / abs(mean) if mean else None,
+                'ci_low': float(ci_low[row]),
+                'ci_high': float(ci_high[row]),
+                'outliers': np.flatnonzero(outliers[row]).tolist()
+            }))
+    return [row for _, row in sorted(statistics, key=lambda item: item[0])]
+
+
+def _flag(row, max_cv, ci_percent):
+    """Set `noisy` and the `repetitions` for a confidence interval of +/- `ci_percent`."""
+    row['noisy'] = row['cv'] is not None and row['cv'] > max_cv
+    row['repetitions'] = None
+    if row['mean']:
+        half_width = 50.0 * (row['ci_high'] - row['ci_low']) / abs(row['mean'])
+        row['repetitions'] = max(2, int(np.ceil(row['count'] * (half_width / ci_percent)**2)))
+
+
+def format_noise(rows, noisy, max_listed):
+    """
+    Return a table of the `max_listed` noisiest samples.
+
+    :param list(dict) rows: The statistics of all the samples.
+    :param list(dict) noisy: The noisy ones.
+    :param int max_listed: The number of samples listed.
+    :rtype: str
+    """
+    lines = [
+        '{0} of {1} samples are noisy.'.format(len(noisy), len(rows)),
+        '{0:>8} {1:>6} {2:>14} {3:>30} {4:>8} {5:>11}  {6}'.format('cv', 'count', 'mean',
+                                                                   'confidence interval',
+                                                                   'outliers', 'repetitions',
+                                                                   'sample')
+    ]
+    for row in sorted(noisy, key=lambda row: -row['cv'])[:max_listed]:
+        lines.append('{0:>8.3f} {1:>6} {2:>14.6g} {3:>30} {4:>8} {5:>11}  {6}'.format(
+            row['cv'], row['count'],
+            row['mean'], '[{0:.6g}, {1:.6g}]'.format(row['ci_low'], row['ci_high']),
+            len(row['outliers']), row['repetitions'] or '-',
+            '{0} {1} threads {2} ({3})'.format(row['test'], row['threads'], row['metric'],
+                                               row['source'])))
+    return '\n'.join(lines) + '\n'
@@ -15,13 +15,19 @@ from __future__ import print_function
 
 import collections
 import mmap
+import numbers
 import os
 import re
 import struct
 import zlib
+import zipfile
 import sys
 import json
 
+import numpy as np
+
+from common.utils import atomic_write
+
 def _msg(*s):
     print(' '.join(s), file=sys.stderr)
 
@@ -47,7 +53,8 @@ class BsonReaderException(Exception):
     """
     pass
 
-def _read_bson_doc(buf, at, ftdc=False):
+def _read_bson_doc(buf, at, ftdc=False, view=None):
+    # if view, a memoryview of buf, is given bindata is returned without a copy
     doc = BSON()
     doc_len = _int32.unpack_from(buf, at)[0]
     doc.bson_len = doc_len
@@ -70,10 +77,10 @@ def _read_bson_doc(buf, at, ftdc=False):
             at += 4
             v = buf[at : at+l-1] if not ftdc else None
         elif bson_type==3: # subdoc
-            v = _read_bson_doc(buf, at, ftdc)
+            v = _read_bson_doc(buf, at, ftdc, view)
             l = v.bson_len
         elif bson_type==4: # array
-            v = _read_bson_doc(buf, at, ftdc)
+            v = _read_bson_doc(buf, at, ftdc, view)
             l = v.bson_len
             if not ftdc: v = v.values() # return as array
         elif bson_type==8: # bool
@@ -82,7 +89,7 @@ def _read_bson_doc(buf, at, ftdc=False):
         elif bson_type==5: # bindata
             l = _uint32.unpack_from(buf, at)[0]
             at += 5 # length plus subtype
-            v = buf[at : at+l] if not ftdc else None
+            v = (view if view is not None else buf)[at : at+l] if not ftdc else None
         elif bson_type==7: # objectid
             v = None # xxx always ignore for now
             l = 12
@@ -114,116 +121,523 @@ def _read_bson_doc(buf, at, ftdc=False):
     assert(not 'eoo not found') # should have seen an eoo and returned
 
 
-def _decode_chunk(chunk_doc, first_only):
-    
-    # our result is a map from metric keys to list of values for each metric key
-    # a metric key is a path through the sample document represented as a tuple
-    metrics = collections.OrderedDict()
+#
+# The reference document of a chunk holds the first sample of every metric.
+# Consecutive chunks almost always have the same metrics, so the layout of
+# the reference document is parsed once into a _Schema and reused: a chunk
+# with the same layout only has its values gathered from their offsets.
+#
+
+# field names and metric keys, interned, so that chunks share them
+_names = {}
+_keys = {}
+
+# bson types of metrics: numpy dtype and size of the value. A timestamp is
+# two metrics, t and i.
+_metric_types = {
+    1: ('<f8', 8),  # double
+    8: ('u1', 1),   # bool
+    9: ('<u8', 8),  # datetime
+    16: ('<i4', 4), # int32
+    17: ('<u4', 8), # timestamp
+    18: ('<i8', 8), # int64
+}
+
+def _name(view):
+    """Interned str for the field name in view, a memoryview of its bytes."""
+    # a read-only memoryview hashes and compares like bytes, no copy needed
+    name = _names.get(view)
+    if name is None:
+        name = sys.intern(bytes(view).decode('latin1'))
+        _names[bytes(view)] = name
+    return name
+
+
+class _Schema(object):
+
+    """
+    The metric keys of a reference document and where their values are.
+
+    Strings and bindata, which are not metrics, may change length from one
+    chunk to the next, which moves everything after them. The document is
+    therefore cut into segments, separated by those variable length contents.
+    A reference document has the same layout if, after moving each segment by
+    the change in length of the contents before it, it has the same bytes as
+    this one, except for values and lengths.
+    """
+
+    def __init__(self, data):
+        self.bson_len = _int32.unpack_from(data, 0)[0]
+        self.keys = []
+        self._selection = None
+        view = memoryview(data)
+        names = _names
+        keys = _keys
+        types = [] # bson type of each metric
+        offsets = [] # offset of the value of each metric
+        lengths = [0] # offsets of the lengths of documents, strings and bindata
+        objectids = []
+        variable = [] # (length at, content start, content end)
+
+        # walk the document element by element, depth first
+        paths = []
+        path = ()
+        at = 4
+        while True:
+            bson_type = data[at]
+            if bson_type==0: # eoo, end of the current document
+                at += 1
+                if not paths:
+                    break
+                path = paths.pop()
+                continue
+            name_end = data.find(b'\0', at + 1)
+            name = names.get(view[at + 1 : name_end])
+            if name is None:
+                name = _name(view[at + 1 : name_end])
+            at = name_end + 1
+            if bson_type in _metric_types:
+                key = path + (name,)
+                if bson_type==17: # timestamp, as t and i
+                    for sub_key, offset in ((key + ('t',), at), (key + ('i',), at + 4)):
+                        self.keys.append(keys.setdefault(sub_key, sub_key))
+                        types.append(bson_type)
+                        offsets.append(offset)
+                else:
+                    self.keys.append(keys.setdefault(key, key))
+                    types.append(bson_type)
+                    offsets.append(at)
+                at += _metric_types[bson_type][1]
+            elif bson_type==3 or bson_type==4: # subdoc, array
+                lengths.append(at)
+                paths.append(path)
+                path = path + (name,)
+                at += 4
+            elif bson_type==2 or bson_type==5: # string, bindata: not metrics
+                lengths.append(at)
+                start = at + (4 if bson_type==2 else 5)
+                end = start + _uint32.unpack_from(data, at)[0]
+                variable.append((at, start, end))
+                at = end
+            elif bson_type==7: # objectid, not a metric
+                objectids.append(at)
+                at += 12
+            elif bson_type==0xff or bson_type==0x7f: # minkey, maxkey
+                pass
+            else:
+                err_msg = 'unknown type %d(%x) at %d(%x)'
+                raise BsonReaderException(err_msg % (bson_type, bson_type, at, at))
+        assert(at==self.bson_len)
+        # a duplicate field name is one metric, see _read_bson_doc
+        self.nkeys = len(set(self.keys))
+
+        # segment of each byte: the number of variable contents before it
+        self._length_at = [length_at for length_at, _, _ in variable]
+        self._lengths = [end - start for _, start, end in variable]
+        ends = np.array([end for _, _, end in variable], dtype=np.int64)
+        fixed = np.ones(self.bson_len, dtype=bool)
+        for _, start, end in variable:
+            fixed[start : end] = False
+        self._fixed = np.flatnonzero(fixed)
+        self._fixed_segment = np.searchsorted(ends, self._fixed, side='right')
+
+        # bytes that may differ: values and lengths
+        ignore = np.zeros(self.bson_len, dtype=bool)
+        ignore[(np.array(lengths)[:, None] + np.arange(4)).ravel()] = True
+        ignore[(np.array(objectids, dtype=np.int64)[:, None] + np.arange(12)).ravel()] = True
+        types = np.array(types, dtype=np.int64)
+        offsets = np.array(offsets, dtype=np.int64)
+        self._gathers = []
+        for bson_type in np.unique(types).tolist():
+            dtype = np.dtype(_metric_types[bson_type][0])
+            positions = np.flatnonzero(types==bson_type)
+            index = offsets[positions][:, None] + np.arange(dtype.itemsize)
+            ignore[index.ravel()] = True
+            segment = np.searchsorted(ends, offsets[positions], side='right')
+            self._gathers.append((positions, index, segment, dtype))
+        self._ignore = np.flatnonzero(ignore[self._fixed])
+        self._skeleton = self._strip(data, np.zeros(len(variable) + 1, dtype=np.int64))
+
+    def _strip(self, data, shifts):
+        doc = np.frombuffer(data, dtype=np.uint8)
+        stripped = doc[self._fixed + shifts[self._fixed_segment]]
+        stripped[self._ignore] = 0
+        return stripped
+
+    def shifts(self, data):
+        """
+        If the reference document in data has this layout, how far each
+        segment moved. Otherwise None.
+        """
+        shift = 0
+        shifts = [0]
+        for length_at, length in zip(self._length_at, self._lengths):
+            if length_at + shift + 4 > len(data):
+                return None
+            shift += _uint32.unpack_from(data, length_at + shift)[0] - length
+            shifts.append(shift)
+        if (_int32.unpack_from(data, 0)[0] != self.bson_len + shift or
+                len(data) < self.bson_len + shift):
+            return None
+        shifts = np.array(shifts, dtype=np.int64)
+        if not np.array_equal(self._strip(data, shifts), self._skeleton):
+            return None
+        return shifts
+
+    def values(self, data, shifts):
+        """The values of the reference document in data, as int64."""
+        doc = np.frombuffer(data, dtype=np.uint8)
+        values = np.empty(len(self.keys), dtype=np.int64)
+        for positions, index, segment, dtype in self._gathers:
+            values[positions] = doc[index + shifts[segment][:, None]].view(dtype)[:, 0]
+        return values
+
+    def rows(self, selection):
+        """Indexes of the keys in selection, a _Selection, or all."""
+        if self._selection is None or self._selection[0] is not selection:
+            if selection is None:
+                rows = np.arange(len(self.keys))
+            else:
+                rows = np.array([i for i, key in enumerate(self.keys) if key in selection],
+                                dtype=np.int64)
+            self._selection = (selection, rows)
+        return self._selection[1]
+
+
+def _decode_chunk(chunk_doc, first_only, keys=None, schema=None):
+
+    """
+    Decode a chunk. schema is the _Schema of the previous chunk, if any.
+    Returns the chunk, a map from metric keys to the values of each metric
+    key, and the _Schema of this chunk. A metric key is a path through the
+    sample document represented as a tuple.
+    """
 
     # decompress chunk data field
     data = chunk_doc['data']
-    metrics.chunk_len = len(data)
+    chunk_len = len(data)
     data = data[4:] # skip uncompressed length, we don't need it
     data = zlib.decompress(data)
 
-    # read reference doc from chunk data, ignoring non-metric fields
-    ref_doc = _read_bson_doc(data, 0, ftdc=True)
-    #print_bson_doc(ref_doc)
-
-    # traverse the reference document and extract map from metrics keys to values
-    def extract_keys(doc, n=()):
-        for k, v in doc.items():
-            nn = n + (k,)
-            if type(v)==BSON:
-                extract_keys(v, nn)
-            else:
-                metrics[nn] = [v]
-    extract_keys(ref_doc)
+    # the layout of the reference doc, ignoring non-metric fields
+    shifts = schema.shifts(data) if schema is not None else None
+    if shifts is None:
+        schema = _Schema(data)
+        shifts = schema.shifts(data)
+    bson_len = _int32.unpack_from(data, 0)[0]
 
     # get nmetrics, ndeltas
-    nmetrics = _uint32.unpack_from(data, ref_doc.bson_len)[0]
-    ndeltas = _uint32.unpack_from(data, ref_doc.bson_len+4)[0]
+    nmetrics = _uint32.unpack_from(data, bson_len)[0]
+    ndeltas = _uint32.unpack_from(data, bson_len+4)[0]
     nsamples = ndeltas + 1
-    at = ref_doc.bson_len + 8
-    if nmetrics != len(metrics):
+    at = bson_len + 8
+    if nmetrics != schema.nkeys or nmetrics != len(schema.keys):
         # xxx remove when SERVER-20602 is fixed
         _msg('ignoring bad chunk: nmetrics=%d, len(metrics)=%d' % (
-            nmetrics, len(metrics)))
-        return None
+            nmetrics, schema.nkeys))
+        return None, schema
+
+    # rows of the requested metrics, in the order of the reference doc
+    rows = schema.rows(keys)
+    metrics = collections.OrderedDict()
+    metrics.chunk_len = chunk_len
     metrics.nsamples = nsamples
+    first = schema.values(data, shifts)[rows]
 
     # only want first value in every chunk?
     if first_only:
-        return metrics
-
-    # unpacks ftdc packed ints
-    def unpack(data, at):
-        res = 0
-        shift = 0
-        while True:
-            b = data[at]
-            res |= (b&0x7F) << shift
-            at += 1
-            if not (b&0x80):
-                if res > 0x7fffffffffffffff: # negative 64-bit value
-                    res = int(res-0x10000000000000000)
-                return res, at
-            shift += 7
-
-    # unpack, run-length, delta, transpose the metrics
-    nzeroes = 0
-    for metric_values in metrics.values():
-        value = metric_values[-1]
-        for _ in range(ndeltas):
-            if nzeroes:
-                delta = 0
-                nzeroes -= 1
-            else:
-                delta, at = unpack(data, at)
-                if delta==0:
-                    nzeroes, at = unpack(data, at)
-            value += delta
-            metric_values.append(value)
-    assert(at==len(data))
+        for row, value in zip(rows, first):
+            metrics[schema.keys[row]] = np.array([value], dtype=np.int64)
+        return metrics, schema
+
+    # unpack, run-length, delta, transpose the requested metrics, all vectorized
+    values = np.empty((len(rows), nsamples), dtype=np.int64)
+    values[:, 0] = first
+    values[:, 1:] = _unpack_deltas(data, at, nmetrics, ndeltas, rows)
+    np.cumsum(values, axis=1, out=values)
+    for row, metric_values in zip(rows, values):
+        metrics[schema.keys[row]] = metric_values
 
     # our result
-    return metrics
+    return metrics, schema
+
+
+class _Selection(object):
+
+    """The metric keys, or prefixes of metric keys, passed to read_ftdc."""
+
+    def __init__(self, keys):
+        self._prefixes = collections.defaultdict(set)
+        for key in keys:
+            key = tuple(key) if not isinstance(key, str) else (key,)
+            self._prefixes[len(key)].add(key)
+        self._selected = {}
+
+    def __contains__(self, key):
+        """Is the metric key one of the keys, or under one of the prefixes?"""
+        selected = self._selected.get(key)
+        if selected is None:
+            selected = any(key[:length] in prefixes
+                           for length, prefixes in self._prefixes.items())
+            self._selected[key] = selected
+        return selected
+
+
+def _decode_varints(buf, starts, ends):
+    """
+    Decode the varints at buf[starts[i]:ends[i]+1]: 7 bits per byte, least significant first.
+    """
+    if not len(starts):
+        return np.zeros(0, dtype=np.int64)
+    lengths = ends - starts + 1
+    offsets = np.cumsum(lengths) - lengths
+    position = np.arange(lengths.sum()) - np.repeat(offsets, lengths)
+    index = np.repeat(starts, lengths) + position
+    shifted = (buf[index] & 0x7F).astype(np.uint64) << (7 * position).astype(np.uint64)
+    return np.bitwise_or.reduceat(shifted, offsets).view(np.int64)
 
 
-def read_ftdc(fn, first_only = False):
+def _unpack_deltas(data, at, nmetrics, ndeltas, rows=None):
+    """
+    Decode the ftdc packed deltas in data[at:]: a sequence of varints, where a 0 is followed by
+    the number of additional 0s. The deltas are stored metric by metric, ndeltas per metric.
+    Returns the deltas of the metrics in rows (default all) as an int64 array of shape
+    (len(rows), ndeltas).
+
+    Every varint has to be scanned to find where the deltas of a metric start, but only the run
+    lengths and the deltas of the requested metrics are decoded.
+    """
+    if rows is None:
+        rows = np.arange(nmetrics)
+    deltas = np.zeros((len(rows), ndeltas), dtype=np.int64)
+    buf = np.frombuffer(data, dtype=np.uint8, offset=at)
+    if not ndeltas or not nmetrics:
+        assert(len(buf)==0)
+        return deltas
+
+    # varint boundaries: the last byte of each varint has the high bit clear
+    last = buf < 0x80
+    assert(len(buf) and last[-1])
+    ends = np.flatnonzero(last)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+
+    # a 0 is a run marker, followed by a count, unless it is a count itself. Within a sequence of
+    # 0s, markers and counts alternate, starting with a marker (a nonzero is never a marker, and
+    # what follows a nonzero is never a count). A 0 is a single 0 byte.
+    zero = (starts == ends) & (buf[ends] == 0)
+    first_zero = zero & ~np.concatenate(([False], zero[:-1]))
+    run_start = np.flatnonzero(first_zero)
+    run_id = np.maximum(np.cumsum(first_zero) - 1, 0)
+    index_in_run = np.arange(len(ends)) - run_start[run_id] if len(run_start) else 0
+    marker = zero & (index_in_run % 2 == 0)
+    count = np.concatenate(([False], marker[:-1]))
+
+    # where each varint lands in the expanded deltas: a marker is 1 + count zeros, a count expands
+    # to nothing, any other value to itself
+    repeats = np.where(count, 0, 1)
+    counts = np.flatnonzero(count)
+    repeats[counts - 1] += _decode_varints(buf, starts[counts], ends[counts])
+    offsets = np.cumsum(repeats) - repeats
+    assert(offsets[-1] + repeats[-1] >= nmetrics * ndeltas)
+
+    # zeros are already in place, decode the other values of the requested metrics only
+    wanted = np.full(nmetrics, -1, dtype=np.int64)
+    wanted[rows] = np.arange(len(rows))
+    value = np.flatnonzero(~zero & ~count & (offsets < nmetrics * ndeltas))
+    row = wanted[offsets[value] // ndeltas]
+    value, row = value[row >= 0], row[row >= 0]
+    deltas[row, offsets[value] % ndeltas] = _decode_varints(buf, starts[value], ends[value])
+    return deltas
+
+
+# Decoded chunks of selective reads are looked up in, and added to, this
+# cache if it is set. See ftdc_cache.py.
+_cache = None
+
+def set_cache(cache):
+    """Use cache (an ftdc_cache.FtdcCache, or None) in read_ftdc. Returns the previous cache."""
+    global _cache
+    previous = _cache
+    _cache = cache
+    return previous
+
+
+def read_ftdc(fn, first_only = False, keys = None, time_range = None):
 
     """
     Read an ftdc file. fn may be either a single metrics file, or a
     directory containing a sequence of metrics files.
+
+    keys restricts the chunks to the metrics that are needed: an iterable of
+    metric keys, e.g. ('serverStatus', 'connections', 'current'), or prefixes
+    of metric keys, e.g. ('replSetGetStatus', 'members') for the metrics of
+    all members. Other metrics are skipped over but not decoded. By default
+    all metrics are returned. Selective reads go through the cache set with
+    set_cache(), if any.
+
+    time_range restricts the chunks to those with samples in a (start, end)
+    range of times, in ms since the epoch, or in any of a list of such
+    ranges. Only those chunks are decoded, found with the time index of the
+    file, see read_index(). They are returned whole, samples outside of the
+    range included. Bad chunks are skipped.
     """
 
     # process dir
     if os.path.isdir(fn):
         for f in sorted(os.listdir(fn)):
-            for chunk in read_ftdc(os.path.join(fn, f)):
-                yield chunk
+            if not f.startswith('.'): # skip time indexes
+                for chunk in read_ftdc(os.path.join(fn, f), first_only, keys, time_range):
+                    yield chunk
+
+    # process file, through the cache if there is one
+    elif time_range is not None:
+        for chunk in _read_ftdc_file(fn, first_only, keys, time_range):
+            yield chunk
+    elif _cache is not None and keys is not None:
+        for chunk in _cache.read(fn, first_only, keys, _read_ftdc_file):
+            yield chunk
+    else:
+        for chunk in _read_ftdc_file(fn, first_only, keys):
+            yield chunk
+
+
+def _read_ftdc_file(fn, first_only, keys, time_range=None):
 
-    # process file
+    # open and map file
+    f = open(fn)
+    buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(buf)
+    selection = _Selection(keys) if keys is not None else None
+    schema = None
+
+    # only the chunks in the time range, or all type 1 chunks
+    if time_range is not None:
+        chunk_docs = ((at, _read_bson_doc(buf, at, view=view))
+                      for at in _overlapping(read_index(fn), time_range))
     else:
+        chunk_docs = _chunk_docs(buf, view)
+
+    for _, chunk_doc in chunk_docs:
+        chunk, schema = _decode_chunk(chunk_doc, first_only, selection, schema)
+        if chunk is not None or time_range is None:
+            yield chunk
+
+
+def _chunk_docs(buf, view):
+
+    """The offset and bson doc of each type 1 chunk in buf, an ftdc file."""
+
+    # traverse the file reading type 1 chunks
+    at = 0
+    while at < len(buf):
+        try:
+            chunk_doc = _read_bson_doc(buf, at, view=view)
+            if chunk_doc['type']==1:
+                yield at, chunk_doc
+            at += chunk_doc.bson_len
+        except Exception as e:
+            print('bad bson doc: ')
+            raise
+
+    # bson docs should exactly cover file
+    assert(at==len(buf))
 
-        # open and map file
-        f = open(fn)
-        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
-        at = 0
-
-        # traverse the file reading type 1 chunks
-        while at < len(buf):
-            try:
-                chunk_doc = _read_bson_doc(buf, at)
-                at += chunk_doc.bson_len
-                if chunk_doc['type']==1:
-                    yield _decode_chunk(chunk_doc, first_only)
-            except Exception as e:
-                print('bad bson doc: ')
-                raise
-
-        # bson docs should exactly cover file
-        assert(at==len(buf))
+
+def read_ftdc_bytes(buf, first_only = False, keys = None):
+
+    """
+    Decode the complete chunks at the start of buf, the bytes of an ftdc file
+    that may still be written to, e.g. read while mongod is running. Returns
+    the chunks, as read_ftdc() yields them, and the number of bytes of whole
+    bson docs: a doc at the end of buf that is not complete yet is left for
+    the next call, with the bytes that follow it.
+    """
+
+    view = memoryview(buf)
+    selection = _Selection(keys) if keys is not None else None
+    schema = None
+    chunks = []
+    at = 0
+    while at + 4 <= len(buf) and at + _int32.unpack_from(buf, at)[0] <= len(buf):
+        chunk_doc = _read_bson_doc(buf, at, view=view)
+        if chunk_doc['type']==1:
+            chunk, schema = _decode_chunk(chunk_doc, first_only, selection, schema)
+            chunks.append(chunk)
+        at += chunk_doc.bson_len
+    return chunks, at
+
+#
+# time index of an ftdc file, stored next to it in a hidden sidecar file:
+# .<file name>.index
+#
+
+INDEX_SUFFIX = '.index'
+_TIME_KEY = ('start',)
+
+def _index_path(fn):
+    directory, name = os.path.split(fn)
+    return os.path.join(directory, '.' + name + INDEX_SUFFIX)
+
+
+def read_index(fn):
+
+    """
+    The time index of the ftdc file fn: for each type 1 chunk, its offset in
+    the file, the times of its first and last samples in ms since the epoch,
+    and its number of samples, as an int64 array of shape (nchunks, 4). A bad
+    chunk, or one without times, has times of -1 and 0 samples.
+
+    The index is read from its sidecar file, or built with a pass over the
+    file that only decodes the times and (re)written if the file changed.
+    """
+
+    stat = os.stat(fn)
+    path = _index_path(fn)
+    try:
+        with np.load(path, allow_pickle=False) as index_file:
+            if index_file['stat'].tolist() == [stat.st_size, stat.st_mtime_ns]:
+                return index_file['chunks']
+    except (IOError, ValueError, KeyError, zipfile.BadZipFile):
+        pass
+
+    f = open(fn)
+    buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(buf)
+    selection = _Selection([_TIME_KEY])
+    schema = None
+    rows = []
+    for at, chunk_doc in _chunk_docs(buf, view):
+        chunk, schema = _decode_chunk(chunk_doc, False, selection, schema)
+        if chunk is None or _TIME_KEY not in chunk:
+            rows.append((at, -1, -1, 0))
+        else:
+            times = chunk[_TIME_KEY]
+            rows.append((at, times.min(), times.max(), chunk.nsamples))
+    chunks = np.array(rows, dtype=np.int64).reshape(len(rows), 4)
+
+    # the index is only an optimization: if it can't be written, e.g. in a
+    # read only directory, it is built again next time
+    try:
+        with atomic_write(path, 'wb') as index_file:
+            np.savez(index_file, stat=np.array([stat.st_size, stat.st_mtime_ns]), chunks=chunks)
+    except (IOError, OSError) as e:
+        _msg('could not write ftdc index %s: %s' % (path, e))
+    return chunks
+
+
+def _overlapping(index, time_range):
+
+    """The offsets of the chunks in index with samples in time_range."""
+
+    if len(time_range) and isinstance(time_range[0], numbers.Number):
+        time_range = [time_range]
+    first, last = index[:, 1], index[:, 2]
+    selected = np.zeros(len(index), dtype=bool)
+    for start, end in time_range:
+        selected |= (index[:, 3] > 0) & (first <= end) & (last >= start)
+    return index[selected, 0].tolist()
 
 #
 # xxx does not correctly handle schema change from one line to the next
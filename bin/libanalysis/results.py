@@ -124,6 +124,18 @@ class ResultsFile(object):
         #if status == 'fail':
         #self.data['failures'] = self.data['failures'] + 1
 
+    def add_plugin_stats(self, plugin, **stats):
+        """
+        Record the resources used by an analysis plugin, under 'plugins'.
+
+        :param str plugin: The name of the plugin.
+        :param stats: The wall time, CPU time and peak memory of the plugin, see
+                      analysis.run_plugin().
+        """
+        plugin_stats = {'plugin': plugin}
+        plugin_stats.update(stats)
+        self.data.setdefault('plugins', []).append(plugin_stats)
+
     def extend(self, results):
         """
         Add results to self.data directly.
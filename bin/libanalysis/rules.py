@@ -4,16 +4,18 @@ Module of constants and rules used in our resource sanity checks. Used in post_r
 
 from __future__ import print_function
 
-from datetime import datetime
+import bisect
+from datetime import datetime, timedelta, timezone
+import functools
 import json
 import logging
 import math
 import os
 import re
 from dateutil import parser as date_parser
+import numpy as np
 
 from . import readers
-from . import util
 
 LOGGER = logging.getLogger(__name__)
 
@@ -80,6 +82,13 @@ FTDC_KEYS = {
     'repl_set_status': ('replSetGetStatus', 'members', '([0-9])+')
 }
 
+# The metrics, or prefixes of metrics, that the resource rules use. Only these are decoded from the
+# FTDC files.
+REPL_MEMBERS_PREFIX = ('replSetGetStatus', 'members')
+FTDC_RULE_KEYS = tuple(
+    key for name, key in FTDC_KEYS.items() if name != 'repl_set_status') + (REPL_MEMBERS_PREFIX, )
+REPL_LAG_KEYS = (FTDC_KEYS['time'], REPL_MEMBERS_PREFIX)
+
 FLAG_MEMBER_STATES = {3: 'RECOVERING', 6: 'UNKNOWN', 8: 'DOWN', 9: 'ROLLBACK', 10: 'REMOVED'}
 STARTUP_MEMBER_STATES = {0: 'STARTUP', 5: 'STARTUP2'}
 
@@ -105,12 +114,38 @@ REPL_MEMBER_LAG_RESET_MS = REPL_MEMBER_LAG_RESET_S * MS
 def is_log_line_bad(log_line, rules, test_times=None, task=None):
     """
     Return whether or not `log_line`, a line from a log file, is suspect. Only messages that were
-    printed during the time a test was run (as specified in `test_times`) are considered, unless
-    `test_times` is None.
+    printed during the time a test was run (as specified in `test_times`, a list of (start, end)
+    datetimes or their TimeWindows) are considered, unless `test_times` is None.
     """
-    # pylint: disable=too-many-branches
-
     log_line = log_line.strip()
+    timestamp, err_type_char, log_msg, error = _parse_log_line(log_line)
+
+    if error is not None:
+        LOGGER.warning("Couldn't parse log line. Error: `%s`. Line: `%s`", error, log_line)
+        return False
+
+    try:
+        log_ts = date_parser.parse(timestamp)
+    except ValueError as err:
+        LOGGER.warning("Failed to parse timestamp from line `%s` with error `%s`", log_line, err)
+        return False
+
+    if test_times is not None and not time_windows(test_times).contains_date(log_ts):
+        return False
+
+    log_msg = log_msg.lower()
+    if _messages_pattern(tuple(MESSAGE_WHITELIST)).search(log_msg):
+        return False
+
+    return err_type_char in rules['bad_log_types'] or bool(
+        _messages_pattern(tuple(get_bad_messages(rules, task))).search(log_msg))
+
+
+def _parse_log_line(log_line):
+    """
+    Return the timestamp, the severity and the message of a stripped log line, or the error that
+    prevented parsing it, as (timestamp, err_type_char, log_msg, error).
+    """
     timestamp = err_type_char = log_msg = error = None
 
     try:
@@ -141,29 +176,61 @@ def is_log_line_bad(log_line, rules, test_times=None, task=None):
                         pass
         except Exception as e:  # pylint: disable=broad-except
             error = e
+    return timestamp, err_type_char, log_msg, error
 
-    if error is not None:
-        LOGGER.warning("Couldn't parse log line. Error: `%s`. Line: `%s`", error, log_line)
-        return False
 
-    try:
-        log_ts = date_parser.parse(timestamp)
-    except ValueError as err:
-        LOGGER.warning("Failed to parse timestamp from line `%s` with error `%s`", log_line, err)
-        return False
+def log_line_time(log_line):
+    """
+    Return the time of a log line, in ms since the epoch, or None if it can't be parsed.
 
+    :type log_line: str
+    :rtype: float|None
+    """
+    timestamp, _, _, error = _parse_log_line(log_line.strip())
+    if error is not None:
+        return None
     try:
-        if test_times is not None and not any(start <= log_ts <= end for start, end in test_times):
-            return False
-    except TypeError as err:
-        LOGGER.warning("Failed timestamp comparison. Log_line is %s", log_line)
+        return date_to_ms(date_parser.parse(timestamp))
+    except (ValueError, TypeError, OverflowError):
+        return None
 
-    log_msg = log_msg.lower()
-    if any(whitelist_msg in log_msg for whitelist_msg in MESSAGE_WHITELIST):
-        return False
 
-    return err_type_char in rules['bad_log_types'] or any(
-        bad_msg in log_msg for bad_msg in get_bad_messages(rules, task))
+@functools.lru_cache(maxsize=16)
+def _messages_pattern(messages):
+    """One compiled regex that finds any of `messages`, rather than a search for each of them."""
+    if not messages:
+        return re.compile('(?!)')
+    return re.compile('|'.join(re.escape(message) for message in messages))
+
+
+def log_line_prefilter(rules, task=None):
+    """Return a cheap check of whether a log line could be bad, to skip the parsing of the lines
+    that is_log_line_bad() would never flag.
+
+    A line is only skipped if its severity isn't one of the bad_log_types, and its lowercase text
+    doesn't contain any of the bad messages. Lines with escapes or non-ASCII characters, and
+    structured log lines whose message is formatted from its attributes, are always checked, since
+    their message isn't found as is in the line.
+
+    :param dict rules: the rules config, see is_log_line_bad().
+    :param str task: the name of the task
+    :rtype: callable|None a function of a log line that returns whether it could be bad, or None if
+            every line must be checked.
+    """
+    bad_messages = tuple(get_bad_messages(rules, task))
+    if any(not message.isascii() or set(message) & set('{}"\\') for message in bad_messages):
+        return None
+    log_types = '|'.join(re.escape(log_type) for log_type in rules['bad_log_types']) or '(?!)'
+    # The severity of a legacy or a structured log line, and a structured message with arguments.
+    candidate = re.compile(
+        r'^\s*[^ ]* (?:{0}) |"s"\s*:\s*"(?:{0})"|"msg"\s*:\s*"[^"]*[{{}}]'.format(log_types))
+    bad_message = _messages_pattern(bad_messages)
+
+    def could_be_bad(log_line):
+        return (not log_line.isascii() or '\\' in log_line or candidate.search(log_line) is not None
+                or bad_message.search(log_line.lower()) is not None)
+
+    return could_be_bad
 
 
 def ftdc_date_parse(time_in_s):
@@ -212,6 +279,20 @@ def failure_collection(failure_times,
     return rule_info
 
 
+def _failures_above(values, times, threshold):
+    """Helper function to find the samples where a metric is above a threshold.
+
+    :param numpy.ndarray values: the metric values of a chunk
+    :param list[int] times: the time at which each metric value was collected
+    :param float threshold: the largest value that doesn't fail
+    :rtype: (list[int], list[tuple(int)]) the failure times and compared values, see
+            failure_collection()
+    """
+    values = np.asarray(values)
+    failed = np.flatnonzero(values > threshold)
+    return np.asarray(times)[failed].tolist(), [(value, ) for value in values[failed].tolist()]
+
+
 def _fetch_constant(chunk, key):
     if key in chunk:
         return chunk[key][0]
@@ -276,17 +357,11 @@ def below_configured_cache_size(chunk, times, configured_cache_size):
     if FTDC_KEYS['cache_size'] not in chunk:
         return {}
 
-    cache_size_values = chunk[FTDC_KEYS['cache_size']]
-
-    failure_times = []
     labels = ('current cache size (bytes)', )
-    compared_values = []
     additional = {'WT configured cache size (bytes)': configured_cache_size}
-
-    for index, cache_size in enumerate(cache_size_values):
-        if cache_size > (1 + CACHE_ALLOCATOR_OVERHEAD) * configured_cache_size:
-            failure_times.append(times[index])
-            compared_values.append((cache_size, ))
+    threshold = (1 + CACHE_ALLOCATOR_OVERHEAD) * configured_cache_size
+    failure_times, compared_values = _failures_above(chunk[FTDC_KEYS['cache_size']], times,
+                                                     threshold)
     return failure_collection(failure_times, compared_values, labels, additional)
 
 
@@ -317,9 +392,7 @@ def max_connections(chunk, times, max_thread_level, repl_member_list):
     fudge_factor = 20
     if max_thread_level > fudge_factor:
         fudge_factor = int(math.ceil(max_thread_level * 1.8))
-    failure_times = []
     labels = ('number of current connections', )
-    compared_values = []
     additional = {
         'max thread level for this task':
             max_thread_level,
@@ -334,10 +407,7 @@ def max_connections(chunk, times, max_thread_level, repl_member_list):
                 upper_bound_factor, fudge_factor)
     }
     threshold = (max_thread_level * 2) + 2 + upper_bound_factor + fudge_factor
-    for index, num_connections in enumerate(curr_connection_values):
-        if num_connections > threshold:
-            failure_times.append(times[index])
-            compared_values.append((num_connections, ))
+    failure_times, compared_values = _failures_above(curr_connection_values, times, threshold)
     return failure_collection(failure_times, compared_values, labels, additional)
 
 
@@ -354,18 +424,13 @@ def below_configured_oplog_size(chunk, times, configured_oplog_size):
     oplog_size_values = chunk[FTDC_KEYS['oplog_size']]
     upper_bound_factor = (1 + WT_OPLOG_BUFFER)
 
-    failure_times = []
     labels = ('current oplog size (MB)', )
-    compared_values = []
     additional = {
         'WT configured max oplog size (MB)': configured_oplog_size,
         'rule': 'current size <= (max size * {0})'.format(upper_bound_factor)
     }
-
-    for index, oplog_size in enumerate(oplog_size_values):
-        if oplog_size > configured_oplog_size * upper_bound_factor:
-            failure_times.append(times[index])
-            compared_values.append((oplog_size, ))
+    failure_times, compared_values = _failures_above(oplog_size_values, times,
+                                                     configured_oplog_size * upper_bound_factor)
     return failure_collection(failure_times, compared_values, labels, additional)
 
 
@@ -381,24 +446,20 @@ def repl_member_state(chunk, times, repl_member_list, test_times=None):
     """
     # We want to disregard FTDC data collected when a test is not being run.
     # This whitelists the indices where metrics were collected for a test workload.
-    test_run_indices = _get_whitelist_from_test_times(chunk, test_times)
+    test_run_indices = np.asarray(_get_whitelist_from_test_times(chunk, test_times), dtype=int)
 
     member_states = {}
     for member in repl_member_list:
         member_state_key = ('replSetGetStatus', 'members', member, 'state')
         if member_state_key not in chunk:
             continue
-        member_state_values = chunk[member_state_key]
+        member_state_values = np.asarray(chunk[member_state_key])[test_run_indices]
 
-        failure_times = []
         labels = ('member ' + member + ' state', )
-        compared_values = []
-
-        for index in test_run_indices:
-            state = member_state_values[index]
-            if state in FLAG_MEMBER_STATES:
-                failure_times.append(times[index])
-                compared_values.append((FLAG_MEMBER_STATES[state], ))
+        flagged = np.isin(member_state_values, list(FLAG_MEMBER_STATES))
+        failure_times = np.asarray(times)[test_run_indices[flagged]].tolist()
+        compared_values = [(FLAG_MEMBER_STATES[state], )
+                           for state in member_state_values[flagged].tolist()]
         failure = failure_collection(failure_times, compared_values, labels)
         if failure:
             member_states[member] = failure
@@ -439,45 +500,78 @@ def ftdc_replica_lag_check(path_to_ftdc_file, test_times=None):
     :rtype: list[dict] each dict corresponds to failure info for a different primary member.
             (accounts for possible election in the middle of a task)
     """
-    repl_member_list = []
-    collect_by_primary = []  # in case election occurs, lag info is specific to each primary
+    check = ReplicaLagCheck(test_times)
+    for chunk in readers.read_ftdc(path_to_ftdc_file,
+                                   keys=REPL_LAG_KEYS,
+                                   time_range=check.time_range):
+        check.visit(chunk)
+    return check.failures()
 
-    lag_info_dict = {'times': []}
-    current_primary = None
 
-    for chunk in readers.read_ftdc(path_to_ftdc_file):
-        if not repl_member_list:  # need a list of members in the replica set
-            repl_member_list = get_repl_members(chunk)  # is there member info in this chunk?
-            if not repl_member_list:
-                continue
-        primary = find_primary(chunk, repl_member_list)
+class ReplicaLagCheck(object):
+    """The ftdc_replica_lag_check rule, as a visitor of the chunks of an FTDC file.
+
+    visit() is called with each chunk of the file in order, and failures() once all the chunks
+    were visited. ftdc_analysis.py thereby checks this rule on the chunks it decodes for the chunk
+    rules, instead of decoding the file again.
+    """
+    def __init__(self, test_times=None):
+        """
+        :param list[(datetime, datetime)] test_times: list of (start, end) test times.
+            Use this to ignore problematic lag value if it doesn't occur during a test run.
+        """
+        self.test_times = test_times
+        self.time_range = test_times_to_ms(test_times) if test_times else None
+        self.repl_member_list = []
+        self.collect_by_primary = [
+        ]  # in case election occurs, lag info is specific to each primary
+        self.lag_info_dict = {'times': []}
+        self.current_primary = None
+
+    def visit(self, chunk):
+        """Collect the lag of the secondaries in a chunk.
+
+        :param collection.OrderedDict chunk: FTDC JSON chunk
+        """
+        # Only the chunks with samples during a test are checked. The others would be skipped
+        # anyway, but may still hold an election: the lag is then grouped by the primary during the
+        # tests.
+        chunk_times = chunk[FTDC_KEYS['time']]
+        if self.time_range and not _overlaps(chunk_times, self.time_range):
+            return
+        if not self.repl_member_list:  # need a list of members in the replica set
+            self.repl_member_list = get_repl_members(chunk)  # is there member info in this chunk?
+            if not self.repl_member_list:
+                return
+        primary = find_primary(chunk, self.repl_member_list)
         if not primary:  # skip if no primary
-            continue
+            return
         # a primary member has been identified. check the newly fetched primary against our
         # currently declared primary
-        if not current_primary:
-            current_primary = primary
-        elif primary is not current_primary:
+        if not self.current_primary:
+            self.current_primary = primary
+        elif primary is not self.current_primary:
             # an election has occurred. in this case, we store the information gathered thus far
             # using our currently declared primary and reset the necessary variables as we move
             # forward with the newly named primary
-            collect_by_primary.append(lag_info_dict)
-            lag_info_dict = {'times': []}
-            current_primary = primary
+            self.collect_by_primary.append(self.lag_info_dict)
+            self.lag_info_dict = {'times': []}
+            self.current_primary = primary
 
-        primary_optimedate_key = ('replSetGetStatus', 'members', current_primary, 'optimeDate')
+        primary_optimedate_key = ('replSetGetStatus', 'members', self.current_primary, 'optimeDate')
         if primary_optimedate_key not in chunk:  # skip if no optimeDate data for primary
-            continue
+            return
 
-        secondary_members = list(repl_member_list)
-        secondary_members.remove(current_primary)
+        secondary_members = list(self.repl_member_list)
+        secondary_members.remove(self.current_primary)
         # add the members as keys to the lag info dict if we are collecting lag info for the first
         # time with this primary.
         for member in secondary_members:
-            if member not in lag_info_dict:
-                lag_info_dict[member] = []
+            if member not in self.lag_info_dict:
+                self.lag_info_dict[member] = []
 
-        test_run_indices = _get_whitelist_from_test_times(chunk, test_times)
+        test_run_indices = np.asarray(_get_whitelist_from_test_times(chunk, self.test_times),
+                                      dtype=int)
         collect_lag = _chunk_member_lag(chunk, secondary_members, chunk[primary_optimedate_key],
                                         test_run_indices)
 
@@ -487,15 +581,28 @@ def ftdc_replica_lag_check(path_to_ftdc_file, test_times=None):
         if len(collect_lag.keys()) == len(secondary_members):
             # `times` is an array of timestamps corresponding to when each sample was collected.
             # note that each chunk contains samples collected over some duration.
-            lag_info_dict['primary'] = current_primary
-            lag_info_dict['times'] += [chunk[FTDC_KEYS['time']][i] for i in test_run_indices]
+            self.lag_info_dict['primary'] = self.current_primary
+            self.lag_info_dict['times'] += chunk_times[test_run_indices].tolist()
             for member, member_lag in collect_lag.items():
-                lag_info_dict[member] += member_lag
+                self.lag_info_dict[member] += member_lag
+
+    def failures(self):
+        """The failures of the rule, once all the chunks of the file were visited.
 
-    # after processing the whole file, append the remaining lag info dictionary
-    collect_by_primary.append(lag_info_dict)
+        :rtype: list[dict] each dict corresponds to failure info for a different primary member.
+        """
+        # after processing the whole file, append the remaining lag info dictionary
+        return _lag_failures_per_primary(self.collect_by_primary + [self.lag_info_dict],
+                                         self.repl_member_list)
 
-    return _lag_failures_per_primary(collect_by_primary, repl_member_list)
+
+def _overlaps(chunk_times, time_range):
+    """Does a chunk have samples in one of the (start, end) ranges of `time_range`?"""
+    return any(chunk_times[0] <= end and chunk_times[-1] >= start for start, end in time_range)
+
+
+# Map each of the rules checked on a whole FTDC file to its visitor class, see ReplicaLagCheck.
+FILE_RULE_VISITORS = {'ftdc_replica_lag_check': ReplicaLagCheck}
 
 
 def _chunk_member_lag(chunk, repl_member_list, primary_optimedates, test_run_indices):
@@ -512,13 +619,9 @@ def _chunk_member_lag(chunk, repl_member_list, primary_optimedates, test_run_ind
         member_optimedate_key = ('replSetGetStatus', 'members', member, 'optimeDate')
         if member_optimedate_key not in chunk:
             break
-        member_optimedate_values = chunk[member_optimedate_key]
-        member_lag = []
-        for index in test_run_indices:
-            secondary_optimedate = member_optimedate_values[index]
-            lag = primary_optimedates[index] - secondary_optimedate
-            member_lag.append(lag)
-        collect_chunk_lag[member] = member_lag
+        member_lag = (np.asarray(primary_optimedates)[test_run_indices] -
+                      np.asarray(chunk[member_optimedate_key])[test_run_indices])
+        collect_chunk_lag[member] = member_lag.tolist()
     return collect_chunk_lag
 
 
@@ -572,66 +675,22 @@ def _flag_unacceptable_lag(lag_info_dict, repl_member_list):  #pylint: disable=t
     num_samples = len(lag_info_dict['times'])
     if num_samples <= 1:  # if lag is too large at beginning, it could just be a false positive.
         return {}
+    times = np.asarray(lag_info_dict['times'])
     for member in repl_member_list:
         if lag_info_dict['primary'] is member:
             continue
 
+        member_lag = lag_info_dict[member]
         failure_times = []
         compared_values = []
-        member_lag = lag_info_dict[member]
-
-        previous = {'lag': 0, 'time': member_lag[0]}
-        is_lagging = False
-        failure_dict = {}
-
-        for index in range(1, num_samples):
-            current_time = lag_info_dict['times'][index]
-            current_lag = member_lag[index]
-            time_delta = current_time - previous['time']
-            bounded_lag = min(current_lag, previous['lag'] + time_delta)
-
-            if not is_lagging:
-                if bounded_lag > REPL_MEMBER_LAG_THRESHOLD_MS:
-                    # Following if statement shouldn't be needed. It is used to filter out the fact
-                    # that index_build will always have secondary lag and we don't have an override
-                    # mechanism to turn this off test-by-test, so this would always fail for
-                    # index_build. Characteristic for index_build is that the lag grows exactly
-                    # 1 sec / sec, because the secondary is completely blocked.
-                    # FIXME: if can be removed when PERF-1031 is implemented.
-                    if bounded_lag - previous['lag'] < time_delta:
-                        LOGGER.debug("lag start")
-                        LOGGER.debug("bounded_lag > threshold %s %s %s", current_lag,
-                                     previous['lag'], current_time)
-                        is_lagging = True
-                        failure_dict = {
-                            'start_time': current_time,
-                            'start_value': current_lag,
-                            'max_value': current_lag,
-                            'max_time': current_time
-                        }
-            else:
-                # We want to capture consecutive ranges of lag happening. Therefore the thershold
-                # to determine lag has ended is lower than the treshold that triggers the start.
-                if current_lag < REPL_MEMBER_LAG_RESET_MS:
-                    LOGGER.debug("lag end")
-                    is_lagging = False
-                    failure_dict['end_value'] = previous['lag']
-                    failure_dict['end_time'] = previous['time']
-
-                    failure_times.append(failure_dict['start_time'])
-                    compared_values.append((failure_dict['start_value'] / MS,
-                                            ftdc_date_parse(failure_dict['max_time'] / MS),
-                                            failure_dict['max_value'] / MS,
-                                            ftdc_date_parse(failure_dict['end_time'] / MS),
-                                            failure_dict['end_value'] / MS))
-                else:
-                    # lag continues
-                    if current_lag > failure_dict['max_value']:
-                        failure_dict['max_value'] = current_lag
-                        failure_dict['max_time'] = current_time
-
-            previous['lag'] = bounded_lag
-            previous['time'] = current_time
+        for start, max_index, end, end_value in _lag_periods(times, np.asarray(member_lag)):
+            LOGGER.debug("lag from %s to %s", lag_info_dict['times'][start],
+                         lag_info_dict['times'][end])
+            failure_times.append(lag_info_dict['times'][start])
+            compared_values.append(
+                (member_lag[start] / MS, ftdc_date_parse(lag_info_dict['times'][max_index] / MS),
+                 member_lag[max_index] / MS, ftdc_date_parse(lag_info_dict['times'][end - 1] / MS),
+                 end_value / MS))
 
         labels = ('start value (s)', 'max time', 'max value (s)', 'end time', 'end value (s)')
         failure = failure_collection(failure_times, compared_values, labels, None, True)
@@ -649,28 +708,169 @@ def _flag_unacceptable_lag(lag_info_dict, repl_member_list):  #pylint: disable=t
     return {}
 
 
+def _lag_periods(times, member_lag):
+    """Helper function to find the periods during which a secondary lagged, see
+    _flag_unacceptable_lag().
+
+    The bounded lag is min(lag, previous bounded lag + time delta), i.e. the running minimum of
+    lag - time, plus the time. A period starts at a sample whose bounded lag is above
+    REPL_MEMBER_LAG_THRESHOLD_MS, and ends at the next sample whose lag is below
+    REPL_MEMBER_LAG_RESET_MS. A period that hasn't ended by the last sample isn't reported.
+
+    :param numpy.ndarray times: the time of each sample, in ms
+    :param numpy.ndarray member_lag: the lag of the secondary at each sample, in ms
+    :rtype: list[(int, int, int, int)] the index of the start of each period, of its maximum lag
+            and of the sample where it ended, and the bounded lag of the sample before the end
+    """
+    # As if the sample before the first one was at time member_lag[0], with no lag.
+    previous_times = np.concatenate(([member_lag[0]], times[1:]))
+    bounded_lag = np.minimum.accumulate(
+        np.concatenate(([-member_lag[0]], member_lag[1:] - times[1:]))) + previous_times
+    bounded_lag[0] = 0
+    time_delta = np.diff(previous_times)
+    # The second condition shouldn't be needed. It is used to filter out the fact that index_build
+    # will always have secondary lag and we don't have an override mechanism to turn this off
+    # test-by-test, so this would always fail for index_build. Characteristic for index_build is
+    # that the lag grows exactly 1 sec / sec, because the secondary is completely blocked.
+    # FIXME: can be removed when PERF-1031 is implemented.
+    starts = np.flatnonzero((bounded_lag[1:] > REPL_MEMBER_LAG_THRESHOLD_MS)
+                            & (np.diff(bounded_lag) < time_delta)) + 1
+    # We want to capture consecutive ranges of lag happening. Therefore the threshold to determine
+    # lag has ended is lower than the threshold that triggers the start.
+    ends = np.flatnonzero(member_lag[1:] < REPL_MEMBER_LAG_RESET_MS) + 1
+
+    periods = []
+    start_index = 0
+    while start_index < len(starts):
+        start = int(starts[start_index])
+        end_index = np.searchsorted(ends, start, side='right')
+        if end_index == len(ends):
+            break
+        end = int(ends[end_index])
+        max_index = start + int(np.argmax(member_lag[start:end]))
+        periods.append((start, max_index, end, bounded_lag[end - 1].item()))
+        start_index = np.searchsorted(starts, end, side='right')
+    return periods
+
+
+def test_times_to_ms(test_times):
+    """Convert test times to ranges of FTDC times, which are in ms since the epoch. The ranges are
+    widened to whole ms, so that they cover any sample in the test times.
+
+    :param list[(datetime, datetime)] test_times: list of (start, end) test times.
+    :rtype: list[(int, int)]
+    """
+    def _timestamp(date):
+        # test times are UTC, see util.num_or_str_to_date()
+        if date.tzinfo is None:
+            date = date.replace(tzinfo=timezone.utc)
+        return date.timestamp()
+
+    return [(int(math.floor(_timestamp(start) * MS)), int(math.ceil(_timestamp(end) * MS)))
+            for start, end in test_times]
+
+
 def _get_whitelist_from_test_times(chunk, test_times=None):
     """FTDC data is stored in chunks. Each chunk is a key-value mapping from some FTDC_KEY
     to a list of values collected over a period of time. This is a quick way to whitelist
-    the list indices during which a test is being executed.
+    the list indices during which a test is being executed, see TimeWindows.
     If test_times is not specified (i.e. no perf.json parameter passed in),
     we just return the full range across the chunk time metric.
 
     :param collection.OrderedDict chunk: FTDC JSON chunk
     :param list[(datetime, datetime)] test_times: list of (start, end) test times.
         Use this to ignore problematic lag value if it doesn't occur during a test run.
-    :rtype: list[int]
+    :rtype: range|numpy.ndarray
     """
-    test_run_indices = []
     times = chunk[FTDC_KEYS['time']]
     if not test_times:
-        test_run_indices = range(len(times))
-    else:
-        chunk_times_in_s = [time_in_ms / MS for time_in_ms in times]
-        for index, time_in_s in enumerate(chunk_times_in_s):
-            if any(start <= util.num_or_str_to_date(time_in_s) <= end for start, end in test_times):
-                test_run_indices.append(index)
-    return test_run_indices
+        return range(len(times))
+    return np.flatnonzero(time_windows(test_times).contains_times(times))
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def date_to_ms(date):
+    """Convert a datetime to ms since the epoch, exact to the microsecond. Naive datetimes are UTC,
+    see util.num_or_str_to_date().
+
+    :type date: datetime
+    :rtype: float
+    """
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return ((date - EPOCH) // timedelta(microseconds=1)) / MS
+
+
+def time_windows(test_times):
+    """Return the TimeWindows of `test_times`. It is only built once for the same test times,
+    e.g. for each line of a log file.
+
+    :param list[(datetime, datetime)]|TimeWindows test_times: list of (start, end) test times.
+    :rtype: TimeWindows
+    """
+    if isinstance(test_times, TimeWindows):
+        return test_times
+    return _time_windows(tuple((start, end) for start, end in test_times))
+
+
+@functools.lru_cache(maxsize=16)
+def _time_windows(test_times):
+    return TimeWindows(test_times)
+
+
+class TimeWindows(object):
+    """Test times as an index of sorted, disjoint intervals of ms since the epoch.
+
+    Whether a time is in any of the test times is then a binary search, rather than a comparison
+    with each test's start and end. Intervals include their start and end.
+    """
+    def __init__(self, test_times):
+        """
+        :param list[(datetime, datetime)] test_times: list of (start, end) test times.
+        """
+        intervals = sorted((date_to_ms(start), date_to_ms(end)) for start, end in test_times)
+        self.starts = []
+        self.ends = []
+        for start, end in intervals:
+            if start > end:
+                continue
+            if self.ends and start <= self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    def contains(self, time_ms):
+        """Is `time_ms` in one of the test times?
+
+        :param float time_ms: time in ms since the epoch
+        :rtype: bool
+        """
+        index = bisect.bisect_right(self.starts, time_ms) - 1
+        return index >= 0 and time_ms <= self.ends[index]
+
+    def contains_date(self, date):
+        """Is `date` in one of the test times?
+
+        :type date: datetime
+        :rtype: bool
+        """
+        return self.contains(date_to_ms(date))
+
+    def contains_times(self, times):
+        """Which of `times` are in one of the test times?
+
+        :param numpy.ndarray times: times in ms since the epoch, e.g. of the samples of an FTDC
+                                    chunk
+        :rtype: numpy.ndarray a boolean mask of `times`
+        """
+        times = np.asarray(times)
+        index = np.searchsorted(self.starts, times, side='right') - 1
+        contained = index >= 0
+        contained[contained] = times[contained] <= np.asarray(self.ends)[index[contained]]
+        return contained
 
 
 # DB correctness jstest rules
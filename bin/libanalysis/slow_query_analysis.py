@@ -0,0 +1,229 @@
+"""
+analysis.py plugin: Latency of the slow queries logged by mongod.
+
+mongod logs each operation slower than slowms as a "Slow query" message. With structured logging,
+i.e. since MongoDB 4.4, its attr holds the durationMillis, ns, planSummary, keysExamined,
+docsExamined and nreturned of the operation. The log plugin only looks for bad messages, this
+plugin aggregates the slow queries of the mongod.log files found by log_analysis, rotated and
+compressed ones included, that ended during the tests of perf.json.
+
+The slow queries are grouped by namespace, and by plan shape: the namespace, the command and the
+planSummary, e.g. "test.c find IXSCAN { a: 1 }". Each group gets its latency distribution, in the
+format of common/latency_distribution.py, with exact percentiles and a histogram, and its scan
+ratios: the index keys and documents examined per document returned.
+
+The summary of each namespace is added to results.json. The summary of each namespace and plan
+shape is written to slow_queries.json in the reports directory, as compact JSON, to compare runs.
+Text logs of older versions don't have these fields and are skipped.
+"""
+
+import collections
+import json
+import os
+
+from dateutil import parser as date_parser
+import numpy as np
+import structlog
+
+from common import latency_distribution
+from . import log_analysis
+from . import rules
+from . import util
+
+LOGGER = structlog.get_logger(__name__)
+
+DATA_FILE = 'slow_queries.json'
+SLOW_QUERY_MESSAGE = 'Slow query'
+NO_PLAN = 'NONE'
+# Upper bounds of the latency histogram buckets in ms: 1, 2, 5, 10, 20, 50, ..., 50000000. Longer
+# slow queries are counted in the last bucket, the max percentile is exact anyway.
+HISTOGRAM_BOUNDS = [
+    float(mantissa * 10**exponent) for exponent in range(8) for mantissa in (1, 2, 5)
+]
+
+SlowQuery = collections.namedtuple(
+    'SlowQuery',
+    ['date', 'ns', 'command', 'plan', 'duration', 'keys_examined', 'docs_examined', 'returned'])
+
+
+def slow_query(config, results):
+    """
+    analysis.py plugin: Summarize the latency of the slow queries in the mongod logs.
+
+    :param ConfigDict config: The global config.
+    :param ResultsFile results: Object to add results to.
+    """
+    slow_query_config = config['analysis'].get('slow_query', {})
+    reports = config['test_control']['reports_dir_basename']
+    LOGGER.info("Analyzing slow queries.", reports=reports)
+    test_times = util.get_test_times(config['test_control']['perf_json']['path'])
+    summary = analyze_slow_queries(reports, test_times)
+    if not summary['count']:
+        LOGGER.info("No slow queries found.")
+        return
+    data_path = os.path.join(reports, slow_query_config.get('data_file', DATA_FILE))
+    with open(data_path, 'w') as data_file:
+        json.dump(summary, data_file, separators=(',', ':'), sort_keys=True)
+    LOGGER.info("Wrote slow query summary", path=data_path, count=summary['count'])
+    results.add('slow-query-analysis',
+                'pass',
+                log_raw=format_summary(summary, slow_query_config.get('max_listed', 10)),
+                slow_queries=namespace_results(summary))
+
+
+def analyze_slow_queries(reports_dir_path, test_times=None):
+    """
+    Summarize the slow queries of the mongod logs under `reports_dir_path`.
+
+    :param str reports_dir_path: The reports directory.
+    :param list((datetime, datetime)) test_times: Only the slow queries that ended during one of
+                                                  these (start, end) test times are counted. All of
+                                                  them if None.
+    :rtype: dict {'count': int, 'namespaces': {ns: summary}, 'plans': [summary]} where each summary
+            is that of group_summary(), and the plans are sorted by total time, slowest first.
+    """
+    windows = None if test_times is None else rules.time_windows(test_times)
+    groups = collections.defaultdict(list)
+    for node_paths in log_analysis.node_log_files(reports_dir_path).values():
+        for path in node_paths:
+            LOGGER.debug("Reading slow queries", path=path)
+            for query in read_slow_queries(path):
+                if windows is None or windows.contains_date(date_parser.parse(query.date)):
+                    groups[(query.ns, query.command, query.plan)].append(query)
+
+    namespaces = collections.defaultdict(list)
+    plans = []
+    for (namespace, command, plan), queries in groups.items():
+        namespaces[namespace].extend(queries)
+        plan_summary = group_summary(queries)
+        plan_summary.update(ns=namespace, command=command, plan=plan)
+        plans.append(plan_summary)
+    plans.sort(key=lambda plan_summary: (-plan_summary['total_ms'], plan_summary['ns']))
+    return {
+        'count': sum(len(queries) for queries in groups.values()),
+        'namespaces': {
+            namespace: group_summary(queries)
+            for namespace, queries in namespaces.items()
+        },
+        'plans': plans
+    }
+
+
+def read_slow_queries(path):
+    """
+    Yield the slow queries logged in the log file at `path`.
+
+    :param str path: A mongod.log file, see log_analysis.open_log_file().
+    :rtype: generator(SlowQuery)
+    """
+    with log_analysis.open_log_file(path) as log_file:
+        for line in log_file:
+            # Most lines aren't slow queries, don't parse them.
+            if SLOW_QUERY_MESSAGE in line:
+                query = parse_slow_query(line)
+                if query is not None:
+                    yield query
+
+
+def parse_slow_query(line):
+    """
+    Return the SlowQuery of a structured log line, or None if it isn't a slow query.
+
+    :param str line: A line of mongod.log.
+    :rtype: SlowQuery|None
+    """
+    try:
+        entry = json.loads(line)
+        attr = entry['attr']
+        if entry['msg'] != SLOW_QUERY_MESSAGE or 'durationMillis' not in attr:
+            return None
+        command = attr.get('command')
+        return SlowQuery(date=entry['t']['$date'],
+                         ns=attr.get('ns', ''),
+                         command=next(iter(command), '') if isinstance(command, dict) else '',
+                         plan=attr.get('planSummary', NO_PLAN),
+                         duration=float(attr['durationMillis']),
+                         keys_examined=int(attr.get('keysExamined', 0)),
+                         docs_examined=int(attr.get('docsExamined', 0)),
+                         returned=int(attr.get('nreturned', 0)))
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def group_summary(queries):
+    """
+    Summarize a group of slow queries.
+
+    :param list(SlowQuery) queries: At least one slow query.
+    :rtype: dict The count and total time of the queries, their latency distribution in ms, and
+            the keys and documents examined, the documents returned, and the examined per returned
+            ratios, None when nothing was returned.
+    """
+    durations = np.array([query.duration for query in queries])
+    buckets = np.searchsorted(HISTOGRAM_BOUNDS, durations).clip(max=len(HISTOGRAM_BOUNDS) - 1)
+    counts = np.bincount(buckets, minlength=len(HISTOGRAM_BOUNDS))
+    standard = latency_distribution.STANDARD_PERCENTILES
+    percentiles = dict(zip(standard, np.percentile(durations, standard).tolist()))
+    percentiles.update(min=float(durations.min()), max=float(durations.max()))
+    keys_examined = sum(query.keys_examined for query in queries)
+    docs_examined = sum(query.docs_examined for query in queries)
+    returned = sum(query.returned for query in queries)
+    distribution = latency_distribution.from_histogram(HISTOGRAM_BOUNDS, counts.tolist(),
+                                                       percentiles)
+    return {
+        'count': len(queries),
+        'total_ms': float(durations.sum()),
+        'latency_ms': distribution,
+        'keys_examined': keys_examined,
+        'docs_examined': docs_examined,
+        'returned': returned,
+        'keys_examined_per_returned': keys_examined / returned if returned else None,
+        'docs_examined_per_returned': docs_examined / returned if returned else None
+    }
+
+
+def namespace_results(summary):
+    """
+    Return the summary of each namespace for results.json: the count and the main percentiles of
+    the latency, without the histogram, and the scan ratios.
+
+    :param dict summary: See analyze_slow_queries().
+    :rtype: dict
+    """
+    results = {}
+    for namespace, namespace_summary in summary['namespaces'].items():
+        percentiles = namespace_summary['latency_ms']['percentiles']
+        results[namespace] = {
+            'count': namespace_summary['count'],
+            'total_ms': namespace_summary['total_ms'],
+            'p50_ms': percentiles['p50'],
+            'p99_ms': percentiles['p99'],
+            'max_ms': percentiles['max'],
+            'keys_examined_per_returned': namespace_summary['keys_examined_per_returned'],
+            'docs_examined_per_returned': namespace_summary['docs_examined_per_returned']
+        }
+    return results
+
+
+def format_summary(summary, max_listed):
+    """
+    Return a table of the `max_listed` plan shapes with the largest total time.
+
+    :param dict summary: See analyze_slow_queries().
+    :param int max_listed: The number of plan shapes listed.
+    :rtype: str
+    """
+    lines = [
+        '{0} slow queries in {1} namespaces.'.format(summary['count'], len(summary['namespaces'])),
+        '{0:>12} {1:>8} {2:>10} {3:>10} {4:>10} {5:>10}  {6}'.format('total_ms', 'count', 'p50_ms',
+                                                                     'p99_ms', 'max_ms', 'docs/ret',
+                                                                     'plan shape')
+    ]
+    for plan in summary['plans'][:max_listed]:
+        percentiles = plan['latency_ms']['percentiles']
+        ratio = plan['docs_examined_per_returned']
+        lines.append('{0:>12.0f} {1:>8} {2:>10.1f} {3:>10.1f} {4:>10.1f} {5:>10}  {6}'.format(
+            plan['total_ms'], plan['count'], percentiles['p50'], percentiles['p99'],
+            percentiles['max'], '-' if ratio is None else '{0:.1f}'.format(ratio),
+            ' '.join(part for part in (plan['ns'], plan['command'], plan['plan']) if part)))
+    return '\n'.join(lines) + '\n'
@@ -10,6 +10,10 @@ import os
 
 from dateutil import tz, parser as date_parser
 
+# The number of worker processes a plugin may start, when analysis.py runs it in a worker process
+# next to other plugins. None when the plugin has the CPUs to itself.
+MAX_PLUGIN_WORKERS = None
+
 
 def get_project_variant_rules(config, variant, rule):
     """The rules we want to check are specified in nested dictionaries. They all follow the same
@@ -27,6 +31,21 @@ def get_project_variant_rules(config, variant, rule):
     return value
 
 
+def worker_count(config, key):
+    """
+    Return the number of worker processes of analysis.<key>, where 0 means one per CPU, and at most
+    MAX_PLUGIN_WORKERS.
+
+    :type config: ConfigDict
+    :type key: str
+    :rtype: int
+    """
+    workers = config['analysis'].get(key, 1) or os.cpu_count()
+    if MAX_PLUGIN_WORKERS is not None:
+        workers = min(workers, MAX_PLUGIN_WORKERS)
+    return workers
+
+
 def get_test_times(perf_json_or_path):
     """
     Read the performance report file at `perf_file_path` (usually called "perf.json") and return a
@@ -1,14 +1,15 @@
 """Functions for analyzing the throughput-over-time data generated by YCSB."""
 
 import os
-import itertools
 import collections
 import math
 
+import numpy as np
 import structlog
 
 LOGGER = structlog.get_logger(__name__)
 
+# A datapoint, or a whole series with arrays of the times and the ops/sec.
 Throughput = collections.namedtuple("Throughput", ["time", "ops"])
 
 
@@ -38,18 +39,14 @@ def analyze_ycsb_throughput(reports_dir_path):
     results = []
     for num, path in enumerate(_get_ycsb_file_paths(reports_dir_path)):
         LOGGER.info("Reading file:", path=path)
-        # Check that this is a ycsb output file
-        ycsb_in_file = True
         with open(path) as ycsb_file:
-            if max((line.find('YCSB Client') for line in ycsb_file)) == -1:
-                ycsb_in_file = False
-                LOGGER.warning('YCSB Throughput analysis called on file without YCSB Call for file',
-                               path=path)
-        if ycsb_in_file:
-            with open(path) as ycsb_file:
-                throughputs = _throughputs_from_lines(ycsb_file)
-
-            if isinstance(throughputs, list) and len(throughputs) >= 2:
+            ycsb_in_file, throughputs = _read_ycsb_output(ycsb_file)
+        # Check that this is a ycsb output file
+        if not ycsb_in_file:
+            LOGGER.warning('YCSB Throughput analysis called on file without YCSB Call for file',
+                           path=path)
+        else:
+            if len(throughputs.time) >= 2:
                 pass_test, result_message = _analyze_throughputs(throughputs)
             else:
                 pass_test = False
@@ -90,11 +87,29 @@ def _throughputs_from_lines(lines):
     throughput value was reported at.
     """
 
+    _, throughputs = _read_ycsb_output(lines)
+    return [
+        Throughput(time, ops)
+        for time, ops in zip(throughputs.time.tolist(), throughputs.ops.tolist())
+    ]
+
+
+def _read_ycsb_output(lines):
+    """
+    Read the lines of a YCSB log file in a single pass. Return `(ycsb_in_file, throughputs)`, where
+    `ycsb_in_file` is whether a line contains "YCSB Client", and `throughputs` is a `Throughput` of
+    arrays of the times and ops/sec values, see `_throughputs_from_lines()`.
+    """
+
     # A sample line from the YCSB file might look like:
     # " 10 sec: 185680 operations; 18543.89 current ops/sec; [INSERT AverageLatency(us)=1692.38]"
 
-    throughputs = []
+    ycsb_in_file = False
+    times = []
+    ops = []
     for line in lines:
+        if not ycsb_in_file:
+            ycsb_in_file = "YCSB Client" in line
         if not line.startswith(" "):
             continue
 
@@ -110,18 +125,30 @@ def _throughputs_from_lines(lines):
         if len(components) < 2:
             continue
 
-        ops_per_sec = float(components[1].split(" ")[0])
-        throughputs.append(Throughput(timestamp, ops_per_sec))
+        times.append(timestamp)
+        ops.append(float(components[1].split(" ")[0]))
+
+    return ycsb_in_file, Throughput(np.array(times, dtype=float), np.array(ops, dtype=float))
+
+
+def _as_arrays(throughputs):
+    """
+    Return the times and the ops/sec values of `throughputs`, a list of `Throughput`s or a
+    `Throughput` of arrays, as arrays.
+    """
 
-    return throughputs
+    if isinstance(throughputs, Throughput):
+        return np.asarray(throughputs.time, dtype=float), np.asarray(throughputs.ops, dtype=float)
+    return (np.array([throughput.time for throughput in throughputs], dtype=float),
+            np.array([throughput.ops for throughput in throughputs], dtype=float))
 
 
 def _analyze_throughputs(throughputs):
     """
-    Analyze `throughputs`, a list of `Throughput`s, for anomalous performance using the
-    `_analyze_*()` functions. Return `(passed, message)`, where `passed` is a boolean indicating
-    whether the analysis passed successfully (ie no problems were detected) and `message` is a
-    human-friendly message summarizing the analysis results.
+    Analyze `throughputs`, a list of `Throughput`s or a `Throughput` of arrays, for anomalous
+    performance using the `_analyze_*()` functions. Return `(passed, message)`, where `passed` is a
+    boolean indicating whether the analysis passed successfully (ie no problems were detected) and
+    `message` is a human-friendly message summarizing the analysis results.
     """
 
     err_messages = _analyze_spiky_throughput(throughputs)
@@ -141,60 +168,60 @@ def _analyze_spiky_throughput(throughputs, max_drop=0.5, min_duration=10, skip_i
     is specified in `skip_initial_seconds` in seconds (so if `skip_initial_seconds=20` the first 20
     seconds worth of datapoints will be skipped). The function returns a list of detailed error
     messages (`strings`), which is empty if no problems were detected in the throughput data.
+
+    The periods of successive low throughputs are found as runs of an array of booleans, rather
+    than one datapoint at a time.
     """
 
     err_messages = []
 
-    # Skip datapoints based on `skip_initial_seconds`. `throughputs` is a list of `(time,
-    # throughput)` tuples.
-    while throughputs and throughputs[0].time <= skip_initial_seconds:
-        throughputs = throughputs[1:]
+    # Skip the leading datapoints based on `skip_initial_seconds`.
+    times, ops = _as_arrays(throughputs)
+    after_skip = np.flatnonzero(times > skip_initial_seconds)
+    start = int(after_skip[0]) if len(after_skip) else len(times)
+    times, ops = times[start:], ops[start:]
 
-    if not throughputs:
+    if not times.size:
         return True, (
             "Insufficient data to perform throughput analysis (less than {0} seconds of data "
             "was present).")
 
-    avg_throughput = float(sum(pair.ops for pair in throughputs)) / len(throughputs)
+    # cumsum() adds the values in order, as sum() does, unlike ndarray.sum().
+    avg_throughput = float(np.cumsum(ops)[-1]) / len(ops)
     min_acceptable_throughput = avg_throughput * max_drop
-    throughputs_iter = iter(throughputs)
-
-    for throughput in throughputs_iter:
-        if throughput.ops < min_acceptable_throughput:
-            first_low_throughput_time = throughput.time
-
-            # Search until the point where performance numbers return to normal.
-            low_throughputs = list(
-                itertools.takewhile(lambda throughput: throughput.ops < min_acceptable_throughput,
-                                    throughputs_iter))
-
-            # If there aren't at least two consecutive low throughputs there aren't enough
-            # datapoints to confidently flag a regression, no matter what the reporting interval is.
-            if not low_throughputs:
-                continue
-
-            last_low_throughput_time = low_throughputs[-1].time
-            duration = last_low_throughput_time - first_low_throughput_time
-            if duration >= min_duration:
-                # We've detected a long-enough period of reduced throughput.
-
-                low_throughputs_str = "\n".join("    {0} sec: {1} ops/sec".format(time, throughput)
-                                                for time, throughput in low_throughputs)
-                err_msg = (
-                    "spiky throughput: Detected low throughput for {0} seconds, starting at {1} "
-                    "seconds and ending at {2} seconds. The minimum acceptable throughput is {3} "
-                    "ops/sec (the average throughput for the test was {4}ops/sec ), and the low "
-                    "throughputs were: \n{5}\n").format(duration, first_low_throughput_time,
-                                                        last_low_throughput_time,
-                                                        min_acceptable_throughput, avg_throughput,
-                                                        low_throughputs_str)
-                err_messages.append(err_msg)
+
+    # The first and last index of each period of successive low throughputs.
+    low = np.concatenate(([0], (ops < min_acceptable_throughput).astype(np.int8), [0]))
+    edges = np.diff(low)
+    firsts = np.flatnonzero(edges == 1)
+    lasts = np.flatnonzero(edges == -1) - 1
+    durations = times[lasts] - times[firsts]
+
+    # If there aren't at least two consecutive low throughputs there aren't enough datapoints to
+    # confidently flag a regression, no matter what the reporting interval is.
+    flagged = (lasts > firsts) & (durations >= min_duration)
+    times_list = times.tolist()
+    ops_list = ops.tolist()
+    for first, last, duration in zip(firsts[flagged].tolist(), lasts[flagged].tolist(),
+                                     durations[flagged].tolist()):
+        # We've detected a long-enough period of reduced throughput. As always, the low
+        # throughputs listed are those after the first one.
+        low_throughputs = zip(times_list[first + 1:last + 1], ops_list[first + 1:last + 1])
+        low_throughputs_str = "\n".join("    {0} sec: {1} ops/sec".format(time, throughput)
+                                        for time, throughput in low_throughputs)
+        err_msg = ("spiky throughput: Detected low throughput for {0} seconds, starting at {1} "
+                   "seconds and ending at {2} seconds. The minimum acceptable throughput is {3} "
+                   "ops/sec (the average throughput for the test was {4}ops/sec ), and the low "
+                   "throughputs were: \n{5}\n").format(duration, times_list[first],
+                                                       times_list[last], min_acceptable_throughput,
+                                                       avg_throughput, low_throughputs_str)
+        err_messages.append(err_msg)
 
     return err_messages
 
 
-def _analyze_long_term_degradation(throughputs, duration_seconds=10 * 60, max_drop=0.7):
-    """Analyze `throughputs`, a list of `Throughput`s, for long term
+def _analyze_long_term_degradation(throughputs, duration_seconds=10 * 60, max_drop=0.7):  # pylint: disable=too-many-locals
+    """Analyze `throughputs`, a list of `Throughput`s or a `Throughput` of arrays, for long term
     degradation in throughput. The `throughputs` are looked at in
     `duration_seconds` chunks (so every single sequence of consecutive
     `Throughput`s that take up a chunk of time equal to
@@ -213,28 +240,28 @@ def _analyze_long_term_degradation(throughputs, duration_seconds=10 * 60, max_dr
     maximum throughput, it uses the chunk's average throughput instead of comparing every single
     throughput datapoint inside it.
 
+    The average throughputs of all the chunks are computed at once, see `_window_sums()`.
     """
 
     err_messages = []
 
-    reporting_interval = throughputs[1].time - throughputs[0].time
+    times, ops = _as_arrays(throughputs)
+    reporting_interval = float(times[1] - times[0])
     data_window_width = int(math.ceil(float(duration_seconds) / reporting_interval))
 
     # Only do the calculation if there is enough data.
-    if len(throughputs) > data_window_width:
+    if len(ops) > data_window_width:
+        # The average throughput of each data_window_width period of time, except the last one.
+        averages = _window_sums(ops, data_window_width) / data_window_width
         # This computes the max throughput over any data_window_width period of time
-        max_throughput = max(
-            average_throughput(throughputs[x:x + data_window_width])
-            for x in range(len(throughputs) - data_window_width))
+        max_throughput = float(averages.max())
         min_acceptable_throughput = max_throughput * max_drop
-        failures = [
-            x for x in range(len(throughputs) - data_window_width)
-            if average_throughput(throughputs[x:x + data_window_width]) < min_acceptable_throughput
-        ]
+        failures = np.flatnonzero(averages < min_acceptable_throughput).tolist()
+        times_list = times.tolist()
         for failure in failures:
-            avg_throughput = average_throughput(throughputs[failure:failure + data_window_width])
-            start_time = throughputs[failure].time
-            end_time = throughputs[failure + data_window_width].time
+            avg_throughput = float(averages[failure])
+            start_time = times_list[failure]
+            end_time = times_list[failure + data_window_width]
             err_message = (
                 "long term throughput degradation: Detected a low average throughput of {0} "
                 "starting at {1} and ending at {2} (total duration of {3} seconds). The maximum "
@@ -246,6 +273,23 @@ def _analyze_long_term_degradation(throughputs, duration_seconds=10 * 60, max_dr
     return err_messages
 
 
+def _window_sums(values, width):
+    """
+    Return the sums of the `width` successive values starting at each index of `values`, except the
+    last one, like `[sum(values[x:x + width]) for x in range(len(values) - width)]`.
+
+    The windows are summed one position at a time, all at once: the values of each window are added
+    in the same order as sum() does, so the averages and the messages are the same as with sum(),
+    to the last digit. The difference of a cumulative sum would differ from it by rounding.
+    """
+
+    count = len(values) - width
+    sums = values[:count].copy()
+    for offset in range(1, width):
+        sums += values[offset:offset + count]
+    return sums
+
+
 def average_throughput(throughputs):
     """Return the average `ops` value of `throughputs`, a list of `Throughput`s."""
 
@@ -35,10 +35,25 @@ from common.jstests import run_validate
 import common.log
 from common.workload_output_parser import parse_test_results, get_supported_parser_types
 import common.dsisocket as dsisocket
+import common.results_archive as results_archive
 import common.during_test as during_test
+import common.ftdc_tail as ftdc_tail
 
 LOG = logging.getLogger(__name__)
 
+# With test_control.ftdc_tail.abort_on_failure, the shell of the test command writes its pid to this
+# file, in the working directory of the workload client, so that the test can be killed through
+# another connection.
+ABORT_PID_FILE = '.test_control.pid'
+KILL_TEST_COMMAND = """descendants() {{
+  for child in $(pgrep -P "$1"); do echo "$child"; descendants "$child"; done
+}}
+if [ -f {0} ]; then
+  pid=$(cat {0})
+  kill -TERM "$pid" $(descendants "$pid")
+  rm -f {0}
+fi""".format(ABORT_PID_FILE)
+
 
 def print_perf_json(filename='perf.json'):
     """
@@ -52,7 +67,7 @@ def print_perf_json(filename='perf.json'):
 
 def copy_to_reports(reports_dir='reports', perf_json='perf.json'):
     """
-    Copy perf.json and all yml files under reports/.
+    Copy perf.json and all yml files under reports/, and write the results archive perf.npz.
 
     This is useful when running test_control.py many times with different configurations.
     You want to save config and results for all of them.
@@ -60,6 +75,12 @@ def copy_to_reports(reports_dir='reports', perf_json='perf.json'):
     if os.path.isfile(perf_json):
         LOG.debug("Copying %s to %s", perf_json, reports_dir)
         shutil.copy(perf_json, reports_dir)
+        # The archive is only an optimization for the analysis, it mustn't keep the yml files from
+        # being copied.
+        try:
+            results_archive.write_from_perf_json(perf_json, reports_dir)
+        except Exception:  # pylint: disable=broad-except
+            LOG.warning("Couldn't write the results archive of %s", perf_json, exc_info=True)
     for yaml_file in glob.glob('*.yml'):
         LOG.debug("Copying %s to %s", yaml_file, reports_dir)
         shutil.copy(yaml_file, os.path.join(reports_dir, yaml_file))
@@ -237,6 +258,17 @@ def run_test(test, config, reports_dir='reports'):
     client_host = common.command_runner.make_workload_runner_host(config)
     dsisocket_stop = dsisocket.start(client_host, config)
     during_test_stop = during_test.start(test, config)
+    aborted = []
+    command = test['cmd']
+    if ftdc_tail.aborts_on_failure(config):
+        command = abortable_command(command)
+
+    def abort(message):
+        # Called from the ftdc_tail thread, while client_host runs the test command.
+        aborted.append(message)
+        kill_test_command(config)
+
+    ftdc_tail_stop = ftdc_tail.start(test, config, abort)
 
     no_output_timeout_ms = config['test_control']['timeouts']['no_output_ms']
 
@@ -247,7 +279,7 @@ def run_test(test, config, reports_dir='reports'):
         safe_out = common.log.UTF8WrapperStream(out)
         tee_out = common.log.TeeStream(INFO_ADAPTER, safe_out)
         try:
-            exit_status = client_host.exec_command(test['cmd'],
+            exit_status = client_host.exec_command(command,
                                                    stdout=tee_out,
                                                    stderr=tee_out,
                                                    no_output_timeout_ms=no_output_timeout_ms,
@@ -258,6 +290,9 @@ def run_test(test, config, reports_dir='reports'):
         finally:
             dsisocket_stop()
             during_test_stop()
+            ftdc_tail_stop()
+        if aborted:
+            error = ExitStatus(1, aborted[0])
 
         # Old analysis/*check.py code picks up exit codes from the test_output.log
         write_exit_status(tee_out, error)
@@ -279,6 +314,42 @@ def run_test(test, config, reports_dir='reports'):
         raise subprocess.CalledProcessError(error.status, test['id'], output=error.message)
 
 
+def abortable_command(command):
+    """
+    Return the test command, prefixed to write the pid of its shell to ABORT_PID_FILE.
+
+    :param command: The test command.
+    :type command: str, list
+    :rtype: str
+    """
+    if isinstance(command, list):
+        command = ' '.join(command)
+    return 'echo $$ > {0}\n{1}'.format(ABORT_PID_FILE, command)
+
+
+def kill_test_command(config):
+    """
+    Kill the test command started by abortable_command(), and its descendants.
+
+    The kill runs through a new connection to the workload client, as the test command holds the
+    one of run_test(). Failures are logged: the test is reported as aborted either way.
+
+    :param ConfigDict config: The top level ConfigDict
+    """
+    try:
+        host = common.command_runner.make_workload_runner_host(config)
+    except Exception:  # pylint: disable=broad-except
+        LOG.warning("Couldn't connect to the workload client to abort the test", exc_info=True)
+        return
+    try:
+        if host.exec_command(KILL_TEST_COMMAND, quiet=True):
+            LOG.warning("Couldn't kill the test command")
+    except Exception:  # pylint: disable=broad-except
+        LOG.warning("Couldn't kill the test command", exc_info=True)
+    finally:
+        host.close()
+
+
 def get_error_from_exception(exception):
     """ create an error object from an exception.
 
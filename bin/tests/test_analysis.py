@@ -3,14 +3,42 @@ Unit tests for analysis.py, the main analysis entry point.
 """
 
 import os
+import time
 import unittest
 
+from mock import patch
+
 import bin.analysis as analysis
+import libanalysis
+from libanalysis import util
 from test_lib.fixture_files import FixtureFiles
 
 FIXTURE_FILES = FixtureFiles(os.path.dirname(__file__))
 
 
+def slow_plugin(config, results):
+    """A plugin that takes its time."""
+    time.sleep(config['_sleep'])
+    results.add('slow', 'pass', log_raw=str(os.getpid()))
+
+
+def fast_plugin(config, results):
+    """A plugin that is done right away."""
+    _ = config
+    results.add('fast', 'pass', log_raw=str(os.getpid()))
+    results.add('fast.2', 'pass', log_raw=str(os.getpid()))
+
+
+def workers_plugin(config, results):
+    """A plugin that reports how many worker processes it may start."""
+    results.add('workers', 'pass', log_raw=str(util.worker_count(config, 'log_workers')))
+
+
+def failing_plugin(config, results):
+    """A plugin that raises an exception."""
+    raise ValueError('failing plugin')
+
+
 class TestAnalysis(unittest.TestCase):
     def setUp(self):
         self.results_json = os.path.join(FIXTURE_FILES.fixture_dir_path,
@@ -34,6 +62,11 @@ class TestAnalysis(unittest.TestCase):
         analyzer = analysis.ResultsAnalyzer(self.config)
         self.assertEqual(analyzer.analyze_all(), 0)
         self.assertEqual(analyzer.failures, 0)
+        plugins = analyzer.results.data.pop('plugins')
+        self.assertEqual([stats['plugin'] for stats in plugins], ['dummy'])
+        self.assertEqual(sorted(plugins[0]), ['cpu_time', 'peak_memory_mb', 'plugin', 'wall_time'])
+        # The plugin ran in this process, with the memory of everything that ran before it.
+        self.assertIsNone(plugins[0]['peak_memory_mb'])
         expected_results = {
             'failures':
                 0,
@@ -53,6 +86,7 @@ class TestAnalysis(unittest.TestCase):
         analyzer = analysis.ResultsAnalyzer(self.config)
         self.assertEqual(analyzer.analyze_all(), self.config['_test_failures'])
         self.assertEqual(analyzer.failures, self.config['_test_failures'])
+        analyzer.results.data.pop('plugins')
         self.maxDiff = None  # pylint: disable=invalid-name
         expected_results = {
             "failures":
@@ -81,3 +115,63 @@ class TestAnalysis(unittest.TestCase):
             }]
         }
         self.assertEqual(analyzer.results.data, expected_results)
+
+    @patch.multiple(libanalysis,
+                    create=True,
+                    slow=slow_plugin,
+                    fast=fast_plugin,
+                    sequential=fast_plugin,
+                    INDEPENDENT_CHECKS=frozenset(['slow', 'fast']))
+    def test_parallel_plugins(self):
+        """Independent plugins run concurrently, in processes of their own, and their results are
+        added in the order of the checks."""
+        self.config['_sleep'] = 0.5
+        self.config['analysis']['plugin_workers'] = 2
+        self.config['analysis']['checks'] = ['slow', 'sequential', 'slow', 'fast']
+        analyzer = analysis.ResultsAnalyzer(self.config)
+        start = time.time()
+        self.assertEqual(analyzer.analyze_all(), 0)
+        self.assertLess(time.time() - start, 3 * 0.5)
+
+        results = analyzer.results.data['results']
+        self.assertEqual([result['test_file'] for result in results],
+                         ['slow', 'fast', 'fast.2', 'slow', 'fast', 'fast.2'])
+        pids = [int(result['log_raw']) for result in results]
+        self.assertEqual(pids[1], os.getpid())
+        self.assertEqual(len(set(pids[:1] + pids[3:5])), 3)
+        self.assertNotIn(os.getpid(), pids[:1] + pids[3:])
+        plugins = analyzer.results.data['plugins']
+        self.assertEqual([stats['plugin'] for stats in plugins], self.config['analysis']['checks'])
+        self.assertGreaterEqual(plugins[0]['wall_time'], 0.5)
+        self.assertLess(plugins[0]['cpu_time'], 0.5)
+        self.assertGreater(plugins[0]['peak_memory_mb'], 0)
+        self.assertIsNone(plugins[1]['peak_memory_mb'])
+
+    @patch.multiple(libanalysis,
+                    create=True,
+                    fast=fast_plugin,
+                    failing=failing_plugin,
+                    INDEPENDENT_CHECKS=frozenset(['fast', 'failing']))
+    def test_parallel_plugin_failure(self):
+        """The exception of a plugin run in a worker process is raised again."""
+        self.config['analysis']['plugin_workers'] = 2
+        self.config['analysis']['checks'] = ['fast', 'failing']
+        analyzer = analysis.ResultsAnalyzer(self.config)
+        with self.assertRaisesRegex(ValueError, 'failing plugin'):
+            analyzer.analyze_all()
+
+    @patch('os.cpu_count', return_value=8)
+    @patch.multiple(libanalysis,
+                    create=True,
+                    workers=workers_plugin,
+                    INDEPENDENT_CHECKS=frozenset(['workers']))
+    def test_parallel_plugin_workers(self, mock_cpu_count):
+        """Plugins run concurrently share the CPUs between their own worker processes."""
+        self.config['analysis'].update(plugin_workers=0, log_workers=0)
+        self.config['analysis']['checks'] = ['workers', 'workers', 'workers', 'workers']
+        analyzer = analysis.ResultsAnalyzer(self.config)
+        self.assertEqual(analyzer.analyze_all(), 0)
+        mock_cpu_count.assert_called()
+        self.assertEqual([result['log_raw'] for result in analyzer.results.data['results']],
+                         ['2'] * 4)
+        self.assertIsNone(util.MAX_PLUGIN_WORKERS)
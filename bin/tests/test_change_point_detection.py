@@ -0,0 +1,143 @@
+"""Unit tests for libanalysis/change_point_detection.py"""
+
+import csv
+import itertools
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from mock import Mock
+import numpy as np
+
+from common import results_archive
+from libanalysis import change_point_detection
+
+LOG = logging.getLogger(__name__)
+
+
+def loop_q(values, tau):
+    """The E-divisive means statistic of the split at `tau`, one pair at a time."""
+    left, right = values[:tau], values[tau:]
+    between = sum(abs(x - y) for x in left for y in right)
+    within_left = sum(abs(x - y) for x, y in itertools.combinations(left, 2))
+    within_right = sum(abs(x - y) for x, y in itertools.combinations(right, 2))
+    m, k = float(len(left)), float(len(right))
+    return m * k / (m + k) * (2 * between / (m * k) - within_left /
+                              (m * (m - 1) / 2) - within_right / (k * (k - 1) / 2))
+
+
+def perf_json(ops_per_sec, latency):
+    """A perf.json document with one test and two metrics."""
+    return {
+        'results': [{
+            'name': 'insert',
+            'workload': 'insert.js',
+            'results': {
+                '8': {
+                    'ops_per_sec': ops_per_sec,
+                    'ops_per_sec_values': [ops_per_sec],
+                    'average_read_latency_us': latency
+                }
+            }
+        }]
+    }
+
+
+class ChangePointDetectionTestCase(unittest.TestCase):
+    """Unit tests for the change point detection."""
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_q_values(self):
+        """The statistic of each split is the one of the definition."""
+        random = np.random.RandomState(47)
+        for length, min_size in ((4, 2), (9, 2), (9, 3), (30, 3)):
+            series = random.normal(size=(3, length))
+            expected = [[
+                loop_q(values.tolist(), tau) for tau in range(min_size, length - min_size + 1)
+            ] for values in series]
+            np.testing.assert_allclose(change_point_detection.q_values(series, min_size), expected)
+
+    def test_e_divisive(self):
+        """Shifts of the mean are found where they are, noise alone has no change point."""
+        random = np.random.RandomState(1)
+        values = np.concatenate(
+            (random.normal(100, 3, 20), random.normal(80, 3, 15), random.normal(120, 3, 10)))
+        points = change_point_detection.e_divisive(values, random=random)
+        self.assertEqual([point.index for point in points], [20, 35])
+        self.assertTrue(all(point.p_value == 0.01 for point in points))
+        self.assertEqual(
+            change_point_detection.e_divisive(random.normal(100, 3, 45), random=random), [])
+        self.assertEqual(change_point_detection.e_divisive(np.full(45, 100.0), random=random), [])
+        self.assertEqual(change_point_detection.e_divisive([1.0, 2.0, 30.0, 40.0], random=random),
+                         [])
+
+    def test_change_points(self):
+        """The runs are read from perf.npz or perf.json, and the change points written to the CSV
+        file and to results.json."""
+        random = np.random.RandomState(2)
+        for run in range(20):
+            reports_dir = os.path.join(self.work_dir, 'reports-2020-01-{0:02}T00:00:00'.format(run))
+            os.mkdir(reports_dir)
+            ops_per_sec = random.normal(1000 if run < 12 else 700, 10)
+            with open(os.path.join(reports_dir, 'perf.json'), 'w') as perf_json_file:
+                json.dump(perf_json(ops_per_sec, random.normal(500, 10)), perf_json_file)
+            if run % 2:
+                results_archive.write_from_perf_json(os.path.join(reports_dir, 'perf.json'),
+                                                     reports_dir)
+        reports = os.path.join(self.work_dir, 'reports')
+        os.symlink(os.path.join(self.work_dir, 'reports-2020-01-19T00:00:00'), reports)
+        config = {
+            'analysis': {
+                'change_points': {
+                    'history': [os.path.join(self.work_dir, 'reports-*')]
+                }
+            },
+            'test_control': {
+                'reports_dir_basename': reports
+            }
+        }
+        results = Mock()
+        change_point_detection.change_points(config, results)
+
+        with open(os.path.join(reports, 'change_points.csv')) as csv_file:
+            rows = list(csv.DictReader(csv_file))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['test'], 'insert')
+        self.assertEqual(rows[0]['threads'], '8')
+        self.assertEqual(rows[0]['metric'], 'ops_per_sec')
+        self.assertEqual(rows[0]['run'], 'reports-2020-01-12T00:00:00')
+        self.assertEqual(rows[0]['previous_run'], 'reports-2020-01-11T00:00:00')
+        self.assertEqual(rows[0]['index'], '12')
+        self.assertAlmostEqual(float(rows[0]['change_percent']), -30, delta=3)
+        self.assertGreaterEqual(float(rows[0]['confidence']), 0.95)
+        args, kwargs = results.add.call_args
+        self.assertEqual(args, ('change-points', 'pass'))
+        self.assertEqual([row['run'] for row in kwargs['change_points']],
+                         ['reports-2020-01-12T00:00:00'])
+        self.assertTrue(kwargs['log_raw'].startswith('1 change points in 2 series over 20 runs.'))
+
+    def test_many_series(self):
+        """Thousands of series of 40 runs, a quarter of them with a change point."""
+        random = np.random.RandomState(3)
+        series = random.normal(100, 5, (2000, 40))
+        series[::4, 25:] += 30
+        start = time.time()
+        found = [change_point_detection.e_divisive(values, random=random) for values in series]
+        LOG.info("E-divisive on %d series: %.3fs", len(series), time.time() - start)
+        # The noise can move a change point by a run.
+        self.assertTrue(
+            all(any(abs(point.index - 25) <= 1 for point in points) for points in found[::4]))
+        false_positives = sum(len(points) for number, points in enumerate(found) if number % 4)
+        self.assertLess(false_positives, 0.1 * 1500)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+"""Unit tests for libanalysis/compare_multiple_reports.py"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+import numpy as np
+
+from common import results_archive
+from libanalysis import compare_multiple_reports
+
+
+def perf_json(ops_per_sec):
+    """A perf.json document with one test at two thread levels."""
+    return {
+        'results': [{
+            'name': 'insert',
+            'results': {
+                '1': {
+                    'ops_per_sec': ops_per_sec
+                },
+                '8': {
+                    'ops_per_sec': 4 * ops_per_sec,
+                    'ops_per_sec_values': [4 * ops_per_sec]
+                }
+            }
+        }]
+    }
+
+
+class CompareReportsIndexTestCase(unittest.TestCase):
+    """Unit tests for the summary index of compare_reports."""
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.index_path = os.path.join(self.work_dir, 'index.npz')
+        self.result_dirs = []
+        for run in range(4):
+            result_dir = os.path.join(self.work_dir, 'reports-2020-01-0{0}T00:00:00'.format(run))
+            os.mkdir(result_dir)
+            self.result_dirs.append(result_dir)
+            if run < 3:
+                self.write_perf_json(result_dir, 100.0 * (run + 1))
+            if run == 1:
+                results_archive.write_from_perf_json(os.path.join(result_dir, 'perf.json'),
+                                                     result_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    @staticmethod
+    def write_perf_json(result_dir, ops_per_sec):
+        """Write the perf.json of a run."""
+        with open(os.path.join(result_dir, 'perf.json'), 'w') as perf_json_file:
+            json.dump(perf_json(ops_per_sec), perf_json_file)
+
+    def update_index(self):
+        """Update the index, and return it with the directories that were read."""
+        with patch('libanalysis.compare_multiple_reports._read_results',
+                   side_effect=compare_multiple_reports._read_results) as read_results:
+            index = compare_multiple_reports.update_index(self.result_dirs, self.index_path)
+        return index, [call[0][0] for call in read_results.call_args_list]
+
+    def assert_results(self, index, result_dir, values):
+        """Assert the results of a run in the index."""
+        table = index[result_dir][1]
+        self.assertEqual(table['test'].tolist(), ['insert', 'insert'])
+        self.assertEqual(table['threads'].tolist(), [1, 8])
+        self.assertEqual(table['metric'].tolist(), ['ops_per_sec', 'ops_per_sec'])
+        self.assertEqual(table['value'].tolist(), values)
+
+    def test_update_index(self):
+        """Only the new and changed directories are read, the others come from the index."""
+        index, read = self.update_index()
+        self.assertEqual(read, self.result_dirs)
+        for run in range(3):
+            self.assert_results(index, self.result_dirs[run],
+                                [100.0 * (run + 1), 400.0 * (run + 1)])
+        self.assertIsNone(index[self.result_dirs[3]][1])
+
+        index, read = self.update_index()
+        self.assertEqual(read, [])
+        for run in range(3):
+            self.assert_results(index, self.result_dirs[run],
+                                [100.0 * (run + 1), 400.0 * (run + 1)])
+        self.assertIsNone(index[self.result_dirs[3]][1])
+
+        # A rewritten perf.json, results of a run that had none, a removed and a new directory.
+        self.write_perf_json(self.result_dirs[2], 50.0)
+        os.utime(os.path.join(self.result_dirs[2], 'perf.json'), ns=(0, 2 * 10**18))
+        self.write_perf_json(self.result_dirs[3], 70.0)
+        os.utime(self.result_dirs[3], ns=(0, 2 * 10**18))
+        removed = self.result_dirs.pop(0)
+        new_dir = os.path.join(self.work_dir, 'reports-2020-01-05T00:00:00')
+        os.mkdir(new_dir)
+        self.write_perf_json(new_dir, 10.0)
+        self.result_dirs.append(new_dir)
+        index, read = self.update_index()
+        self.assertEqual(read, self.result_dirs[1:])
+        self.assertNotIn(removed, index)
+        self.assert_results(index, self.result_dirs[0], [200.0, 800.0])
+        self.assert_results(index, self.result_dirs[1], [50.0, 200.0])
+        self.assert_results(index, self.result_dirs[2], [70.0, 280.0])
+        self.assert_results(index, new_dir, [10.0, 40.0])
+        self.assertEqual(compare_multiple_reports.load_index(self.index_path).keys(), index.keys())
+
+    def test_unreadable_index(self):
+        """An index that can't be read is built again."""
+        with open(self.index_path, 'w') as index_file:
+            index_file.write('not an index')
+        index, read = self.update_index()
+        self.assertEqual(read, self.result_dirs)
+        self.assertEqual(sorted(index), self.result_dirs)
+        self.assertEqual(sorted(compare_multiple_reports.load_index(self.index_path)),
+                         self.result_dirs)
+
+    def test_compare_reports(self):
+        """The CSV files and graphs are built from the index."""
+        with patch('libanalysis.compare_multiple_reports._graph') as graph:
+            cwd = os.getcwd()
+            os.chdir(self.work_dir)
+            try:
+                compare_multiple_reports.compare_reports({'test_control': {
+                    'task_name': 'task'
+                }}, None)
+                self.assertTrue(os.path.isfile(compare_multiple_reports.INDEX_FILE))
+            finally:
+                os.chdir(cwd)
+        graph.assert_called_once()
+        workload, metric, tasks, thread_levels, rows = graph.call_args[0]
+        self.assertEqual((workload, metric), ('insert', 'ops_per_sec'))
+        self.assertEqual(tasks, ['task_0100T0000', 'task_0101T0000', 'task_0102T0000'])
+        self.assertEqual(thread_levels, [1, 8])
+        np.testing.assert_array_equal(
+            rows, [['task_0100T0000', 100.0, 400.0], ['task_0101T0000', 200.0, 800.0],
+                   ['task_0102T0000', 300.0, 1200.0]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,10 +4,16 @@ Unit tests for `ftdc_analysis.py`
 import os
 import queue as Queue
 import shutil
+import tempfile
 import unittest
 
+from mock import patch
+
 from test_lib.fixture_files import FixtureFiles
 import libanalysis.ftdc_analysis as ftdc_analysis
+import libanalysis.readers as readers
+import libanalysis.rules as rules
+import libanalysis.util as util
 
 FIXTURE_FILES = FixtureFiles(os.path.join(os.path.dirname(__file__)), 'analysis')
 
@@ -33,8 +39,7 @@ class TestFtdcAnalysis(unittest.TestCase):
                         ]
                     },
                     'resource_rules_ftdc_file': {
-                        # FIXME: This test takes 80 seconds. Maybe use smaller ftdc file?
-                        'default': []  #['ftdc_replica_lag_check']
+                        'default': ['ftdc_replica_lag_check']
                     }
                 }
             }
@@ -52,6 +57,73 @@ class TestFtdcAnalysis(unittest.TestCase):
         print(expected_result)
         self.assertEqual(observed_result, expected_result)
 
+    def test_resource_rules_workers(self):
+        """
+        FTDC files checked in a process pool give the same result as when checked one by one
+        """
+        dir_path = tempfile.mkdtemp()
+        for test_name, host_alias, fixture in (
+            ('test_a', 'mongod.0', 'linux_3node_replSet_p1.ftdc.metrics'),
+            ('test_a', 'mongod.1', 'core_workloads_wt.ftdc.metrics'),
+            ('test_b', 'mongod.0', 'test_replset_resource_rules/metrics.3shard_p1_repl'),
+            ('test_b', 'mongod.1', 'test_repllag/metrics.mongod.0')):
+            diagnostic_data = os.path.join(dir_path, test_name, host_alias, 'diagnostic.data')
+            os.makedirs(diagnostic_data)
+            shutil.copy(FIXTURE_FILES.fixture_file_path(fixture), diagnostic_data)
+        config = {
+            'analysis': {
+                'ftdc_workers': 1,
+                'rules': {
+                    'resource_rules_ftdc_chunk': {
+                        'default': ['below_configured_cache_size', 'max_connections']
+                    },
+                    'resource_rules_ftdc_file': {
+                        'default': []
+                    }
+                }
+            }
+        }
+        try:
+            serial = ftdc_analysis.resource_rules(config, dir_path, 'linux-3-node-replSet',
+                                                  {'max_thread_level': 1})
+            config['analysis']['ftdc_workers'] = 3
+            pooled = ftdc_analysis.resource_rules(config, dir_path, 'linux-3-node-replSet',
+                                                  {'max_thread_level': 1})
+        finally:
+            shutil.rmtree(dir_path)
+        self.assertEqual(serial['status'], 'fail')
+        failed = [line for line in serial['log_raw'].splitlines() if line.startswith('Failed')]
+        self.assertEqual(failed, [
+            'Failed resource sanity check test_a for host mongod.0',
+            'Failed resource sanity check test_b for host mongod.0',
+            'Failed resource sanity check test_b for host mongod.1'
+        ])
+        self.assertEqual(serial, pooled)
+
+    def test_file_decoded_once(self):
+        """
+        The chunk rules and ftdc_replica_lag_check are checked on one decoding of the FTDC file,
+        with the same failures as ftdc_replica_lag_check() reading the file itself
+        """
+        path_ftdc = FIXTURE_FILES.fixture_file_path('test_repllag/metrics.mongod.0')
+        test_times = util.get_test_times(FIXTURE_FILES.fixture_file_path('test_repllag/perf.json'))
+        lag_failures = rules.ftdc_replica_lag_check(path_ftdc, test_times)
+        self.assertTrue(lag_failures)
+        with patch('libanalysis.readers.read_ftdc', wraps=readers.read_ftdc) as mock_read_ftdc:
+            passed_checks, log_raw = ftdc_analysis._process_ftdc_file(path_ftdc,
+                                                                      ['max_connections'],
+                                                                      ['ftdc_replica_lag_check'], {
+                                                                          'test_times': test_times,
+                                                                          'max_thread_level': 0
+                                                                      })
+        mock_read_ftdc.assert_called_once_with(path_ftdc, keys=rules.FTDC_RULE_KEYS)
+        self.assertFalse(passed_checks)
+        self.assertIn('\nRULE max_connections', log_raw)
+        task_run_time = sum(chunk.nsamples for chunk in readers.read_ftdc(path_ftdc))
+        self.assertIn(
+            ftdc_analysis._ftdc_file_failure_raw({'ftdc_replica_lag_check': lag_failures},
+                                                 task_run_time), log_raw)
+
     def test_failure_message(self):
         """
         Test formatting of the failure_message() in ftdc_analysis.
@@ -63,8 +135,7 @@ class TestFtdcAnalysis(unittest.TestCase):
         perf_json = os.path.join(path_ftdc_repllag, 'perf.json')
         test_times = util.get_test_times(perf_json)
         MS = 1000
-        output = ftdc_analysis._ftdc_file_rule_evaluation(
-            path_ftdc, "sys-perf", "linux-3-node-replSet", test_times)
+        output = rules.ftdc_replica_lag_check(path_ftdc, test_times)
         import pprint
         pprint.pprint(output)
         self.assertEqual(output, "")
@@ -0,0 +1,135 @@
+"""Unit tests for libanalysis/ftdc_cache.py"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+
+from libanalysis import ftdc_cache
+from libanalysis import readers
+from libanalysis import rules
+from test_lib.fixture_files import FixtureFiles
+
+FIXTURE_FILES = FixtureFiles(os.path.dirname(__file__), 'analysis')
+
+
+class FtdcCacheTestCase(unittest.TestCase):
+    """Unit tests for the cache of decoded FTDC chunks."""
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.ftdc_file = os.path.join(self.work_dir, 'metrics.mongod.0')
+        shutil.copy(FIXTURE_FILES.fixture_file_path('core_workloads_wt.ftdc.metrics'),
+                    self.ftdc_file)
+        self.cache = ftdc_cache.FtdcCache(os.path.join(self.work_dir, 'cache'), 100 * ftdc_cache.MB)
+        self.previous_cache = readers.set_cache(self.cache)
+
+    def tearDown(self):
+        readers.set_cache(self.previous_cache)
+        shutil.rmtree(self.work_dir)
+
+    def assert_same_chunks(self, expected, observed):
+        self.assertEqual(len(expected), len(observed))
+        for expected_chunk, observed_chunk in zip(expected, observed):
+            self.assertEqual(list(expected_chunk), list(observed_chunk))
+            self.assertEqual(expected_chunk.nsamples, observed_chunk.nsamples)
+            self.assertEqual(expected_chunk.chunk_len, observed_chunk.chunk_len)
+            for key, values in expected_chunk.items():
+                self.assertEqual(values.tolist(), observed_chunk[key].tolist())
+
+    def test_hit(self):
+        """The second read of a file comes from the cache, with the same chunks."""
+        missed = list(readers.read_ftdc(self.ftdc_file, keys=rules.FTDC_RULE_KEYS))
+        hit = list(readers.read_ftdc(self.ftdc_file, keys=rules.FTDC_RULE_KEYS))
+        self.assertEqual(self.cache.stats, {'hits': 1, 'misses': 1, 'evictions': 0})
+        self.assert_same_chunks(missed, hit)
+        readers.set_cache(None)
+        self.assert_same_chunks(list(readers.read_ftdc(self.ftdc_file, keys=rules.FTDC_RULE_KEYS)),
+                                hit)
+
+    def test_first_only(self):
+        """first_only reads are cached separately."""
+        list(readers.read_ftdc(self.ftdc_file, keys=rules.FTDC_RULE_KEYS))
+        first = list(readers.read_ftdc(self.ftdc_file, first_only=True, keys=rules.FTDC_RULE_KEYS))
+        cached = list(readers.read_ftdc(self.ftdc_file, first_only=True, keys=rules.FTDC_RULE_KEYS))
+        self.assertEqual(self.cache.stats['misses'], 2)
+        self.assert_same_chunks(first, cached)
+
+    def test_miss(self):
+        """A different selection of metrics or a modified file is a miss."""
+        list(readers.read_ftdc(self.ftdc_file, keys=rules.FTDC_RULE_KEYS))
+        list(readers.read_ftdc(self.ftdc_file, keys=[rules.FTDC_KEYS['time']]))
+        os.utime(self.ftdc_file, (1, 1))
+        list(readers.read_ftdc(self.ftdc_file, keys=rules.FTDC_RULE_KEYS))
+        self.assertEqual(self.cache.stats['misses'], 3)
+        self.assertEqual(self.cache.stats['hits'], 0)
+
+    def test_entry_name(self):
+        """The FTDC file isn't read to find its entry."""
+        with patch('builtins.open', side_effect=AssertionError('read')):
+            name = ftdc_cache.entry_name(self.ftdc_file, False, rules.FTDC_RULE_KEYS)
+        self.assertEqual(name, ftdc_cache.entry_name(self.ftdc_file, False, rules.FTDC_RULE_KEYS))
+        self.assertNotEqual(name, ftdc_cache.entry_name(self.ftdc_file, True, rules.FTDC_RULE_KEYS))
+
+    def test_not_selective(self):
+        """Reads of all metrics are not cached."""
+        list(readers.read_ftdc(self.ftdc_file))
+        self.assertEqual(self.cache.stats['misses'], 0)
+        self.assertFalse(os.path.exists(self.cache.directory))
+
+    def test_partial_read(self):
+        """Nothing is stored until all chunks have been read."""
+        next(readers.read_ftdc(self.ftdc_file, keys=rules.FTDC_RULE_KEYS))
+        self.assertFalse(os.path.exists(self.cache.directory))
+
+    def test_unreadable_entry(self):
+        """A corrupt entry is a miss, and is replaced."""
+        list(readers.read_ftdc(self.ftdc_file, keys=rules.FTDC_RULE_KEYS))
+        entry = os.path.join(self.cache.directory, os.listdir(self.cache.directory)[0])
+        with open(entry, 'w') as entry_file:
+            entry_file.write('garbage')
+        list(readers.read_ftdc(self.ftdc_file, keys=rules.FTDC_RULE_KEYS))
+        list(readers.read_ftdc(self.ftdc_file, keys=rules.FTDC_RULE_KEYS))
+        self.assertEqual(self.cache.stats, {'hits': 1, 'misses': 2, 'evictions': 0})
+
+    def test_unwritable_cache(self):
+        """The chunks are read even if the cache directory can't be created."""
+        with open(self.cache.directory, 'w') as not_a_directory:
+            not_a_directory.write('file')
+        self.assertTrue(list(readers.read_ftdc(self.ftdc_file, keys=rules.FTDC_RULE_KEYS)))
+        self.assertEqual(self.cache.stats['misses'], 1)
+
+    def test_failed_write(self):
+        """An entry that can't be written, e.g. on a full disk, leaves no temporary file."""
+        with patch('libanalysis.ftdc_cache.store_chunks', side_effect=OSError('No space left')):
+            self.assertTrue(list(readers.read_ftdc(self.ftdc_file, keys=rules.FTDC_RULE_KEYS)))
+        self.assertEqual(os.listdir(self.cache.directory), [])
+
+    def test_eviction(self):
+        """The least recently used entries are evicted above the maximum size."""
+        self.cache.max_bytes = 1
+        list(readers.read_ftdc(self.ftdc_file, keys=rules.FTDC_RULE_KEYS))
+        list(readers.read_ftdc(self.ftdc_file, keys=[rules.FTDC_KEYS['time']]))
+        self.assertEqual(self.cache.stats['evictions'], 1)
+        self.assertEqual(len(os.listdir(self.cache.directory)), 1)
+        list(readers.read_ftdc(self.ftdc_file, keys=[rules.FTDC_KEYS['time']]))
+        self.assertEqual(self.cache.stats['hits'], 1)
+
+    def test_from_config(self):
+        """The cache is configured in analysis.ftdc_cache."""
+        self.assertIsNone(ftdc_cache.from_config({'analysis': {}}))
+        cache = ftdc_cache.from_config(
+            {'analysis': {
+                'ftdc_cache': {
+                    'enabled': True,
+                    'directory': 'cache',
+                    'max_size_mb': 2
+                }
+            }})
+        self.assertEqual(cache.directory, 'cache')
+        self.assertEqual(cache.max_bytes, 2 * ftdc_cache.MB)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,187 @@
+"""Unit tests for common/ftdc_tail.py"""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from mock import Mock, patch
+
+from common import ftdc_tail
+from common.local_host import LocalHost
+from libanalysis import ftdc_analysis
+from libanalysis import readers
+from libanalysis import rules
+from test_lib.fixture_files import FixtureFiles
+
+FIXTURE_FILES = FixtureFiles(os.path.dirname(__file__), 'analysis')
+
+FIXTURE = 'test_replset_resource_rules/metrics.3shard_p1_repl'
+CHUNK_RULES = ['below_configured_cache_size', 'max_connections']
+CONSTANT_VALUES = {'max_thread_level': 1, 'test_times': None}
+
+
+class FtdcTailTestCase(unittest.TestCase):
+    """Unit tests for the checks of FTDC data during a test."""
+    def setUp(self):
+        self.diagnostic_data = tempfile.mkdtemp()
+        with open(FIXTURE_FILES.fixture_file_path(FIXTURE), 'rb') as ftdc_file:
+            self.data = ftdc_file.read()
+        self.chunks = list(readers.read_ftdc(FIXTURE_FILES.fixture_file_path(FIXTURE)))
+
+    def tearDown(self):
+        shutil.rmtree(self.diagnostic_data)
+
+    def write(self, name, data, mode='ab'):
+        """Write `data` to a file in diagnostic.data, as mongod would."""
+        with open(os.path.join(self.diagnostic_data, name), mode) as ftdc_file:
+            ftdc_file.write(data)
+
+    def make_tail(self, start_ms=0):
+        """An FtdcTail of the local diagnostic.data."""
+        return ftdc_tail.FtdcTail(LocalHost(), self.diagnostic_data, CHUNK_RULES, CONSTANT_VALUES,
+                                  start_ms)
+
+    def expected_failures(self, chunks):
+        """The names of the rules that fail on each chunk, as analysis.py checks them."""
+        constant_values = dict(CONSTANT_VALUES)
+        return [
+            rule_name for chunk in chunks
+            for rule_name in ftdc_analysis.check_chunk(chunk, CHUNK_RULES, constant_values)
+        ]
+
+    def test_incremental(self):
+        """The file is read as it grows, even in the middle of a chunk, and each chunk is checked
+        once."""
+        tail = self.make_tail()
+        failures = []
+        for start in range(0, len(self.data), 7919):
+            self.write('metrics.2019-09-09T17-24-55Z-00000', self.data[start:start + 7919])
+            failures += tail.poll()
+        self.assertEqual(tail.samples, sum(chunk.nsamples for chunk in self.chunks))
+        self.assertEqual([failure.split('\n')[0] for failure in failures],
+                         ['RULE ' + name for name in self.expected_failures(self.chunks)])
+        self.assertTrue(failures)
+        self.assertEqual(tail.pending, {})
+
+    def test_interim(self):
+        """The samples of metrics.interim are not checked again once they are in a metrics
+        file."""
+        tail = self.make_tail()
+        self.write(
+            'metrics.interim',
+            self.data[:int(readers.read_index(FIXTURE_FILES.fixture_file_path(FIXTURE))[3][0])])
+        tail.poll()
+        self.assertEqual(tail.samples, sum(chunk.nsamples for chunk in self.chunks[:3]))
+        self.write('metrics.2019-09-09T17-24-55Z-00000', self.data)
+        self.write('metrics.interim', b'', mode='wb')
+        tail.poll()
+        self.assertEqual(tail.samples, sum(chunk.nsamples for chunk in self.chunks))
+
+    def test_test_start(self):
+        """Only the samples since the start of the test are checked."""
+        times = self.chunks[8][rules.FTDC_KEYS['time']]
+        tail = self.make_tail(start_ms=int(times[4]))
+        self.write('metrics.2019-09-09T17-24-55Z-00000', self.data)
+        tail.poll()
+        self.assertEqual(tail.samples,
+                         len(times) - 5 + sum(chunk.nsamples for chunk in self.chunks[9:]))
+
+    def test_skip_existing(self):
+        """The data of the metrics files that exist when the test starts is not read."""
+        name = 'metrics.2019-09-09T17-24-55Z-00000'
+        self.write(name, self.data)
+        self.write('metrics.interim', self.data[:100])
+        tail = self.make_tail()
+        tail.skip_existing()
+        self.assertEqual(tail.offsets, {name: len(self.data)})
+        self.write('metrics.interim', b'', mode='wb')
+        self.write(name, self.data)
+        with patch.object(tail.host, 'read_file', wraps=tail.host.read_file) as read_file:
+            tail.poll()
+        read_file.assert_any_call(os.path.join(self.diagnostic_data, name), len(self.data))
+        self.assertEqual(tail.samples, sum(chunk.nsamples for chunk in self.chunks))
+
+    def test_live_chunk_rules(self):
+        """Rules that need constants only known after the test are skipped."""
+        config = {
+            'mongodb_setup': {
+                'meta': {
+                    'mongodb_setup': 'replica'
+                }
+            },
+            'analysis': {
+                'rules': {
+                    'resource_rules_ftdc_chunk': {
+                        'default': CHUNK_RULES + ['repl_member_state', 'ftdc_replica_lag_check']
+                    }
+                }
+            }
+        }
+        self.assertEqual(ftdc_tail.live_chunk_rules(config, {'test_times': None}),
+                         ['below_configured_cache_size', 'repl_member_state'])
+        self.assertEqual(ftdc_tail.live_chunk_rules(config, CONSTANT_VALUES),
+                         CHUNK_RULES + ['repl_member_state'])
+
+    @patch('common.ftdc_tail.FtdcTailThread._make_tails')
+    def test_abort(self, mock_make_tails):
+        """With abort_on_failure, the test is aborted at the first failure."""
+        tail = self.make_tail()
+        mock_make_tails.return_value = [tail]
+        self.write('metrics.2019-09-09T17-24-55Z-00000', self.data)
+        aborted = threading.Event()
+        abort = Mock(side_effect=lambda message: aborted.set())
+        config = {
+            'test_control': {
+                'ftdc_tail': {
+                    'enabled': True,
+                    'interval_seconds': 0.01,
+                    'abort_on_failure': True
+                }
+            }
+        }
+        stop = ftdc_tail.start({'id': 'test'}, config, abort)
+        self.assertTrue(aborted.wait(10))
+        stop()
+        abort.assert_called_once_with(
+            'Aborted test test: FTDC resource rules failed during the test')
+
+    @patch('common.ftdc_tail.FtdcTailThread._make_tails')
+    def test_make_tails_failure(self, mock_make_tails):
+        """The test goes on without the checks if the hosts can't be reached."""
+        mock_make_tails.side_effect = IOError('unreachable')
+        abort = Mock()
+        config = {'test_control': {'ftdc_tail': {'enabled': True, 'abort_on_failure': True}}}
+        ftdc_tail.start({'id': 'test'}, config, abort)()
+        abort.assert_not_called()
+
+    def test_aborts_on_failure(self):
+        """Only an enabled thread with abort_on_failure aborts tests."""
+        self.assertFalse(ftdc_tail.aborts_on_failure({'test_control': {}}))
+        self.assertFalse(
+            ftdc_tail.aborts_on_failure(
+                {'test_control': {
+                    'ftdc_tail': {
+                        'enabled': False,
+                        'abort_on_failure': True
+                    }
+                }}))
+        self.assertTrue(
+            ftdc_tail.aborts_on_failure(
+                {'test_control': {
+                    'ftdc_tail': {
+                        'enabled': True,
+                        'abort_on_failure': True
+                    }
+                }}))
+
+    def test_disabled(self):
+        """Nothing is started unless enabled."""
+        with patch('common.ftdc_tail.FtdcTailThread') as mock_thread:
+            ftdc_tail.start({'id': 'test'}, {'test_control': {}}, Mock())()
+        mock_thread.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
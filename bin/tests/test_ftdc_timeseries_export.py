@@ -0,0 +1,160 @@
+"""Unit tests for libanalysis/ftdc_timeseries_export.py"""
+
+import csv
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from libanalysis import ftdc_timeseries_export
+from libanalysis import readers
+from test_lib.fixture_files import FixtureFiles
+
+FIXTURE_FILES = FixtureFiles(os.path.dirname(__file__), 'analysis')
+
+METRICS = [{
+    'name': 'connections',
+    'key': ['serverStatus', 'connections', 'current']
+}, {
+    'name': 'opcounters_insert',
+    'key': ['serverStatus', 'opcounters', 'insert'],
+    'counter': True
+}, {
+    'name': 'cpu_user_ms',
+    'key': ['systemMetrics', 'cpu', 'user_ms'],
+    'counter': True
+}]
+
+NODES = {'mongod.0': 'core_workloads_wt.ftdc.metrics', 'mongod.1': 'test_repllag/metrics.mongod.0'}
+EXPORTED = (('mongod.0', ['connections', 'opcounters_insert']),
+            ('mongod.1', ['connections', 'cpu_user_ms', 'opcounters_insert', 'repl_lag_ms']))
+
+
+def reference_lttb(x, y, max_points):
+    """LTTB as usually written, one bucket at a time."""
+    every = (len(x) - 2) / (max_points - 2)
+    selected = [0]
+    for bucket in range(max_points - 2):
+        start = int(np.floor(bucket * every)) + 1
+        end = int(np.floor((bucket + 1) * every)) + 1
+        next_end = min(int(np.floor((bucket + 2) * every)) + 1, len(x))
+        average_x, average_y = np.mean(x[end:next_end]), np.mean(y[end:next_end])
+        previous = selected[-1]
+        areas = [
+            abs((x[previous] - average_x) * (y[index] - y[previous]) - (x[previous] - x[index]) *
+                (average_y - y[previous])) for index in range(start, end)
+        ]
+        selected.append(start + int(np.argmax(areas)))
+    return selected + [len(x) - 1]
+
+
+class FtdcTimeseriesExportTestCase(unittest.TestCase):
+    """Unit tests for the FTDC time series export."""
+    def setUp(self):
+        self.reports = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.reports)
+
+    def test_lttb(self):
+        """The points kept are the same as with the usual algorithm, at most max_points of them."""
+        random = np.random.RandomState(2)
+        x = np.cumsum(random.randint(1, 1000, size=5001)).astype(float)
+        y = random.standard_normal(5001)
+        for max_points in (3, 10, 333, 5000):
+            kept = ftdc_timeseries_export.lttb(x, y, max_points)
+            self.assertEqual(kept.tolist(), reference_lttb(x, y, max_points))
+        self.assertEqual(ftdc_timeseries_export.lttb(x, y, 6000).tolist(), list(range(5001)))
+
+    def test_lttb_keeps_spike(self):
+        """A single spike survives downsampling."""
+        y = np.zeros(10000)
+        y[4321] = 100.0
+        kept = ftdc_timeseries_export.lttb(np.arange(10000), y, 100)
+        self.assertIn(4321, kept.tolist())
+
+    def test_counter_rates(self):
+        """Rates per second, counting up from 0 after a reset."""
+        times, rates = ftdc_timeseries_export.counter_rates(np.array([0, 500, 1500, 1500, 2500]),
+                                                            np.array([10.0, 20.0, 5.0, 6.0, 16.0]))
+        self.assertEqual(times.tolist(), [500, 1500, 2500])
+        self.assertEqual(rates.tolist(), [20.0, 5.0, 10.0])
+
+    def test_repl_lag(self):
+        """The lag of the furthest behind secondary in each sample."""
+        path = FIXTURE_FILES.fixture_file_path('test_repllag/metrics.mongod.0')
+        chunks = [chunk for chunk in readers.read_ftdc(path) if chunk]
+        # No primary yet in the first chunks.
+        self.assertTrue(np.isnan(ftdc_timeseries_export.chunk_repl_lag(chunks[0])).all())
+        chunk = chunks[4]
+        lag = ftdc_timeseries_export.chunk_repl_lag(chunk)
+        self.assertEqual(len(lag), chunk.nsamples)
+        sample = int(np.argmax(lag))
+        self.assertEqual(lag[sample], 13000.0)
+        members = {
+            key[2]: (chunk[key][sample], chunk[key[:3] + ('state', )][sample])
+            for key in chunk
+            if key[:2] == ('replSetGetStatus', 'members') and key[3:] == ('optimeDate', )
+        }
+        primary = [optime for optime, state in members.values() if state == 1][0]
+        secondary = min(optime for optime, state in members.values() if state == 2)
+        self.assertEqual(lag[sample], primary - secondary)
+
+    def test_export(self):
+        """Each node gets a CSV and an .npz file with the same downsampled series."""
+        for host_alias, fixture in NODES.items():
+            diagnostic_data = os.path.join(self.reports, 'test_a', host_alias, 'diagnostic.data')
+            os.makedirs(diagnostic_data)
+            shutil.copy(FIXTURE_FILES.fixture_file_path(fixture), diagnostic_data)
+        config = {
+            'analysis': {
+                'ftdc_timeseries': {
+                    'max_points': 50,
+                    'metrics': METRICS
+                }
+            },
+            'test_control': {
+                'reports_dir_basename': self.reports
+            }
+        }
+        ftdc_timeseries_export.ftdc_timeseries(config, None)
+
+        for host_alias, names in EXPORTED:
+            node_dir = os.path.join(self.reports, 'test_a', host_alias)
+            with np.load(os.path.join(node_dir, 'ftdc_timeseries.npz')) as archive:
+                arrays = dict(archive)
+            self.assertEqual(
+                sorted(arrays),
+                sorted(['time.' + name for name in names] + ['value.' + name for name in names]))
+            with open(os.path.join(node_dir, 'ftdc_timeseries.csv')) as csv_file:
+                rows = list(csv.reader(csv_file))
+            self.assertEqual(rows[0], ['metric', 'time_ms', 'value'])
+            for name in names:
+                times = arrays['time.' + name]
+                self.assertEqual(len(times), 50)
+                self.assertTrue(np.all(np.diff(times) > 0))
+                self.assertEqual([int(row[1]) for row in rows if row[0] == name], times.tolist())
+
+    def test_full_series(self):
+        """Without downsampling, gauges are the FTDC values and counters their rates."""
+        path = FIXTURE_FILES.fixture_file_path('core_workloads_wt.ftdc.metrics')
+        metrics = [(metric['name'], tuple(metric['key']), metric.get('counter', False))
+                   for metric in METRICS]
+        series = ftdc_timeseries_export.read_series([path], metrics, repl_lag=False)
+        chunks = list(readers.read_ftdc(path))
+        times = np.concatenate([chunk[('start', )] for chunk in chunks])
+        connections = np.concatenate(
+            [chunk[('serverStatus', 'connections', 'current')] for chunk in chunks])
+        inserts = np.concatenate(
+            [chunk[('serverStatus', 'opcounters', 'insert')] for chunk in chunks])
+        self.assertEqual(sorted(series), ['connections', 'opcounters_insert'])
+        self.assertEqual(series['connections'][0].tolist(), times.tolist())
+        self.assertEqual(series['connections'][1].tolist(), connections.tolist())
+        self.assertEqual(series['opcounters_insert'][1].tolist(),
+                         (np.diff(inserts) / (np.diff(times) / 1000.0)).tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+"""Unit tests for common/latency_distribution.py"""
+
+import unittest
+
+from common import latency_distribution
+from common.workload_output_parser import Results
+
+
+class LatencyDistributionTestCase(unittest.TestCase):
+    """Unit tests for creating and merging latency distributions."""
+    def test_from_percentiles(self):
+        """Percentile keys are normalized."""
+        distribution = latency_distribution.from_percentiles({
+            50: 1,
+            '99.9': 3,
+            'p95': 2,
+            'max': 4
+        }, 10)
+        self.assertEqual(distribution, {
+            'runs': 1,
+            'count': 10,
+            'percentiles': {
+                'p50': 1.0,
+                'p99.9': 3.0,
+                'p95': 2.0,
+                'max': 4.0
+            }
+        })
+
+    def test_from_histogram(self):
+        """Percentiles are derived from the buckets, unless reported by the benchmark."""
+        distribution = latency_distribution.from_histogram([1, 2, 3, 4], [50, 40, 0, 10],
+                                                           {'min': 0.5})
+        self.assertEqual(distribution['count'], 100)
+        self.assertEqual(distribution['histogram'], {
+            'bounds': [1.0, 2.0, 4.0],
+            'counts': [50, 40, 10]
+        })
+        self.assertEqual(distribution['percentiles'], {
+            'min': 0.5,
+            'p50': 1.0,
+            'p90': 2.0,
+            'p99': 4.0,
+            'p99.9': 4.0,
+            'max': 4.0
+        })
+
+    def test_merge_identical(self):
+        """Merging a distribution with itself doesn't change its percentiles."""
+        distribution = latency_distribution.from_percentiles(
+            {
+                'min': 1,
+                50: 10,
+                99: 100,
+                'max': 1000
+            }, 500)
+        merged = latency_distribution.merge(distribution, distribution)
+        self.assertEqual(merged['runs'], 2)
+        self.assertEqual(merged['count'], 1000)
+        for key, value in distribution['percentiles'].items():
+            self.assertAlmostEqual(merged['percentiles'][key], value)
+
+    def test_merge_weighted(self):
+        """Runs with more samples weigh more, min and max are kept."""
+        fast = latency_distribution.from_percentiles({'min': 1, 50: 2, 'max': 3}, 900)
+        slow = latency_distribution.from_percentiles({'min': 10, 50: 20, 'max': 30}, 100)
+        merged = latency_distribution.merge(fast, slow)
+        self.assertEqual(merged['percentiles']['min'], 1)
+        self.assertEqual(merged['percentiles']['max'], 30)
+        self.assertGreater(merged['percentiles']['p50'], 2)
+        self.assertLess(merged['percentiles']['p50'], 3)
+
+    def test_merge_no_samples(self):
+        """Runs that report a count of 0 weigh the same."""
+        first = latency_distribution.from_percentiles({50: 2}, 0)
+        second = latency_distribution.from_percentiles({50: 4}, 0)
+        merged = latency_distribution.merge(first, second)
+        self.assertEqual(merged['count'], 0)
+        self.assertGreaterEqual(merged['percentiles']['p50'], 2)
+        self.assertLessEqual(merged['percentiles']['p50'], 4)
+
+    def test_merge_no_percentiles(self):
+        """Distributions without percentiles are left out of the merged percentiles."""
+        empty = latency_distribution.from_percentiles({}, 10)
+        distribution = latency_distribution.from_percentiles({'min': 1, 50: 2, 'max': 3}, 10)
+        self.assertEqual(latency_distribution.merge(empty, empty)['percentiles'], {})
+        merged = latency_distribution.merge(empty, distribution)
+        for key, value in distribution['percentiles'].items():
+            self.assertAlmostEqual(merged['percentiles'][key], value)
+
+    def test_merge_histograms(self):
+        """Histogram buckets are summed."""
+        first = latency_distribution.from_histogram([1, 2], [1, 2])
+        second = latency_distribution.from_histogram([2, 3], [3, 4])
+        merged = latency_distribution.merge(first, second)
+        self.assertEqual(merged['histogram'], {'bounds': [1.0, 2.0, 3.0], 'counts': [1, 5, 4]})
+        self.assertEqual(merged['count'], 10)
+
+    def test_add_distribution(self):
+        """Repeated runs of a test merge their distributions instead of averaging them."""
+        results = Results('does-not-exist.json', 'wiredTiger')
+        for _ in range(2):
+            results.add_distribution('ycsb', 1, 2, 'test',
+                                     latency_distribution.from_percentiles({99: 5}, 10), '8')
+        thread_results = results.results[0]['results']['8']
+        self.assertEqual(thread_results['latency_us_distribution'], {
+            'runs': 2,
+            'count': 20,
+            'percentiles': {
+                'p99': 5.0
+            }
+        })
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,43 @@
 """Unit tests for `log_analysis.py`."""
 
+import gzip
+import os
 from os import path
+import shutil
+import subprocess
+import tempfile
 import unittest
 
+from dateutil import parser as date_parser
+from mock import patch
+
 from test_lib.fixture_files import FixtureFiles
 import libanalysis.log_analysis as log_analysis
+import libanalysis.rules as rules
 
 FIXTURE_FILES = FixtureFiles(path.join(path.dirname(__file__)), 'analysis')
 
+RULES = {
+    'bad_log_types': ["F", "E"],
+    'bad_messages': [
+        'starting an election', 'election succeeded', 'transition to primary',
+        'posix_fallocate failed'
+    ]
+}
+
+LOG_LINES = [
+    '2016-07-14T01:00:{0:02}.000+0000 I NETWORK [conn{0}] end connection\n',
+    '2016-07-14T01:00:{0:02}.000+0000 E STORAGE [conn{0}] error {0}\n',
+    '2016-07-14T01:00:{0:02}.000+0000 I REPL [conn{0}] transition to PRIMARY\n',
+    '{{"t":{{"$date":"2016-07-14T01:00:{0:02}.000Z"}},"s":"I","c":"REPL","ctx":"conn{0}",'
+    '"msg":"transition to {{newState}}","attr":{{"newState":"PRIMARY"}}}}\n',
+    '{{"t":{{"$date":"2016-07-14T01:00:{0:02}.000Z"}},"s":"I","c":"NETWORK","ctx":"conn{0}",'
+    '"msg":"Connection ended","attr":{{"connectionId":{0}}}}}\n',
+    '{{"t":{{"$date":"2016-07-14T01:00:{0:02}.000Z"}},"s":"F","c":"NETWORK","ctx":"conn{0}",'
+    '"msg":"Connection ended"}}\n',
+    '\n',
+]
+
 
 class TestLogAnalysis(unittest.TestCase):
     """Test suite."""
@@ -21,3 +51,150 @@ class TestLogAnalysis(unittest.TestCase):
         ])
         actual_paths = set(log_analysis._get_log_file_paths(log_dir))
         self.assertEqual(expected_paths, actual_paths)
+
+    def test_get_bad_log_lines(self):
+        """The prefiltered and pooled scans find the same bad lines as is_log_line_bad()."""
+        log_dir = tempfile.mkdtemp()
+        try:
+            for host in range(3):
+                os.makedirs(path.join(log_dir, 'test_a', 'mongod.{}'.format(host)))
+                with open(path.join(log_dir, 'test_a', 'mongod.{}'.format(host), 'mongod.log'),
+                          'w') as log_file:
+                    log_file.writelines(LOG_LINES[(second + host) % len(LOG_LINES)].format(second)
+                                        for second in range(60))
+            test_times = [(date_parser.parse("2016-07-14T01:00:10.000+0000"),
+                           date_parser.parse("2016-07-14T01:00:50.000+0000"))]
+            expected = []
+            for log_path in log_analysis._get_log_file_paths(log_dir):
+                with open(log_path) as log_file:
+                    expected.append((log_path, [
+                        line for line in log_file
+                        if line != "\n" and rules.is_log_line_bad(line, RULES, test_times)
+                    ]))
+            serial = log_analysis._get_bad_log_lines(log_dir, RULES, test_times)
+            pooled = log_analysis._get_bad_log_lines(log_dir, RULES, test_times, workers=3)
+        finally:
+            shutil.rmtree(log_dir)
+        self.assertEqual(len(expected), 3)
+        self.assertTrue(all(bad_lines for _, bad_lines in expected))
+        self.assertEqual(serial, expected)
+        self.assertEqual(pooled, expected)
+
+    @unittest.skipUnless(shutil.which('zstd'), 'needs the zstd command')
+    def test_rotated_and_compressed_logs(self):
+        """The bad lines of the rotated and compressed logs of a node are merged by timestamp."""
+        log_dir = tempfile.mkdtemp()
+        try:
+            node_dir = path.join(log_dir, 'test_a', 'mongod.0')
+            os.makedirs(node_dir)
+            lines = [LOG_LINES[second % len(LOG_LINES)].format(second) for second in range(60)]
+            # Rotated at 01:00:20 and 01:00:40, the current log is compressed with zstd.
+            with gzip.open(path.join(node_dir, 'mongod.log.2016-07-14T01-00-20.gz'), 'wt') as log:
+                log.writelines(lines[:20])
+            with open(path.join(node_dir, 'mongod.log.2016-07-14T01-00-40'), 'w') as log:
+                log.writelines(lines[20:40])
+            with open(path.join(node_dir, 'mongod.log'), 'w') as log:
+                log.writelines(lines[40:])
+            subprocess.check_call(['zstd', '-q', '--rm', path.join(node_dir, 'mongod.log')])
+            with open(path.join(node_dir, 'not_a_log_file.txt'), 'w') as log:
+                log.writelines(lines)
+            expected = [
+                line for line in lines if line != "\n" and rules.is_log_line_bad(line, RULES)
+            ]
+            self.assertEqual(log_analysis._get_log_file_paths(log_dir), [
+                path.join(node_dir, 'mongod.log.2016-07-14T01-00-20.gz'),
+                path.join(node_dir, 'mongod.log.2016-07-14T01-00-40'),
+                path.join(node_dir, 'mongod.log.zst')
+            ])
+            serial = log_analysis._get_bad_log_lines(log_dir, RULES)
+            pooled = log_analysis._get_bad_log_lines(log_dir, RULES, workers=3)
+        finally:
+            shutil.rmtree(log_dir)
+        self.assertEqual(serial, [(path.join(node_dir, 'mongod.log'), expected)])
+        self.assertEqual(pooled, serial)
+
+    def test_incremental_scan(self):
+        """Only the lines appended since the checkpoint are checked, and the results are those of a
+        full scan. A line that was still being written is checked again once complete."""
+        log_dir = tempfile.mkdtemp()
+        try:
+            log_path = path.join(log_dir, 'mongod.log')
+            lines = [LOG_LINES[second % len(LOG_LINES)].format(second) for second in range(60)]
+            with open(log_path, 'w') as log:
+                log.writelines(lines[:30])
+                log.write(lines[30][:60])
+            first = log_analysis._get_bad_log_lines(log_dir, RULES, incremental=True)
+            first_full = log_analysis._get_bad_log_lines(log_dir, RULES)
+            with open(log_path, 'a') as log:
+                log.write(lines[30][60:])
+                log.writelines(lines[31:])
+            with patch('libanalysis.rules.is_log_line_bad', wraps=rules.is_log_line_bad) as checked:
+                second = log_analysis._get_bad_log_lines(log_dir, RULES, incremental=True)
+            second_full = log_analysis._get_bad_log_lines(log_dir, RULES)
+            self.assertTrue(os.path.exists(path.join(log_dir, '.mongod.log.checkpoint')))
+            self.assertEqual(log_analysis._get_log_file_paths(log_dir), [log_path])
+        finally:
+            shutil.rmtree(log_dir)
+        self.assertEqual(first, first_full)
+        self.assertEqual(second, second_full)
+        self.assertGreater(len(second[0][1]), len(first[0][1]))
+        checked_lines = [call[0][0] for call in checked.call_args_list]
+        self.assertTrue(checked_lines)
+        self.assertTrue(set(checked_lines) <= set(lines[30:]))
+
+    @patch('locale.getpreferredencoding', return_value='UTF-8')
+    def test_incremental_partial_character(self, mock_encoding):
+        """A last line that ends in the middle of a multi-byte character is still checked."""
+        log_dir = tempfile.mkdtemp()
+        try:
+            log_path = path.join(log_dir, 'mongod.log')
+            line = '2016-07-14T01:00:00.000+0000 E STORAGE [conn1] caf\u00e9 error\n'.encode(
+                'utf-8')
+            cut = line.index(b'\xc3') + 1
+            with open(log_path, 'wb') as log:
+                log.write(line + line[:cut])
+            first = log_analysis._get_bad_log_lines(log_dir, RULES, incremental=True)
+            with open(log_path, 'ab') as log:
+                log.write(line[cut:])
+            second = log_analysis._get_bad_log_lines(log_dir, RULES, incremental=True)
+        finally:
+            shutil.rmtree(log_dir)
+        mock_encoding.assert_called()
+        self.assertEqual(len(first[0][1]), 2)
+        self.assertEqual(first[0][1][1], line[:cut - 1].decode('utf-8') + '\ufffd')
+        self.assertEqual(second[0][1], [line.decode('utf-8')] * 2)
+
+    def test_incremental_full_scan(self):
+        """A log that was rotated, truncated or rewritten, or other rules, mean a full scan."""
+        log_dir = tempfile.mkdtemp()
+        try:
+            log_path = path.join(log_dir, 'mongod.log')
+            lines = [LOG_LINES[second % len(LOG_LINES)].format(second) for second in range(60)]
+            other_lines = [line.replace('01:00', '02:00') for line in lines]
+
+            def write(written, mode='w'):
+                with open(log_path, mode) as log:
+                    log.writelines(written)
+
+            def scans(config_rules=None):
+                config_rules = config_rules or RULES
+                return (log_analysis._get_bad_log_lines(log_dir, config_rules, incremental=True),
+                        log_analysis._get_bad_log_lines(log_dir, config_rules))
+
+            write(lines)
+            self.assertEqual(*scans())
+            # Rotated: a new file, that is longer than the offset of the checkpoint.
+            write(other_lines + other_lines, 'w')
+            os.rename(log_path, log_path + '.new')
+            os.rename(log_path + '.new', log_path)
+            self.assertEqual(*scans())
+            # Truncated.
+            write(lines[:10])
+            self.assertEqual(*scans())
+            # Rewritten in place, with a different start.
+            write(other_lines[:10] + lines[10:])
+            self.assertEqual(*scans())
+            # Other rules.
+            self.assertEqual(*scans({'bad_log_types': ['F'], 'bad_messages': []}))
+        finally:
+            shutil.rmtree(log_dir)
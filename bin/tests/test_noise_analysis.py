@@ -0,0 +1,176 @@
+"""Unit tests for libanalysis/noise_analysis.py"""
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from mock import Mock
+import numpy as np
+
+from libanalysis import noise_analysis
+
+LOG = logging.getLogger(__name__)
+
+
+def loop_bootstrap_means(samples, resamples, random):
+    """The bootstrap means of each sample, one resample at a time."""
+    length = samples.shape[1]
+    draws = random.randint(0, length, (resamples, length))
+    return np.array([[sample[resample].mean() for resample in draws] for sample in samples])
+
+
+def perf_json(stable, noisy):
+    """A perf.json document with a stable and a noisy test."""
+    return {
+        'results': [{
+            'name': 'stable',
+            'results': {
+                '8': {
+                    'ops_per_sec': float(np.mean(stable)),
+                    'ops_per_sec_values': stable
+                }
+            }
+        }, {
+            'name': 'noisy',
+            'results': {
+                '8': {
+                    'ops_per_sec': float(np.mean(noisy)),
+                    'ops_per_sec_values': noisy,
+                    'latency': 1.0,
+                    'latency_values': [1.0]
+                }
+            }
+        }]
+    }
+
+
+class NoiseAnalysisTestCase(unittest.TestCase):
+    """Unit tests for the noise analysis."""
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_bootstrap_means(self):
+        """The means of the resamples are those of the values drawn."""
+        samples = np.random.RandomState(0).normal(100, 10, (5, 7))
+        np.testing.assert_allclose(
+            noise_analysis.bootstrap_means(samples, 300, np.random.RandomState(1)),
+            loop_bootstrap_means(samples, 300, np.random.RandomState(1)))
+
+    def test_noise_statistics(self):
+        """Mean, coefficient of variation, confidence interval and outliers of each sample."""
+        random = np.random.RandomState(2)
+        samples = [
+            np.array([10.0, 11.0, 9.0, 10.0, 10.5, 9.5, 30.0]),
+            random.normal(1000, 50, 40),
+            np.zeros(3),
+            np.array([-5.0, -5.0])
+        ]
+        statistics = noise_analysis.noise_statistics(samples, random=random)
+        for sample, row in zip(samples, statistics):
+            self.assertEqual(row['count'], len(sample))
+            self.assertAlmostEqual(row['mean'], np.mean(sample))
+            self.assertAlmostEqual(row['stddev'], np.std(sample, ddof=1))
+            self.assertLessEqual(row['ci_low'], row['ci_high'])
+        self.assertEqual(statistics[0]['outliers'], [6])
+        self.assertEqual(statistics[1]['outliers'], [])
+        self.assertAlmostEqual(statistics[1]['cv'],
+                               np.std(samples[1], ddof=1) / np.mean(samples[1]))
+        self.assertLess(statistics[1]['ci_low'], 1000)
+        self.assertGreater(statistics[1]['ci_high'], 1000)
+        self.assertIsNone(statistics[2]['cv'])
+        self.assertEqual(statistics[3]['cv'], 0)
+        self.assertEqual((statistics[3]['ci_low'], statistics[3]['ci_high']), (-5.0, -5.0))
+
+    def test_noise(self):
+        """Noisy repetitions and runs are flagged, stable ones get fewer repetitions."""
+        random = np.random.RandomState(3)
+        for run in range(6):
+            reports_dir = os.path.join(self.work_dir, 'reports-2020-01-0{0}T00:00:00'.format(run))
+            os.mkdir(reports_dir)
+            noisy = [1000.0 * (1 + run % 2)] + random.normal(1000, 300, 9).tolist()
+            with open(os.path.join(reports_dir, 'perf.json'), 'w') as perf_json_file:
+                json.dump(perf_json(random.normal(1000, 5, 10).tolist(), noisy), perf_json_file)
+        config = {
+            'analysis': {
+                'noise': {
+                    'history': [os.path.join(self.work_dir, 'reports-*')]
+                }
+            },
+            'test_control': {
+                'reports_dir_basename': reports_dir,
+                'perf_json': {
+                    'path': os.path.join(reports_dir, 'perf.json')
+                }
+            }
+        }
+        results = Mock()
+        noise_analysis.noise(config, results)
+
+        with open(os.path.join(reports_dir, 'noise.json')) as data_file:
+            rows = json.load(data_file)
+        samples = {(row['source'], row['test']): row for row in rows}
+        self.assertEqual(sorted(samples), [('repetitions', 'noisy'), ('repetitions', 'stable'),
+                                           ('runs', 'noisy'), ('runs', 'stable')])
+        self.assertTrue(samples[('repetitions', 'noisy')]['noisy'])
+        self.assertGreater(samples[('repetitions', 'noisy')]['repetitions'], 10)
+        self.assertFalse(samples[('repetitions', 'stable')]['noisy'])
+        self.assertEqual(samples[('repetitions', 'stable')]['repetitions'], 2)
+        self.assertEqual(samples[('runs', 'noisy')]['count'], 6)
+        self.assertEqual(samples[('runs', 'noisy')]['threads'], 8)
+        self.assertEqual(samples[('runs', 'noisy')]['metric'], 'ops_per_sec')
+
+        args, kwargs = results.add.call_args
+        self.assertEqual(args, ('noise-analysis', 'pass'))
+        self.assertEqual([row['test'] for row in kwargs['noisy']], ['noisy'] * len(kwargs['noisy']))
+        self.assertIn(samples[('repetitions', 'noisy')], kwargs['noisy'])
+        self.assertTrue(kwargs['log_raw'].startswith('{0} of {1} samples are noisy.'.format(
+            len(kwargs['noisy']), len(rows))))
+
+    def test_repetition_samples(self):
+        """Results without a thread level are skipped, the others are kept."""
+        document = perf_json([1.0, 2.0], [3.0, 4.0])
+        document['results'][1]['results']['None'] = document['results'][1]['results'].pop('8')
+        samples = noise_analysis.repetition_samples(document)
+        self.assertEqual(list(samples), [('stable', 8, 'ops_per_sec')])
+        np.testing.assert_array_equal(samples[('stable', 8, 'ops_per_sec')], [1.0, 2.0])
+
+    def test_no_repetitions(self):
+        """Nothing is added without repeated results."""
+        config = {
+            'analysis': {
+                'noise': {
+                    'history': []
+                }
+            },
+            'test_control': {
+                'reports_dir_basename': self.work_dir,
+                'perf_json': {
+                    'path': os.path.join(self.work_dir, 'perf.json')
+                }
+            }
+        }
+        results = Mock()
+        noise_analysis.noise(config, results)
+        results.add.assert_not_called()
+
+    def test_many_samples(self):
+        """Bootstrap confidence intervals of thousands of samples."""
+        samples = list(np.random.RandomState(4).normal(100, 5, (5000, 10)))
+        start = time.time()
+        statistics = noise_analysis.noise_statistics(samples, random=np.random.RandomState(5))
+        LOG.info("Noise statistics of %d samples: %.3fs", len(samples), time.time() - start)
+        start = time.time()
+        loop_bootstrap_means(np.array(samples[:100]), 1000, np.random.RandomState(5))
+        LOG.info("Loop bootstrap of 100 samples: %.3fs", time.time() - start)
+        self.assertEqual(len(statistics), len(samples))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,246 @@
+"""Unit tests for libanalysis/readers.py"""
+
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+import numpy as np
+
+from libanalysis import readers
+from test_lib.fixture_files import FixtureFiles
+
+FIXTURE_FILES = FixtureFiles(os.path.dirname(__file__), 'analysis')
+
+
+def varint(value):
+    """Encode `value` as an ftdc packed int."""
+    value &= 0xFFFFFFFFFFFFFFFF
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def bson(elements):
+    """Encode a BSON document of (type, name, encoded value) elements."""
+    body = b''.join(
+        bytes([bson_type]) + name.encode() + b'\0' + value for bson_type, name, value in elements)
+    return struct.pack('<i', len(body) + 5) + body + b'\0'
+
+
+def bson_string(value):
+    """Encode a BSON string value."""
+    return struct.pack('<I', len(value) + 1) + value.encode() + b'\0'
+
+
+def reference_doc(host, start, count, operations):
+    """A small FTDC reference document, with a string of variable length before the metrics."""
+    return bson([(2, 'host', bson_string(host)), (9, 'start', struct.pack('<Q', start)),
+                 (3, 'status',
+                  bson([(16, 'count', struct.pack('<i', count)),
+                        (17, 'optime', struct.pack('<II', 7, 8)),
+                        (1, 'ops', struct.pack('<d', operations))]))])
+
+
+def reference_unpack(data, ndeltas):
+    """The value by value decoding readers.py used before it was vectorized."""
+    def unpack(at):
+        res = 0
+        shift = 0
+        while True:
+            byte = data[at]
+            res |= (byte & 0x7F) << shift
+            at += 1
+            if not byte & 0x80:
+                if res > 0x7fffffffffffffff:
+                    res = int(res - 0x10000000000000000)
+                return res, at
+            shift += 7
+
+    deltas = []
+    at = 0
+    nzeroes = 0
+    for _ in range(ndeltas):
+        if nzeroes:
+            delta = 0
+            nzeroes -= 1
+        else:
+            delta, at = unpack(at)
+            if delta == 0:
+                nzeroes, at = unpack(at)
+        deltas.append(delta)
+    return deltas
+
+
+class ReadersTestCase(unittest.TestCase):
+    """Unit tests for the vectorized FTDC decoder."""
+    def assert_unpacks(self, tokens, ndeltas, nmetrics=1, rows=None):
+        data = b''.join(varint(token) for token in tokens)
+        expected = np.array(reference_unpack(data, nmetrics * ndeltas)).reshape(nmetrics, ndeltas)
+        if rows is not None:
+            expected = expected[rows]
+        # pylint: disable=protected-access
+        observed = readers._unpack_deltas(data, 0, nmetrics, ndeltas, rows)
+        self.assertEqual(observed.dtype, np.int64)
+        self.assertEqual(observed.tolist(), expected.tolist())
+
+    def test_values(self):
+        """Small, large and negative deltas."""
+        self.assert_unpacks([1, 127, 128, 300, 2**40, -1, -2**63], 7)
+
+    def test_zero_runs(self):
+        """A 0 is followed by the number of additional 0s, which may itself be 0."""
+        self.assert_unpacks([5, 0, 3, 7], 6)
+        self.assert_unpacks([0, 0, 9], 2)
+        self.assert_unpacks([0, 0, 0, 0, 0, 2, 4], 6)
+        self.assert_unpacks([0, 1, 0, 0, 3], 4)
+        self.assert_unpacks([0, 5], 6)
+
+    def test_selected_rows(self):
+        """Only the deltas of the requested metrics are returned, zero runs span metrics."""
+        tokens = [1, 2, 0, 3, 300, 0, 0, 7, -8, 0, 2, 5]
+        for rows in ([0, 1, 2, 3], [1], [0, 3], []):
+            self.assert_unpacks(tokens, 3, nmetrics=4, rows=rows)
+
+    def test_no_deltas(self):
+        """A chunk with a single sample has no deltas."""
+        # pylint: disable=protected-access
+        self.assertEqual(readers._unpack_deltas(b'', 0, 3, 0).shape, (3, 0))
+
+    def test_schema(self):
+        """The keys and values of a reference document."""
+        # pylint: disable=protected-access
+        schema = readers._Schema(reference_doc('host', 1000, 5, 2.5))
+        self.assertEqual(schema.keys, [('start', ), ('status', 'count'), ('status', 'optime', 't'),
+                                       ('status', 'optime', 'i'), ('status', 'ops')])
+        data = reference_doc('host', 1000, 5, 2.5)
+        self.assertEqual(schema.values(data, schema.shifts(data)).tolist(), [1000, 5, 7, 8, 2])
+
+    def test_schema_reuse(self):
+        """The layout is reused when only values and the length of strings change."""
+        # pylint: disable=protected-access
+        schema = readers._Schema(reference_doc('host', 1000, 5, 2.5))
+        data = reference_doc('another.host', 2000, -3, 7.0)
+        shifts = schema.shifts(data)
+        self.assertIsNotNone(shifts)
+        self.assertEqual(schema.values(data, shifts).tolist(), [2000, -3, 7, 8, 7])
+        self.assertEqual(readers._Schema(data).keys, schema.keys)
+
+        other = bson([(9, 'start', struct.pack('<Q', 1000)),
+                      (3, 'status', bson([(16, 'other', struct.pack('<i', 5))]))])
+        self.assertIsNone(schema.shifts(other))
+
+    def test_read_ftdc(self):
+        """Each metric is an array with one value per sample."""
+        chunks = list(
+            readers.read_ftdc(FIXTURE_FILES.fixture_file_path('core_workloads_wt.ftdc.metrics')))
+        self.assertEqual(len(chunks), 23)
+        for chunk in chunks:
+            for values in chunk.values():
+                self.assertIsInstance(values, np.ndarray)
+                self.assertEqual(len(values), chunk.nsamples)
+        times = np.concatenate([chunk[('start', )] for chunk in chunks])
+        self.assertTrue(np.all(np.diff(times) > 0))
+
+    def test_read_ftdc_keys(self):
+        """Selected metrics and prefixes have the same values as when all metrics are read."""
+        path = FIXTURE_FILES.fixture_file_path('core_workloads_wt.ftdc.metrics')
+        keys = [('start', ), ('serverStatus', 'connections')]
+        for chunk, selected in zip(readers.read_ftdc(path), readers.read_ftdc(path, keys=keys)):
+            expected = [
+                key for key in chunk
+                if key[:1] == ('start', ) or key[:2] == ('serverStatus', 'connections')
+            ]
+            self.assertEqual(list(selected), expected)
+            self.assertIn(('serverStatus', 'connections', 'current'), selected)
+            self.assertEqual(selected.nsamples, chunk.nsamples)
+            for key in expected:
+                self.assertEqual(selected[key].tolist(), chunk[key].tolist())
+
+    def test_first_only(self):
+        """Only the values of the reference document are decoded."""
+        for chunk in readers.read_ftdc(
+                FIXTURE_FILES.fixture_file_path('core_workloads_wt.ftdc.metrics'), first_only=True):
+            self.assertEqual(len(chunk[('start', )]), 1)
+
+    def test_read_ftdc_bytes(self):
+        """A file read while it is written is decoded up to the last complete chunk."""
+        path = FIXTURE_FILES.fixture_file_path('core_workloads_wt.ftdc.metrics')
+        with open(path, 'rb') as ftdc_file:
+            data = ftdc_file.read()
+        expected = list(readers.read_ftdc(path))
+        chunks = []
+        pending = b''
+        for start in range(0, len(data), 100000):
+            pending += data[start:start + 100000]
+            new_chunks, used = readers.read_ftdc_bytes(pending)
+            chunks += new_chunks
+            pending = pending[used:]
+        self.assertEqual(pending, b'')
+        self.assertEqual(len(chunks), len(expected))
+        for chunk, expected_chunk in zip(chunks, expected):
+            self.assertEqual(list(chunk), list(expected_chunk))
+            self.assertEqual(chunk[('start', )].tolist(), expected_chunk[('start', )].tolist())
+        self.assertEqual(readers.read_ftdc_bytes(data[:3]), ([], 0))
+
+
+class TimeIndexTestCase(unittest.TestCase):
+    """Unit tests for the time index of FTDC files and reads of a time range."""
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.ftdc_file = os.path.join(self.work_dir, 'metrics.mongod.0')
+        shutil.copy(FIXTURE_FILES.fixture_file_path('core_workloads_wt.ftdc.metrics'),
+                    self.ftdc_file)
+        self.chunks = list(readers.read_ftdc(self.ftdc_file))
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_index(self):
+        """One row per chunk, with the times of its first and last samples."""
+        index = readers.read_index(self.ftdc_file)
+        self.assertEqual(index.shape, (len(self.chunks), 4))
+        for (_, first, last, nsamples), chunk in zip(index, self.chunks):
+            self.assertEqual([first, last, nsamples],
+                             [chunk[('start', )][0], chunk[('start', )][-1], chunk.nsamples])
+        self.assertEqual(sorted(os.listdir(self.work_dir)),
+                         ['.metrics.mongod.0.index', 'metrics.mongod.0'])
+        self.assertEqual(readers.read_index(self.ftdc_file).tolist(), index.tolist())
+
+    def test_stale_index(self):
+        """The index is built again when the file changed."""
+        index = readers.read_index(self.ftdc_file)
+        with open(self.ftdc_file, 'rb') as ftdc_file:
+            first_chunks = ftdc_file.read(int(index[1][0]))
+        with open(self.ftdc_file, 'ab') as ftdc_file:
+            ftdc_file.write(first_chunks)
+        rebuilt = readers.read_index(self.ftdc_file)
+        self.assertEqual(len(rebuilt), len(index) + 1)
+        self.assertEqual(rebuilt[-1].tolist()[1:], index[0].tolist()[1:])
+
+    def test_time_range(self):
+        """Only the chunks with samples in the time ranges are read, whole."""
+        times = [chunk[('start', )] for chunk in self.chunks]
+        ranges = [(times[2][-1], times[4][0]), (times[10][3], times[10][3] + 1)]
+        chunks = list(readers.read_ftdc(self.ftdc_file, time_range=ranges))
+        self.assertEqual([chunk[('start', )].tolist() for chunk in chunks],
+                         [times[index].tolist() for index in (2, 3, 4, 10)])
+        self.assertEqual(list(chunks[1]), list(self.chunks[3]))
+
+        keys = [('start', ), ('serverStatus', 'connections', 'current')]
+        chunks = list(readers.read_ftdc(self.work_dir, keys=keys, time_range=ranges[1]))
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual(list(chunks[0]), keys)
+        self.assertEqual(chunks[0][keys[1]].tolist(), self.chunks[10][keys[1]].tolist())
+        self.assertEqual(list(readers.read_ftdc(self.ftdc_file, time_range=(0, 1))), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -103,6 +103,15 @@ class RemoteHostTestCase(unittest.TestCase):
                 "wrapped exception")
             common.command_runner._run_host_command_map(remote, command, "test_id", {})
 
+    @patch('paramiko.SSHClient')
+    def test_file_size(self, mock_ssh):
+        """ Test file_size """
+        remote = common.remote_ssh_host.RemoteSSHHost('53.1.1.1', "ssh_user", "ssh_key_file")
+        remote.ftp.stat.return_value = collections.namedtuple('FakeSize', 'st_size')(42)
+        self.assertEqual(remote.file_size('/metrics'), 42)
+        remote.ftp.stat.assert_called_with('/metrics')
+        mock_ssh.assert_called()
+
     @patch('paramiko.SSHClient')
     def test_remote_host_isdir(self, mock_ssh):
         """ Test remote_isdir """
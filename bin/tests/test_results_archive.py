@@ -0,0 +1,119 @@
+"""Unit tests for common/results_archive.py"""
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from common import results_archive
+from test_lib.fixture_files import FixtureFiles
+
+FIXTURE_FILES = FixtureFiles(os.path.dirname(__file__))
+LOG = logging.getLogger(__name__)
+
+
+class ResultsArchiveTestCase(unittest.TestCase):
+    """Unit tests for writing and reading results archives."""
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        with open(FIXTURE_FILES.fixture_file_path('perf.unittest-out.json.ok')) as perf_json:
+            self.perf_json = json.load(perf_json)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def _write_run(self, name, perf_json=None):
+        reports_dir = os.path.join(self.work_dir, name)
+        os.mkdir(reports_dir)
+        perf_json_path = os.path.join(reports_dir, 'perf.json')
+        with open(perf_json_path, 'w') as perf_json_file:
+            json.dump(perf_json or self.perf_json, perf_json_file)
+        return results_archive.write_from_perf_json(perf_json_path, reports_dir)
+
+    def test_from_perf_json(self):
+        """One row per test, thread level and scalar metric."""
+        table = results_archive.from_perf_json(self.perf_json)
+        expected = []
+        for result in self.perf_json['results']:
+            for threads, thread_results in result['results'].items():
+                for metric, value in results_archive.scalar_metrics(thread_results):
+                    expected.append((result['name'], int(threads), metric, value))
+        self.assertEqual(
+            list(
+                zip(table['test'].tolist(), table['threads'].tolist(), table['metric'].tolist(),
+                    table['value'].tolist())), expected)
+        self.assertIn('read_latency_us_p99', table['metric'])
+        self.assertFalse(any(metric.endswith('_values') for metric in table['metric']))
+
+    def test_no_thread_level(self):
+        """Results without a numeric thread level are skipped."""
+        perf_json = {
+            'results': [{
+                'name': 'ycsb_load',
+                'results': {
+                    'None': {
+                        'ops_per_sec': 10.0
+                    },
+                    '8': {
+                        'ops_per_sec': 20.0
+                    }
+                }
+            }]
+        }
+        table = results_archive.from_perf_json(perf_json)
+        self.assertEqual(table['threads'].tolist(), [8])
+        self.assertEqual(table['value'].tolist(), [20.0])
+
+    def test_round_trip(self):
+        """The archive is named after the reports directory and holds the same rows."""
+        path = self._write_run('reports-2020-01-01T00:00:00')
+        self.assertEqual(path, os.path.join(self.work_dir, 'reports-2020-01-01T00:00:00',
+                                            'perf.npz'))
+        table = results_archive.read(path)
+        self.assertEqual(table['run'], 'reports-2020-01-01T00:00:00')
+        expected = results_archive.from_perf_json(self.perf_json)
+        for column in results_archive.COLUMNS:
+            np.testing.assert_array_equal(table[column], expected[column])
+
+    def test_symlinked_reports_dir(self):
+        """The run is named after the directory the reports symlink points to."""
+        self._write_run('reports-2020-01-01T00:00:00')
+        link = os.path.join(self.work_dir, 'reports')
+        os.symlink(os.path.join(self.work_dir, 'reports-2020-01-01T00:00:00'), link)
+        self.assertEqual(results_archive.run_name(link + '/'), 'reports-2020-01-01T00:00:00')
+
+    def test_read_selected(self):
+        """Only the requested columns, tests and metrics are read."""
+        path = self._write_run('reports-1')
+        table = results_archive.read(path, ('threads', 'value'),
+                                     tests=['sysbench-unittest_reads_per_sec'],
+                                     metrics=['ops_per_sec'])
+        self.assertEqual(sorted(table.keys()), ['run', 'threads', 'value'])
+        self.assertEqual(table['threads'].tolist(), [1])
+        self.assertEqual(table['value'].tolist(), [789.55321958931])
+
+    def test_load_many_runs(self):
+        """Load the archives of 500 runs into one table."""
+        paths = [self._write_run('reports-{:03d}'.format(run)) for run in range(500)]
+        start = time.time()
+        table = results_archive.load(paths, ('test', 'metric', 'value'), metrics=['ops_per_sec'])
+        LOG.info("Loaded 500 results archives in %.3fs", time.time() - start)
+        rows_per_run = int(np.sum(results_archive.read(paths[0])['metric'] == 'ops_per_sec'))
+        self.assertEqual(len(table['value']), 500 * rows_per_run)
+        self.assertEqual(table['run'][0], 'reports-000')
+        self.assertEqual(table['run'][-1], 'reports-499')
+
+    def test_empty(self):
+        """A task without results has an empty archive."""
+        table = results_archive.read(self._write_run('reports-empty', {'results': []}))
+        self.assertEqual(len(table['test']), 0)
+        self.assertEqual(results_archive.load([])['run'].tolist(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,18 +1,64 @@
 """Unit tests for the rules module. Run using nosetests."""
 
+import collections
+import logging
 import os
+import time
 import unittest
 
 from dateutil import parser as date_parser
 from nose.tools import nottest
+import numpy as np
 
 import libanalysis.rules as rules
 import libanalysis.readers as readers
 import libanalysis.util as util
 
+from test_lib.benchmark import benchmark
 from test_lib.fixture_files import FixtureFiles
 
 FIXTURE_FILES = FixtureFiles(os.path.join(os.path.dirname(__file__)), 'analysis')
+LOG = logging.getLogger(__name__)
+
+
+def loop_below_configured_cache_size(chunk, times, configured_cache_size):
+    """
+    below_configured_cache_size() before it was vectorized: one Python comparison per sample. Kept
+    here as the reference the vectorized rules are compared against.
+    """
+    failure_times = []
+    compared_values = []
+    for index, cache_size in enumerate(chunk[rules.FTDC_KEYS['cache_size']]):
+        if cache_size > (1 + rules.CACHE_ALLOCATOR_OVERHEAD) * configured_cache_size:
+            failure_times.append(times[index])
+            compared_values.append((cache_size, ))
+    return rules.failure_collection(failure_times, compared_values,
+                                    ('current cache size (bytes)', ),
+                                    {'WT configured cache size (bytes)': configured_cache_size})
+
+
+def loop_lag_periods(times, member_lag):
+    """
+    The lag periods as _flag_unacceptable_lag() found them before it was vectorized: the bounded
+    lag and the hysteresis are updated one sample at a time.
+    """
+    periods = []
+    previous = {'lag': 0, 'time': member_lag[0]}
+    period = None
+    for index in range(1, len(times)):
+        time_delta = times[index] - previous['time']
+        bounded_lag = min(member_lag[index], previous['lag'] + time_delta)
+        if period is None:
+            if (bounded_lag > rules.REPL_MEMBER_LAG_THRESHOLD_MS
+                    and bounded_lag - previous['lag'] < time_delta):
+                period = [index, index]
+        elif member_lag[index] < rules.REPL_MEMBER_LAG_RESET_MS:
+            periods.append((period[0], period[1], index, previous['lag']))
+            period = None
+        elif member_lag[index] > member_lag[period[1]]:
+            period[1] = index
+        previous = {'lag': bounded_lag, 'time': times[index]}
+    return periods
 
 
 class TestResourceRules(unittest.TestCase):
@@ -26,7 +72,7 @@ class TestResourceRules(unittest.TestCase):
         self.path_ftdc_3node_repl = FIXTURE_FILES.fixture_file_path(
             'linux_3node_replSet_p1.ftdc.metrics')
         self.single_chunk_3node = self._first_chunk(self.path_ftdc_3node_repl)
-        self.times_3node = self.single_chunk_3node[rules.FTDC_KEYS['time']]
+        self.times_3node = self.single_chunk_3node[rules.FTDC_KEYS['time']].tolist()
         self.members_3node = ['0', '1', '2']
 
         self.times_1node = [self.single_chunk_3node[rules.FTDC_KEYS['time']][0]]
@@ -40,7 +86,7 @@ class TestResourceRules(unittest.TestCase):
 
         path_ftdc_standalone = FIXTURE_FILES.fixture_file_path('core_workloads_wt.ftdc.metrics')
         self.single_chunk_standalone = self._first_chunk(path_ftdc_standalone)
-        self.times_standalone = self.single_chunk_standalone[rules.FTDC_KEYS['time']]
+        self.times_standalone = self.single_chunk_standalone[rules.FTDC_KEYS['time']].tolist()
 
         self.path_3shard_directory = FIXTURE_FILES.fixture_file_path('test_replset_resource_rules')
         self.path_ftdc_repllag = FIXTURE_FILES.fixture_file_path('test_repllag')
@@ -463,6 +509,56 @@ class TestFailureOutputFormatting(unittest.TestCase):
         self.assertEqual(observed, expected)
 
 
+BAD_LOG_LINES = [
+    "2016-07-14T01:00:04.000+0000 F err-type foo bar baz",
+    "2016-07-14T01:00:04.000+0000 E err-type foo bar baz",
+    "2016-07-14T01:00:04.000+0000 L err-type elecTIon suCCEeded",
+    "2016-07-14T01:00:04.000+0000 D err-type transition TO PRIMARY",
+    "2016-07-14T01:00:04.000+0000 I err-type PosIx_FallocaTE FailEd",
+    # First logv2 message. The message has format param `{rsConfig_getElectionTimeoutPeriod}`
+    # but the attr is `rsConfig_getElectionTimeoutPeriodMillis` (probably a typo).
+    '{"t":{"$date":"2020-03-02T05:37:29.666+0000"},"s":"I", "c":"ELECTION","id":4615652,'
+    '"ctx":"ReplCoord-2","msg":"Starting an election, since we\'ve seen no PRIMARY in the past '
+    '{rsConfig_getElectionTimeoutPeriod}","attr":{"rsConfig_getElectionTimeoutPeriodMillis":10000}}',
+    # Second logv2 message. The `msg` itself is just "{}" but the params indicate failure
+    # because it has "Starting an election" in the attr.
+    '{"t":{"$date":"2020-03-02T06:32:06.307+0000"},"s":"I", "c":"ELECTION","id":0,'
+    '"ctx":"ReplCoord-1","msg":"{}","attr":{"message":"Starting an election"}}',
+    "{\"t\":{\"$date\":\"2016-07-14T01:00:04.000Z\"},\"s\":\"F\", \"c\":\"COMMAND\", \"ctx\":\"conn7\","
+    "\"msg\":\"foo bar baz\"}",
+    "{\"t\":{\"$date\":\"2016-07-14T01:00:04.000Z\"},\"s\":\"E\", \"c\":\"COMMAND\", \"ctx\":\"conn7\","
+    "\"msg\":\"foo bar baz\"}",
+    "{\"t\":{\"$date\":\"2016-07-14T01:00:04.000Z\"},\"s\":\"L\", \"c\":\"ELECTION\", \"ctx\":\"conn7\","
+    "\"msg\":\"elecTIon suCCEeded\"}",
+    "{\"t\":{\"$date\":\"2016-07-14T01:00:04.000Z\"},\"s\":\"D\", \"c\":\"REPL\", \"ctx\":\"conn7\","
+    "\"msg\":\"transition TO PRIMARY\"}",
+    "{\"t\":{\"$date\":\"2016-07-14T01:00:04.000Z\"},\"s\":\"I\", \"c\":\"STORAGE\", \"ctx\":\"conn7\","
+    "\"msg\":\"PosIx_FallocaTE FailEd\"}",
+    "{\"t\":{\"$date\":\"2016-07-14T01:00:04.000Z\"},\"s\":\"D\", \"c\":\"REPL\", \"ctx\":\"conn7\","
+    "\"msg\":\"transition to {newState} from {memberState}\",\"attr\":{\"newState\":\"PRIMARY\","
+    "\"memberState\":\"SECONDARY\"}}"
+]
+
+GOOD_LOG_LINES = [
+    "2016-07-14T01:00:04.000+0000 L err-type nothing bad here",
+    "2016-07-14T01:00:04.000+0000 L err-type or here",
+    "2016-07-14T01:00:04.000+0000 E err-type ttl query execution for index",
+    # Example logv2 message. The `msg` itself is just "{}".
+    '{"t":{"$date":"2020-03-02T06:32:06.307+0000"},"s":"I", "c":"ELECTION","id":0,'
+    '"ctx":"ReplCoord-1","msg":"{}","attr":{"message":"VoteRequester(term 1 dry run) '
+    "received a yes vote from 10.2.0.200:27017; response message: { term: 1, voteGranted: true, "
+    'reason: \\"\\", ok: 1.0, $clusterTime: { clusterTime: Timestamp(1583130713, 4), signature: '
+    "{ hash: BinData(0, 0000000000000000000000000000000000000000), keyId: 0 } }, operationTime: "
+    'Timestamp(1583130713, 4) }"}}',
+    "{\"t\":{\"$date\":\"2016-07-14T01:00:04.000Z\"},\"s\":\"L\", \"c\":\"COMMAND\", \"ctx\":\"conn7\","
+    "\"msg\":\"nothing bad here\"}",
+    "{\"t\":{\"$date\":\"2016-07-14T01:00:04.000Z\"},\"s\":\"L\", \"c\":\"COMMAND\", \"ctx\":\"conn7\","
+    "\"msg\":\"or here\"}",
+    "{\"t\":{\"$date\":\"2016-07-14T01:00:04.000Z\"},\"s\":\"E\", \"c\":\"COMMAND\", \"ctx\":\"conn7\","
+    "\"msg\":\"ttl query execution for index\"}"
+]
+
+
 class TestLogAnalysisRules(unittest.TestCase):
     """Test class evaluates correctness of mongod.log check rules
     """
@@ -478,61 +574,23 @@ class TestLogAnalysisRules(unittest.TestCase):
     def test_is_log_line_bad(self):
         """Test `_is_log_line_bad()`."""
 
-        bad_lines = [
-            "2016-07-14T01:00:04.000+0000 F err-type foo bar baz",
-            "2016-07-14T01:00:04.000+0000 E err-type foo bar baz",
-            "2016-07-14T01:00:04.000+0000 L err-type elecTIon suCCEeded",
-            "2016-07-14T01:00:04.000+0000 D err-type transition TO PRIMARY",
-            "2016-07-14T01:00:04.000+0000 I err-type PosIx_FallocaTE FailEd",
-            # First logv2 message. The message has format param `{rsConfig_getElectionTimeoutPeriod}`
-            # but the attr is `rsConfig_getElectionTimeoutPeriodMillis` (probably a typo).
-            '{"t":{"$date":"2020-03-02T05:37:29.666+0000"},"s":"I", "c":"ELECTION","id":4615652,'
-            '"ctx":"ReplCoord-2","msg":"Starting an election, since we\'ve seen no PRIMARY in the past '
-            '{rsConfig_getElectionTimeoutPeriod}","attr":{"rsConfig_getElectionTimeoutPeriodMillis":10000}}',
-            # Second logv2 message. The `msg` itself is just "{}" but the params indicate failure
-            # because it has "Starting an election" in the attr.
-            '{"t":{"$date":"2020-03-02T06:32:06.307+0000"},"s":"I", "c":"ELECTION","id":0,'
-            '"ctx":"ReplCoord-1","msg":"{}","attr":{"message":"Starting an election"}}',
-            "{\"t\":{\"$date\":\"2016-07-14T01:00:04.000Z\"},\"s\":\"F\", \"c\":\"COMMAND\", \"ctx\":\"conn7\","
-            "\"msg\":\"foo bar baz\"}",
-            "{\"t\":{\"$date\":\"2016-07-14T01:00:04.000Z\"},\"s\":\"E\", \"c\":\"COMMAND\", \"ctx\":\"conn7\","
-            "\"msg\":\"foo bar baz\"}",
-            "{\"t\":{\"$date\":\"2016-07-14T01:00:04.000Z\"},\"s\":\"L\", \"c\":\"ELECTION\", \"ctx\":\"conn7\","
-            "\"msg\":\"elecTIon suCCEeded\"}",
-            "{\"t\":{\"$date\":\"2016-07-14T01:00:04.000Z\"},\"s\":\"D\", \"c\":\"REPL\", \"ctx\":\"conn7\","
-            "\"msg\":\"transition TO PRIMARY\"}",
-            "{\"t\":{\"$date\":\"2016-07-14T01:00:04.000Z\"},\"s\":\"I\", \"c\":\"STORAGE\", \"ctx\":\"conn7\","
-            "\"msg\":\"PosIx_FallocaTE FailEd\"}",
-            "{\"t\":{\"$date\":\"2016-07-14T01:00:04.000Z\"},\"s\":\"D\", \"c\":\"REPL\", \"ctx\":\"conn7\","
-            "\"msg\":\"transition to {newState} from {memberState}\",\"attr\":{\"newState\":\"PRIMARY\","
-            "\"memberState\":\"SECONDARY\"}}"
-        ]
-
-        good_lines = [
-            "2016-07-14T01:00:04.000+0000 L err-type nothing bad here",
-            "2016-07-14T01:00:04.000+0000 L err-type or here",
-            "2016-07-14T01:00:04.000+0000 E err-type ttl query execution for index",
-            # Example logv2 message. The `msg` itself is just "{}".
-            '{"t":{"$date":"2020-03-02T06:32:06.307+0000"},"s":"I", "c":"ELECTION","id":0,'
-            '"ctx":"ReplCoord-1","msg":"{}","attr":{"message":"VoteRequester(term 1 dry run) '
-            "received a yes vote from 10.2.0.200:27017; response message: { term: 1, voteGranted: true, "
-            'reason: \\"\\", ok: 1.0, $clusterTime: { clusterTime: Timestamp(1583130713, 4), signature: '
-            "{ hash: BinData(0, 0000000000000000000000000000000000000000), keyId: 0 } }, operationTime: "
-            'Timestamp(1583130713, 4) }"}}',
-            "{\"t\":{\"$date\":\"2016-07-14T01:00:04.000Z\"},\"s\":\"L\", \"c\":\"COMMAND\", \"ctx\":\"conn7\","
-            "\"msg\":\"nothing bad here\"}",
-            "{\"t\":{\"$date\":\"2016-07-14T01:00:04.000Z\"},\"s\":\"L\", \"c\":\"COMMAND\", \"ctx\":\"conn7\","
-            "\"msg\":\"or here\"}",
-            "{\"t\":{\"$date\":\"2016-07-14T01:00:04.000Z\"},\"s\":\"E\", \"c\":\"COMMAND\", \"ctx\":\"conn7\","
-            "\"msg\":\"ttl query execution for index\"}"
-        ]
-
-        for line in bad_lines:
+        for line in BAD_LOG_LINES:
             self.assertTrue(rules.is_log_line_bad(line, self.rules))
 
-        for line in good_lines:
+        for line in GOOD_LOG_LINES:
             self.assertFalse(rules.is_log_line_bad(line, self.rules))
 
+    def test_log_line_prefilter(self):
+        """Test `log_line_prefilter()` never skips a bad line."""
+        could_be_bad = rules.log_line_prefilter(self.rules)
+        for line in BAD_LOG_LINES:
+            self.assertTrue(could_be_bad(line), line)
+        self.assertEqual([could_be_bad(line) for line in GOOD_LOG_LINES],
+                         [False, False, True, True, False, False, True])
+        self.assertTrue(could_be_bad('{"s":"I","msg":"caf\u00e9"}'))
+        self.assertTrue(could_be_bad('{"s":"I","msg":"tr\\u0061nsition to primary"}'))
+        self.assertIsNone(rules.log_line_prefilter({'bad_log_types': [], 'bad_messages': ['{}']}))
+
     def test_is_log_line_bad_task(self):
         """Test `_is_log_line_bad()` for specific tasks."""
 
@@ -592,6 +650,50 @@ class TestLogAnalysisRules(unittest.TestCase):
             self.assertFalse(rules.is_log_line_bad(line, self.rules, test_times))
 
 
+class TestTimeWindows(unittest.TestCase):
+    """Test class evaluates the interval index of test times."""
+    def setUp(self):
+        self.test_times = [
+            (date_parser.parse("2016-07-14T05:00:00.999+0000"),
+             date_parser.parse("2016-07-14T05:10:00.000+0000")),
+            (date_parser.parse("2016-07-14T01:00:00.000+0000"),
+             date_parser.parse("2016-07-14T01:10:00.000+0000")),
+            (date_parser.parse("2016-07-14T01:05:00.000+0000"),
+             date_parser.parse("2016-07-14T01:20:00.000+0000")),
+            (date_parser.parse("2016-07-14T03:00:00.000+0000"),
+             date_parser.parse("2016-07-14T02:00:00.000+0000")),
+        ]
+        self.windows = rules.TimeWindows(self.test_times)
+
+    def test_intervals(self):
+        """Test times are sorted and merged into disjoint intervals, empty ones are dropped."""
+        self.assertEqual(self.windows.starts, [1468458000000.0, 1468472400999.0])
+        self.assertEqual(self.windows.ends, [1468459200000.0, 1468473000000.0])
+
+    def test_contains(self):
+        """Times are in the test times as with comparisons of datetimes, start and end included."""
+        start_ms = 1468458000000
+        times = np.arange(start_ms - 10 * 1000, start_ms + 5 * 3600 * 1000, 997)
+        expected = [
+            any(start <= util.num_or_str_to_date(time_ms / 1000.0) <= end
+                for start, end in self.test_times) for time_ms in times.tolist()
+        ]
+        self.assertTrue(any(expected))
+        self.assertEqual([self.windows.contains(time_ms) for time_ms in times.tolist()], expected)
+        self.assertEqual(self.windows.contains_times(times).tolist(), expected)
+        self.assertTrue(
+            self.windows.contains_date(date_parser.parse("2016-07-14T05:00:00.999+0000")))
+        self.assertFalse(
+            self.windows.contains_date(date_parser.parse("2016-07-14T05:00:00.998+0200")))
+
+    def test_time_windows(self):
+        """The same test times are only indexed once."""
+        self.assertIs(rules.time_windows(self.test_times),
+                      rules.time_windows(list(self.test_times)))
+        self.assertIs(rules.time_windows(self.windows), self.windows)
+        self.assertFalse(rules.time_windows([]).contains_times(np.arange(3)).any())
+
+
 class TestDBCorrectnessRules(unittest.TestCase):
     """Test class evaluates correctness of DB correctness check rules.
     """
@@ -664,5 +766,52 @@ class TestDBCorrectnessRules(unittest.TestCase):
         self.assertEqual(expected_results, observed_results)
 
 
+class VectorizedResourceRulesTestCase(unittest.TestCase):
+    """The vectorized resource rules give the same results as loops."""
+    nsamples = 20 * 1000
+
+    def setUp(self):
+        random = np.random.RandomState(39)
+        nsamples = self.nsamples
+        self.times = 1496248949000 + np.cumsum(random.choice([1000, 1000, 1000, 2000], nsamples))
+        self.chunk = collections.OrderedDict()
+        self.chunk[rules.FTDC_KEYS['time']] = self.times
+        self.chunk[rules.FTDC_KEYS['cache_size']] = random.randint(0, 1100, nsamples)
+        # A secondary that falls behind for a while, and catches up again, every 10 minutes.
+        phase = np.arange(nsamples) % 600
+        self.lag = np.where(phase < 80, 10000 + 500 * phase + random.randint(0, 3000, nsamples),
+                            random.randint(0, 2500, nsamples))
+
+    def test_cache_size(self):
+        """The vectorized rule fails at the same samples as the loop."""
+        start = time.time()
+        expected = loop_below_configured_cache_size(self.chunk, self.times, 1000)
+        loop_seconds = time.time() - start
+        start = time.time()
+        observed = rules.below_configured_cache_size(self.chunk, self.times, 1000)
+        vectorized_seconds = time.time() - start
+        LOG.info("below_configured_cache_size: loop %.3fs, vectorized %.3fs", loop_seconds,
+                 vectorized_seconds)
+        self.assertEqual(observed, expected)
+
+    def test_lag_periods(self):
+        """The vectorized hysteresis finds the same lag periods as the loop."""
+        start = time.time()
+        expected = loop_lag_periods(self.times.tolist(), self.lag.tolist())
+        loop_seconds = time.time() - start
+        start = time.time()
+        observed = rules._lag_periods(self.times, self.lag)  # pylint: disable=protected-access
+        vectorized_seconds = time.time() - start
+        LOG.info("lag periods: loop %.3fs, vectorized %.3fs", loop_seconds, vectorized_seconds)
+        self.assertTrue(expected)
+        self.assertEqual(observed, expected)
+
+
+@benchmark
+class ResourceRulesBenchmarkTestCase(VectorizedResourceRulesTestCase):
+    """Regression benchmark of the vectorized resource rules."""
+    nsamples = 2 * 1000 * 1000
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,211 @@
+"""Unit tests for libanalysis/slow_query_analysis.py"""
+
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import Mock
+import numpy as np
+
+from libanalysis import slow_query_analysis
+
+SLOW_QUERY = ('{{"t":{{"$date":"2016-07-14T01:00:{second:02}.000+00:00"}},"s":"I","c":"COMMAND",'
+              '"id":51803,"ctx":"conn{second}","msg":"Slow query","attr":{{"type":"command",'
+              '"ns":"{ns}","command":{{"{command}":"c","filter":{{"a":{second}}}}},{plan}'
+              '"keysExamined":{keys},"docsExamined":{docs},"nreturned":{returned},'
+              '"durationMillis":{duration}}}}}\n')
+OTHER_LINES = [
+    '{"t":{"$date":"2016-07-14T01:00:00.000+00:00"},"s":"I","c":"NETWORK","ctx":"conn1",'
+    '"msg":"Connection ended","attr":{"connectionId":1}}\n',
+    '2016-07-14T01:00:00.000+0000 I COMMAND [conn1] command test.c command: find Slow query\n',
+    '\n',
+]
+PERF_JSON = {
+    'results': [{
+        'name': 'test_a',
+        'start': '2016-07-14T01:00:10.000Z',
+        'end': '2016-07-14T01:00:30.000Z'
+    }, {
+        'name': 'test_b',
+        'start': '2016-07-14T01:00:40.000Z',
+        'end': '2016-07-14T01:00:50.000Z'
+    }]
+}
+
+
+def slow_query_line(second,
+                    ns='test.c',
+                    command='find',
+                    plan='IXSCAN { a: 1 }',
+                    keys=10,
+                    docs=10,
+                    returned=5,
+                    duration=100):  # pylint: disable=too-many-arguments
+    """A structured "Slow query" log line."""
+    return SLOW_QUERY.format(second=second,
+                             ns=ns,
+                             command=command,
+                             plan='' if plan is None else '"planSummary":"{0}",'.format(plan),
+                             keys=keys,
+                             docs=docs,
+                             returned=returned,
+                             duration=duration)
+
+
+class SlowQueryAnalysisTestCase(unittest.TestCase):
+    """Unit tests for the slow query analysis."""
+    def setUp(self):
+        self.reports = tempfile.mkdtemp()
+        self.durations = {}
+        lines = []
+        for second in range(60):
+            duration = 100 + 37 * second
+            if second % 3 == 0:
+                lines.append(slow_query_line(second, duration=duration))
+                self.durations.setdefault(('test.c', 'find', 'IXSCAN { a: 1 }'), []).append(
+                    (second, duration))
+            elif second % 3 == 1:
+                lines.append(
+                    slow_query_line(second, plan='COLLSCAN', keys=0, docs=1000, duration=duration))
+                self.durations.setdefault(('test.c', 'find', 'COLLSCAN'), []).append(
+                    (second, duration))
+            else:
+                lines.append(
+                    slow_query_line(second,
+                                    ns='test.d',
+                                    command='insert',
+                                    plan=None,
+                                    keys=0,
+                                    docs=0,
+                                    returned=0,
+                                    duration=duration))
+                self.durations.setdefault(('test.d', 'insert', 'NONE'), []).append(
+                    (second, duration))
+            lines.append(OTHER_LINES[second % len(OTHER_LINES)])
+        # One node with a rotated, compressed log, another with a single log.
+        os.makedirs(os.path.join(self.reports, 'test_a', 'mongod.0'))
+        os.makedirs(os.path.join(self.reports, 'test_a', 'mongod.1'))
+        with gzip.open(os.path.join(self.reports, 'test_a', 'mongod.0', 'mongod.log.1.gz'),
+                       'wt') as log:
+            log.writelines(lines[:50])
+        with open(os.path.join(self.reports, 'test_a', 'mongod.0', 'mongod.log'), 'w') as log:
+            log.writelines(lines[50:])
+        with open(os.path.join(self.reports, 'test_a', 'mongod.1', 'mongod.log'), 'w') as log:
+            log.writelines(lines)
+        self.perf_json = os.path.join(self.reports, 'perf.json')
+        with open(self.perf_json, 'w') as perf_file:
+            json.dump(PERF_JSON, perf_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.reports)
+
+    def expected_durations(self, group):
+        """The durations of a group of slow queries during the tests, once per node."""
+        return sorted(2 * [
+            duration for second, duration in self.durations[group]
+            if 10 <= second <= 30 or 40 <= second <= 50
+        ])
+
+    def test_parse_slow_query(self):
+        """The fields of a slow query, and None for other lines."""
+        query = slow_query_analysis.parse_slow_query(slow_query_line(7, docs=20, duration=123))
+        self.assertEqual(
+            query,
+            slow_query_analysis.SlowQuery('2016-07-14T01:00:07.000+00:00', 'test.c', 'find',
+                                          'IXSCAN { a: 1 }', 123.0, 10, 20, 5))
+        for line in OTHER_LINES:
+            self.assertIsNone(slow_query_analysis.parse_slow_query(line))
+
+    def test_group_summary(self):
+        """Exact percentiles, a histogram of all the queries, and the scan ratios."""
+        queries = [
+            slow_query_analysis.SlowQuery('', 'test.c', 'find', 'COLLSCAN', duration, 0, 100, 4)
+            for duration in [0, 3, 7, 150, 2500, 10**9]
+        ]
+        summary = slow_query_analysis.group_summary(queries)
+        self.assertEqual(summary['count'], 6)
+        self.assertEqual(summary['docs_examined_per_returned'], 25.0)
+        self.assertEqual(summary['keys_examined_per_returned'], 0.0)
+        self.assertEqual(summary['latency_ms']['count'], 6)
+        self.assertEqual(summary['latency_ms']['histogram'], {
+            'bounds': [1.0, 5.0, 10.0, 200.0, 5000.0, 50000000.0],
+            'counts': [1, 1, 1, 1, 1, 1]
+        })
+        percentiles = summary['latency_ms']['percentiles']
+        self.assertEqual(percentiles['max'], 10.0**9)
+        self.assertEqual(percentiles['min'], 0.0)
+        self.assertEqual(percentiles['p50'], 78.5)
+
+    def test_slow_query(self):
+        """The slow queries during the tests are summarized per namespace and plan shape."""
+        config = {
+            'analysis': {
+                'slow_query': {
+                    'max_listed': 2
+                }
+            },
+            'test_control': {
+                'reports_dir_basename': self.reports,
+                'perf_json': {
+                    'path': self.perf_json
+                }
+            }
+        }
+        results = Mock()
+        slow_query_analysis.slow_query(config, results)
+
+        with open(os.path.join(self.reports, 'slow_queries.json')) as data_file:
+            summary = json.load(data_file)
+        self.assertEqual(summary['count'], 2 * 32)
+        plans = {(plan['ns'], plan['command'], plan['plan']): plan for plan in summary['plans']}
+        self.assertEqual(set(plans), set(self.durations))
+        for group, plan in plans.items():
+            durations = self.expected_durations(group)
+            self.assertEqual(plan['count'], len(durations))
+            self.assertEqual(plan['total_ms'], sum(durations))
+            self.assertEqual(plan['latency_ms']['percentiles']['p50'], np.percentile(durations, 50))
+            self.assertEqual(sum(plan['latency_ms']['histogram']['counts']), len(durations))
+        self.assertEqual([plan['total_ms'] for plan in summary['plans']],
+                         sorted((plan['total_ms'] for plan in summary['plans']), reverse=True))
+        self.assertEqual(plans[('test.c', 'find', 'COLLSCAN')]['docs_examined_per_returned'], 200.0)
+        self.assertIsNone(plans[('test.d', 'insert', 'NONE')]['docs_examined_per_returned'])
+        self.assertEqual(sorted(summary['namespaces']), ['test.c', 'test.d'])
+        self.assertEqual(
+            summary['namespaces']['test.c']['count'],
+            plans[('test.c', 'find', 'COLLSCAN')]['count'] +
+            plans[('test.c', 'find', 'IXSCAN { a: 1 }')]['count'])
+
+        results.add.assert_called_once()
+        args, kwargs = results.add.call_args
+        self.assertEqual(args, ('slow-query-analysis', 'pass'))
+        self.assertEqual(sorted(kwargs['slow_queries']), ['test.c', 'test.d'])
+        self.assertEqual(kwargs['slow_queries']['test.d']['max_ms'],
+                         max(self.expected_durations(('test.d', 'insert', 'NONE'))))
+        self.assertEqual(len(kwargs['log_raw'].splitlines()), 2 + 2)
+
+    def test_no_test_times(self):
+        """Without perf.json, all the slow queries are counted."""
+        summary = slow_query_analysis.analyze_slow_queries(self.reports)
+        self.assertEqual(summary['count'], 2 * 60)
+
+    def test_no_slow_queries(self):
+        """Nothing is added without slow queries."""
+        results = Mock()
+        config = {
+            'analysis': {},
+            'test_control': {
+                'reports_dir_basename': os.path.join(self.reports, 'test_b'),
+                'perf_json': {
+                    'path': self.perf_json
+                }
+            }
+        }
+        slow_query_analysis.slow_query(config, results)
+        results.add.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
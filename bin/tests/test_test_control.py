@@ -8,6 +8,9 @@ import os
 import re
 import shutil
 import subprocess
+import tempfile
+import threading
+import time
 import unittest
 
 from mock import patch, mock_open, Mock, call
@@ -19,14 +22,17 @@ from common.command_runner import EXCEPTION_BEHAVIOR
 from common.command_runner import print_trace
 from common.command_runner import run_pre_post_commands
 from common.config import ConfigDict
+from common.local_host import LocalHost
 from common.remote_host import RemoteHost
 from common.utils import mkdir_p
 from test_control import BackgroundCommand, start_background_tasks
 from test_control import copy_timeseries
+from test_control import copy_to_reports
 from test_control import get_error_from_exception, ExitStatus
 from test_control import run_test
 from test_control import run_tests
 from test_lib.fixture_files import FixtureFiles
+import test_control
 
 FIXTURE_FILES = FixtureFiles(os.path.dirname(__file__))
 
@@ -155,6 +161,24 @@ class RunTestsTestCase(unittest.TestCase):
         if os.path.exists('test_control.out.yml'):
             os.remove('test_control.out.yml')
 
+    @patch('common.results_archive.write_from_perf_json', side_effect=OSError('No space left'))
+    def test_copy_to_reports_archive_failure(self, mock_write):
+        """ The yml files are copied even if the results archive can't be written. """
+        work_dir = tempfile.mkdtemp()
+        cwd = os.getcwd()
+        try:
+            os.chdir(work_dir)
+            os.mkdir('reports')
+            for name in ('perf.json', 'test_control.yml'):
+                with open(name, 'w') as file_handle:
+                    file_handle.write('{}')
+            copy_to_reports()
+            self.assertTrue(mock_write.called)
+            self.assertEqual(sorted(os.listdir('reports')), ['perf.json', 'test_control.yml'])
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(work_dir)
+
     @patch('os.walk')
     @patch('test_control.extract_hosts')
     @patch('shutil.copyfile')
@@ -485,6 +509,69 @@ class RunTestsTestCase(unittest.TestCase):
         mock_generate_config_file.assert_called_once_with(test, directory, mock_host)
         mock_mkdir.assert_called()
 
+    @patch('test_control.generate_config_file')
+    @patch('common.command_runner.make_workload_runner_host')
+    @patch('test_control.mkdir_p')
+    @patch('common.ftdc_tail.aborts_on_failure', return_value=True)
+    @patch('common.ftdc_tail.start')
+    def test_run_test_ftdc_abort(self, mock_ftdc_tail_start, mock_aborts_on_failure, mock_mkdir,
+                                 mock_make_host, mock_generate_config_file):
+        """
+        Test test_control.run_test when the FTDC checks abort the test
+        """
+        def start(test, config, abort):
+            # pylint: disable=unused-argument
+            abort('FTDC resource rules failed')
+            return Mock()
+
+        mock_ftdc_tail_start.side_effect = start
+        mock_host = Mock(spec=RemoteHost)
+        mock_host.exec_command = Mock(return_value=0)
+        mock_make_host.return_value = mock_host
+        test = self.config['test_control']['run'][0]
+        with patch('test_control.open', mock_open()):
+            self.assertRaises(subprocess.CalledProcessError, run_test, test, self.config)
+        self.assertEqual(self.config['test_control']['out']['exit_codes'][test['id']], {
+            'status': 1,
+            'message': 'FTDC resource rules failed'
+        })
+        mock_aborts_on_failure.assert_called_once()
+        # The test command is killed through a second connection.
+        self.assertEqual(mock_make_host.call_count, 2)
+        self.assertEqual(mock_host.exec_command.call_args_list[0],
+                         call(test_control.KILL_TEST_COMMAND, quiet=True))
+        self.assertEqual(mock_host.exec_command.call_args_list[1][0][0],
+                         'echo $$ > .test_control.pid\n' + test['cmd'])
+        mock_generate_config_file.assert_called()
+        mock_mkdir.assert_called()
+
+    @patch('common.command_runner.make_workload_runner_host')
+    def test_kill_test_command(self, mock_make_host):
+        """
+        Test test_control.kill_test_command kills an abortable_command on the local host
+        """
+        mock_make_host.side_effect = LocalHost
+        directory = tempfile.mkdtemp()
+        previous_directory = os.getcwd()
+        os.chdir(directory)
+        try:
+            statuses = []
+            thread = threading.Thread(target=lambda: statuses.append(LocalHost().exec_command(
+                test_control.abortable_command('sleep 60 | cat'), quiet=True)))
+            thread.start()
+            for _ in range(100):
+                if os.path.exists(test_control.ABORT_PID_FILE):
+                    break
+                time.sleep(0.1)
+            test_control.kill_test_command(self.config)
+            thread.join(30)
+            self.assertFalse(thread.is_alive())
+            self.assertNotEqual(statuses, [0])
+            self.assertFalse(os.path.exists(test_control.ABORT_PID_FILE))
+        finally:
+            os.chdir(previous_directory)
+            shutil.rmtree(directory)
+
     @patch('test_control.generate_config_file')
     @patch('common.command_runner.make_workload_runner_host')
     @patch('test_control.mkdir_p')
@@ -3,6 +3,9 @@
 import unittest
 
 import datetime
+import os
+
+from mock import patch
 
 import libanalysis.util as util
 
@@ -16,6 +19,16 @@ class TestUtilFunctions(unittest.TestCase):
         parsed_date = util.num_or_str_to_date("2016-07-14T03:25:00.000+0000")
         self.assertIsInstance(parsed_date, datetime.datetime)
 
+    def test_worker_count(self):
+        """Test `worker_count()`."""
+        config = {'analysis': {'ftdc_workers': 0, 'log_workers': 3}}
+        self.assertEqual(util.worker_count(config, 'ftdc_workers'), os.cpu_count())
+        self.assertEqual(util.worker_count(config, 'log_workers'), 3)
+        self.assertEqual(util.worker_count(config, 'other_workers'), 1)
+        with patch('libanalysis.util.MAX_PLUGIN_WORKERS', 2):
+            self.assertEqual(util.worker_count(config, 'ftdc_workers'), min(os.cpu_count(), 2))
+            self.assertEqual(util.worker_count(config, 'log_workers'), 2)
+
     def test_get_test_times(self):
         """Test `get_test_times()`."""
         def assert_instancesof_datetime(tuples):
@@ -2,13 +2,15 @@
 Unit tests for bin/common/utils.py
 """
 import os
+import shutil
 import sys
+import tempfile
 import unittest
 from mock import patch
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + "/common")
 
-from common.utils import read_aws_credentials, read_aws_credentials_file, read_env_vars
+from common.utils import atomic_write, read_aws_credentials, read_aws_credentials_file, read_env_vars
 
 
 class TestUtils(unittest.TestCase):
@@ -112,3 +114,43 @@ class TestUtils(unittest.TestCase):
         with patch.dict('os.environ', test_dict):
             read_env_vars(test_config)
         self.assertEqual(test_config, expected_config)
+
+
+class TestAtomicWrite(unittest.TestCase):
+    """
+    Test suite for atomic_write
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'file')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_atomic_write(self):
+        """The file is replaced once the block is done."""
+        with open(self.path, 'w') as file_handle:
+            file_handle.write('old')
+        with atomic_write(self.path) as file_handle:
+            file_handle.write('new')
+            with open(self.path) as current:
+                self.assertEqual(current.read(), 'old')
+        with open(self.path) as current:
+            self.assertEqual(current.read(), 'new')
+        self.assertEqual(os.listdir(self.directory), ['file'])
+
+    def test_atomic_write_failure(self):
+        """The temporary file is removed when the block fails."""
+        with self.assertRaises(ValueError):
+            with atomic_write(self.path, 'wb') as file_handle:
+                file_handle.write(b'partial')
+                raise ValueError('failed')
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_atomic_write_replace_failure(self):
+        """The temporary file is removed when it can't replace the file."""
+        os.mkdir(self.path)
+        with self.assertRaises(OSError):
+            with atomic_write(self.path) as file_handle:
+                file_handle.write('new')
+        self.assertEqual(os.listdir(self.directory), ['file'])
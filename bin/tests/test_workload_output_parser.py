@@ -1,12 +1,17 @@
 """Tests for bin/common/workload_output_parser.py"""
 
+import csv
+import json
 import logging
 import os
+import shutil
+import tempfile
+import time
 import unittest
 
 from test_control import validate_config
 
-from common.workload_output_parser import parse_test_results
+from common.workload_output_parser import parse_test_results, GenericResultParser, ResultParser
 from test_lib.fixture_files import FixtureFiles
 
 FIXTURE_FILES = FixtureFiles(os.path.dirname(__file__))
@@ -151,3 +156,390 @@ class WorkloadOutputParserTestCase(unittest.TestCase):
         with self.assertRaises(NotImplementedError):
             self.config['test_control']['run'][0]['type'] = "no_such_test_type"
             validate_config(self.config)
+
+
+TSBS_PATTERNS = {
+    'options': {
+        'threads': {
+            'begin_marker': 'with ',
+            'end_marker': ' workers'
+        },
+        'iterations': {
+            'line_begin': 'Run complete after ',
+            'end_marker': ' queries with '
+        }
+    },
+    'results_start': ['Run complete after'],
+    'results_end': 'wall clock time ',
+    'results': {
+        'query_rate_qps': {
+            'line_begin': 'Run complete after ',
+            'begin_marker': 'Overall query rate ',
+            'end_marker': ' queries/sec)'
+        },
+        'wall_clock_time': {
+            'line_begin': 'wall clock time: '
+        },
+        'min_ms': {
+            'line_begin': 'min:',
+            'begin_marker': 'min:  ',
+            'end_marker': 'ms,'
+        },
+        'max_ms': {
+            'line_begin': 'min:',
+            'begin_marker': 'max:  ',
+            'end_marker': 'ms,'
+        }
+    }
+}
+
+
+def multi_pass_generic_parse(patterns, path):
+    """
+    The GenericResultParser algorithm before it was made single pass: one pass over the file at
+    `path` per option and per metric. Kept here as the reference the single pass parser is compared
+    to.
+
+    :return: (threads, [(metric, value), ...]) in the order results were added.
+    """
+
+    # pylint: disable=too-many-branches,too-many-locals
+    def as_list(markers):
+        if isinstance(markers, list):
+            return markers
+        return [] if markers is None else [markers]
+
+    def sections(start, end, section_patterns):
+        for name, pattern in section_patterns.items():
+            active = not start
+            start_list, end_list = as_list(start), as_list(end)
+            start_found = end_found = 0
+            with open(path) as log_file:
+                lines = list(log_file)
+            for line in lines:
+                if not active and start_list and start_list[start_found] in line:
+                    start_found += 1
+                    if len(start_list) == start_found:
+                        active, end_found = True, 0
+                elif active and end_list and end_list[end_found] in line:
+                    end_found += 1
+                    if len(end_list) == end_found:
+                        active, start_found = False, 0
+                if not active:
+                    continue
+                line_begin = pattern.get('line_begin')
+                if line_begin is None or line.startswith(line_begin):
+                    begin_marker = pattern.get('begin_marker', line_begin)
+                    end_marker = pattern['end_marker'] if 'end_marker' in pattern else None
+                    parts = line.rstrip().split(begin_marker)
+                    if len(parts) > 1:
+                        parts2 = parts[1].split(end_marker) if end_marker else [parts[1]]
+                        if len(parts2) > 1:
+                            yield name, parts2[0]
+
+    threads = None
+    for name, value in sections(patterns.get('options_start', []), patterns.get('options_end', []),
+                                patterns.get('options', {})):
+        if name == 'threads':
+            threads = value
+    results = [(name, float(value)) for name, value in sections(patterns.get(
+        'results_start', []), patterns.get('results_end', []), patterns.get('results', {}))]
+    return threads, results
+
+
+class GenericResultParserTestCase(unittest.TestCase):
+    """Unit tests and a regression benchmark for GenericResultParser."""
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.config = {
+            'test_control': {
+                'task_name': 'parser_unittest',
+                'reports_dir_basename': FIXTURE_FILES.fixture_dir_path,
+                'perf_json': {
+                    'path': os.path.join(self.work_dir, 'perf.json')
+                },
+                'output_file': {
+                    'tsbs': 'test_output.log'
+                }
+            },
+            'analysis': {
+                'generic_parser': {
+                    'patterns': {
+                        'tsbs': TSBS_PATTERNS
+                    }
+                }
+            },
+            'mongodb_setup': {
+                'mongod_config_file': {
+                    'storage': {
+                        'engine': 'wiredTiger'
+                    }
+                }
+            },
+            'cluster_setup': {
+                'meta': {
+                    'product_name': 'mongodb'
+                }
+            }
+        } # yapf: disable
+        self.timer = {'start': 1.001, 'end': 2.002}
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def _parse(self, test_id):
+        test = {'id': test_id, 'type': 'tsbs'}
+        self.assertTrue(parse_test_results(test, self.config, self.timer))
+        with open(self.config['test_control']['perf_json']['path']) as perf_json:
+            return json.load(perf_json)['results']
+
+    def test_tsbs_results(self):
+        """Options and metrics are all found in one pass over the log."""
+        results = self._parse('tsbs-unittest')
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]['name'], 'tsbs-unittest')
+        self.assertEqual(
+            results[0]['results'], {
+                '8': {
+                    'query_rate_qps': 412.35,
+                    'query_rate_qps_values': [412.35],
+                    'min_ms': 10.52,
+                    'min_ms_values': [10.52, 10.52],
+                    'max_ms': 120.36,
+                    'max_ms_values': [120.36, 120.36]
+                }
+            })
+
+    def test_latency_distribution(self):
+        """Metrics can also be percentiles of a distribution, merged over the sections."""
+        patterns = dict(TSBS_PATTERNS)
+        patterns['results'] = dict(TSBS_PATTERNS['results'])
+        for metric, percentile in (('min_ms', 'min'), ('max_ms', 'max')):
+            patterns['results'][metric] = dict(TSBS_PATTERNS['results'][metric],
+                                               distribution='query_latency_ms',
+                                               percentile=percentile)
+        self.config['analysis']['generic_parser']['patterns']['tsbs'] = patterns
+        thread_results = self._parse('tsbs-unittest')[0]['results']['8']
+        self.assertEqual(thread_results['min_ms_values'], [10.52, 10.52])
+        self.assertEqual(thread_results['query_latency_ms_distribution'], {
+            'runs': 2,
+            'percentiles': {
+                'min': 10.52,
+                'max': 120.36
+            }
+        })
+
+    def test_log_read_once(self):
+        """The input log is opened once, no matter how many options and metrics are configured."""
+        test = {'id': 'tsbs-unittest', 'type': 'tsbs'}
+        parser = GenericResultParser(test, self.config, self.timer)
+        reads = []
+        load_input_log = parser.load_input_log
+
+        def counting_load_input_log():
+            reads.append(1)
+            return load_input_log()
+
+        parser.load_input_log = counting_load_input_log
+        self.assertTrue(parser.parse())
+        self.assertEqual(len(reads), 1)
+
+    def test_large_log_regression(self):  # pylint: disable=too-many-locals
+        """
+        Regression benchmark: parse a large synthetic log with many sections and metrics, check the
+        results equal those of the old multi pass algorithm, and log both run times.
+        """
+        test_id = 'tsbs-large'
+        log_dir = os.path.join(self.work_dir, test_id)
+        os.mkdir(log_dir)
+        self.config['test_control']['reports_dir_basename'] = self.work_dir
+        patterns = dict(TSBS_PATTERNS)
+        patterns['results'] = dict(TSBS_PATTERNS['results'])
+        for stat in ('med', 'mean', 'stddev'):
+            patterns['results'][stat + '_ms'] = {
+                'line_begin': 'min:',
+                'begin_marker': stat + ':  ',
+                'end_marker': 'ms,'
+            }
+        self.config['analysis']['generic_parser']['patterns']['tsbs'] = patterns
+
+        lines = []
+        for section in range(20):
+            lines.extend('{0},{1}.5,1.0E+07,{1}.5\n'.format(1640995210 + i, i * section)
+                         for i in range(5000))
+            lines.append('Run complete after 1000 queries with {0} workers '
+                         '(Overall query rate {1}.25 queries/sec):\n'.format(
+                             8 + section % 2, 400 + section))
+            lines.append('min:    {0}.5ms, med:    17.70ms, mean:    19.40ms, max:   120.36ms, '
+                         'stddev:     7.04ms, sum:  19.4sec, count: 1000\n'.format(section))
+            lines.append('wall clock time: 2.458010sec\n')
+        log_path = os.path.join(log_dir, 'test_output.log')
+        with open(log_path, 'w') as log_file:
+            log_file.writelines(lines)
+
+        start = time.time()
+        expected_threads, expected_results = multi_pass_generic_parse(patterns, log_path)
+        multi_pass_seconds = time.time() - start
+        start = time.time()
+        results = self._parse(test_id)
+        single_pass_seconds = time.time() - start
+        LOG.info("GenericResultParser: multi pass %.3fs, single pass %.3fs", multi_pass_seconds,
+                 single_pass_seconds)
+
+        thread_results = results[0]['results'][expected_threads]
+        for metric in patterns['results']:
+            expected = [value for name, value in expected_results if name == metric]
+            if expected:
+                self.assertEqual(thread_results[metric + '_values'], expected)
+            else:
+                self.assertNotIn(metric, thread_results)
+
+
+class GennyTimeSeriesTestCase(unittest.TestCase):
+    """Unit tests for reading genny's FTDC metrics in GennyResultsParser."""
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        shutil.copytree(FIXTURE_FILES.fixture_file_path('genny-unittest'),
+                        os.path.join(self.work_dir, 'genny-unittest'))
+        self.config = {
+            'test_control': {
+                'task_name': 'parser_unittest',
+                'reports_dir_basename': self.work_dir,
+                'perf_json': {
+                    'path': os.path.join(self.work_dir, 'perf.json')
+                },
+                'genny': {
+                    'timeseries': {
+                        'window_seconds': 5,
+                        'percentiles': [50, 99],
+                        'output_file': 'genny-timeseries.csv'
+                    }
+                }
+            },
+            'mongodb_setup': {
+                'mongod_config_file': {
+                    'storage': {
+                        'engine': 'wiredTiger'
+                    }
+                }
+            },
+            'cluster_setup': {
+                'meta': {
+                    'product_name': 'mongodb'
+                }
+            }
+        } # yapf: disable
+        self.timer = {'start': 1.001, 'end': 2.002}
+        self.test = {
+            'id': 'genny-unittest',
+            'type': 'genny',
+            'output_files': ['genny-metrics.json', 'data/genny/build/CedarMetrics']
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_timeseries_results(self):
+        """Windowed throughput and the latency distribution of each operation go to perf.json."""
+        self.assertTrue(parse_test_results(self.test, self.config, self.timer))
+        with open(self.config['test_control']['perf_json']['path']) as perf_json:
+            results = {result['name']: result for result in json.load(perf_json)['results']}
+
+        # The legacy report is still merged.
+        self.assertIn('dummy_inserts', results)
+        insert = results['InsertRemove.Insert']['results']['4']
+        # 100 ops/sec, except in the window where nothing completed for 3 seconds.
+        self.assertEqual(insert['min_window_ops_per_sec'], 40.0)
+        self.assertEqual(insert['max_window_ops_per_sec'], 100.0)
+        self.assertEqual(
+            insert['latency_us_distribution'], {
+                'runs': 1,
+                'count': 270,
+                'percentiles': {
+                    'min': 1000.0,
+                    'p50': 1700.0,
+                    'p99': 2000.0,
+                    'max': 3000000.0
+                }
+            })
+        remove = results['InsertRemove.Remove']['results']['4']
+        self.assertEqual(remove['min_window_ops_per_sec'], 4.0)
+        self.assertEqual(remove['latency_us_distribution']['percentiles']['max'], 500.0)
+
+    def test_timeseries_file(self):
+        """The windowed stats of all operations are written to one CSV file."""
+        self.assertTrue(parse_test_results(self.test, self.config, self.timer))
+        with open(os.path.join(self.work_dir, 'genny-unittest',
+                               'genny-timeseries.csv')) as csv_file:
+            rows = list(csv.DictReader(csv_file))
+        self.assertEqual(len(rows), 12)
+        insert = [row for row in rows if row['operation'] == 'InsertRemove.Insert']
+        self.assertEqual([row['ops_per_sec'] for row in insert],
+                         ['100', '100', '100', '100', '40', '102.041'])
+        # Warm-up, steady state, and the operation that was stuck for 3 seconds.
+        self.assertEqual([row['latency_us_p99'] for row in insert],
+                         ['2000', '2000', '1900', '1900', '1900', '3000000'])
+        self.assertEqual(insert[0]['start'], '1577836800')
+
+    def test_no_timeseries(self):
+        """Without FTDC metrics in output_files only the legacy report is read."""
+        self.test['output_files'] = ['genny-metrics.json']
+        self.assertTrue(parse_test_results(self.test, self.config, self.timer))
+        self.assertFalse(
+            os.path.exists(os.path.join(self.work_dir, 'genny-unittest', 'genny-timeseries.csv')))
+
+
+class StreamingReaderTestCase(unittest.TestCase):
+    """Unit tests for ResultParser.find_input_lines() and find_input_block()."""
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        config = {
+            'test_control': {
+                'task_name': 'parser_unittest',
+                'reports_dir_basename': self.work_dir,
+                'perf_json': {
+                    'path': os.path.join(self.work_dir, 'perf.json')
+                }
+            },
+            'cluster_setup': {
+                'meta': {
+                    'product_name': 'wiredTiger'
+                }
+            }
+        }
+        self.parser = ResultParser({'id': 'streaming', 'type': 'none'}, config, None)
+        self.parser.input_log = os.path.join(self.work_dir, 'test_output.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def _write(self, text):
+        with open(self.parser.input_log, 'w') as log_file:
+            log_file.write(text)
+
+    def test_find_input_lines(self):
+        """Only lines starting with a marker are returned, in file order."""
+        self._write(">>> first : 1 1\nnot >>> this\n[X], a\n>>> second : 2 2\n[X], b")
+        self.assertEqual(self.parser.find_input_lines([">>> ", "[X], "]),
+                         [">>> first : 1 1\n", "[X], a\n", ">>> second : 2 2\n", "[X], b"])
+        self.assertEqual(self.parser.find_input_lines(["missing"]), [])
+
+    def test_find_input_lines_timer(self):
+        """Timer lines are picked up even though they weren't asked for."""
+        self._write("Test started at (seconds): 10.5\n>>> a : 1 1\nTest ended at (seconds): 20\n")
+        self.assertEqual(self.parser.find_input_lines([">>> "]), [">>> a : 1 1\n"])
+        self.assertEqual(self.parser.timer, {'start': 10.5, 'end': 20.0})
+
+    def test_find_input_block(self):
+        """The last block between the markers is returned."""
+        self._write("--- start ---\nold\n--- end ---\nnoise\n"
+                    "x --- start --- x\n{\"a\": 1,\n\"b\": 2}\n--- end ---\ntail\n")
+        self.assertEqual(self.parser.find_input_block("--- start ---", "--- end ---"),
+                         '{"a": 1,\n"b": 2}\n')
+        self.assertEqual(self.parser.find_input_block("--- missing ---", "--- end ---"), "")
+
+    def test_empty_file(self):
+        """An empty log has no lines and no blocks."""
+        self._write("")
+        self.assertEqual(self.parser.find_input_lines([">>> "]), [])
+        self.assertEqual(self.parser.find_input_block("--- start ---", "--- end ---"), "")
@@ -1,13 +1,23 @@
 """Unit tests for `ycsb_throughput_analysis.py`."""
 
+import itertools
+import logging
+import math
+import os
 from os import path
-
+import shutil
+import tempfile
+import time
 import unittest
 
+import numpy as np
+
+from test_lib.benchmark import benchmark
 from test_lib.fixture_files import FixtureFiles
 import libanalysis.ycsb_throughput_analysis as ycsb_throughput
 
 FIXTURE_FILES = FixtureFiles(path.dirname(__file__))
+LOG = logging.getLogger(__name__)
 
 
 def tuples_to_throughputs(time_ops_tuples):
@@ -16,6 +26,67 @@ def tuples_to_throughputs(time_ops_tuples):
     return [ycsb_throughput.Throughput(*pair) for pair in time_ops_tuples]
 
 
+def loop_analyze_spiky_throughput(throughputs,
+                                  max_drop=0.5,
+                                  min_duration=10,
+                                  skip_initial_seconds=10):
+    """_analyze_spiky_throughput() as it was, one datapoint at a time."""
+    err_messages = []
+    while throughputs and throughputs[0].time <= skip_initial_seconds:
+        throughputs = throughputs[1:]
+    avg_throughput = float(sum(pair.ops for pair in throughputs)) / len(throughputs)
+    min_acceptable_throughput = avg_throughput * max_drop
+    throughputs_iter = iter(throughputs)
+    for throughput in throughputs_iter:
+        if throughput.ops < min_acceptable_throughput:
+            first_low_throughput_time = throughput.time
+            low_throughputs = list(
+                itertools.takewhile(lambda throughput: throughput.ops < min_acceptable_throughput,
+                                    throughputs_iter))
+            if not low_throughputs:
+                continue
+            last_low_throughput_time = low_throughputs[-1].time
+            duration = last_low_throughput_time - first_low_throughput_time
+            if duration >= min_duration:
+                low_throughputs_str = "\n".join("    {0} sec: {1} ops/sec".format(time, throughput)
+                                                for time, throughput in low_throughputs)
+                err_messages.append(
+                    ("spiky throughput: Detected low throughput for {0} seconds, starting at {1} "
+                     "seconds and ending at {2} seconds. The minimum acceptable throughput is {3} "
+                     "ops/sec (the average throughput for the test was {4}ops/sec ), and the low "
+                     "throughputs were: \n{5}\n").format(duration, first_low_throughput_time,
+                                                         last_low_throughput_time,
+                                                         min_acceptable_throughput, avg_throughput,
+                                                         low_throughputs_str))
+    return err_messages
+
+
+def loop_analyze_long_term_degradation(throughputs, duration_seconds=10 * 60, max_drop=0.7):
+    """_analyze_long_term_degradation() as it was, averaging each window on its own."""
+    err_messages = []
+    reporting_interval = throughputs[1].time - throughputs[0].time
+    data_window_width = int(math.ceil(float(duration_seconds) / reporting_interval))
+    if len(throughputs) > data_window_width:
+        max_throughput = max(
+            ycsb_throughput.average_throughput(throughputs[x:x + data_window_width])
+            for x in range(len(throughputs) - data_window_width))
+        min_acceptable_throughput = max_throughput * max_drop
+        for failure in range(len(throughputs) - data_window_width):
+            avg_throughput = ycsb_throughput.average_throughput(throughputs[failure:failure +
+                                                                            data_window_width])
+            if avg_throughput < min_acceptable_throughput:
+                start_time = throughputs[failure].time
+                end_time = throughputs[failure + data_window_width].time
+                err_messages.append(
+                    ("long term throughput degradation: Detected a low average throughput of {0} "
+                     "starting at {1} and ending at {2} (total duration of {3} seconds). The "
+                     "maximum throughput of the run was {4}, so the minimum acceptable throughput "
+                     "was {5}.\n").format(avg_throughput, start_time, end_time,
+                                          end_time - start_time, max_throughput,
+                                          min_acceptable_throughput))
+    return err_messages
+
+
 class TestYCSBThroughputAnalysis(unittest.TestCase):
     """Test suite."""
     def test_get_ycsb_file_paths(self):
@@ -95,3 +166,56 @@ class TestYCSBThroughputAnalysis(unittest.TestCase):
         # With a 700 second period, the max period troughput is < 100,
         # and the last window has an average over 70
         self.assertTrue(analyze(duration_seconds=10 * 70))
+
+
+class VectorizedYcsbThroughputTestCase(unittest.TestCase):
+    """The YCSB throughput analysis gives the same messages as loops."""
+    hours = 2
+
+    def setUp(self):
+        self.reports = tempfile.mkdtemp()
+        os.makedirs(path.join(self.reports, 'ycsb-run'))
+        # Status every second, around 20000 ops/sec, with a stall every hour and a slow period.
+        random = np.random.RandomState(46)
+        seconds = np.arange(1, self.hours * 3600 + 1)
+        ops = np.round(random.uniform(19000, 21000, len(seconds)), 2)
+        ops[seconds % 3600 < 30] = np.round(random.uniform(0, 500, self.hours * 30), 2)
+        slow_start = len(seconds) * 7 // 12
+        ops[(seconds > slow_start) & (seconds < slow_start + 2000)] /= 2
+        with open(path.join(self.reports, 'ycsb-run', 'test_output.log'), 'w') as ycsb_file:
+            ycsb_file.write('YCSB Client 0.17.0\n')
+            ycsb_file.writelines(
+                ' {0} sec: {0}000 operations; {1} current ops/sec; [READ: Count=1]\n'.format(
+                    second, value) for second, value in zip(seconds.tolist(), ops.tolist()))
+
+    def tearDown(self):
+        shutil.rmtree(self.reports)
+
+    def test_same_messages(self):
+        """The single pass and the vectorized checks give the same messages as the loops."""
+        log_path = path.join(self.reports, 'ycsb-run', 'test_output.log')
+        start = time.time()
+        with open(log_path) as ycsb_file:
+            self.assertTrue(any('YCSB Client' in line for line in ycsb_file))
+        with open(log_path) as ycsb_file:
+            throughputs = ycsb_throughput._throughputs_from_lines(ycsb_file)
+        expected = (loop_analyze_spiky_throughput(throughputs) +
+                    loop_analyze_long_term_degradation(throughputs))
+        loop_seconds = time.time() - start
+        start = time.time()
+        results = ycsb_throughput.analyze_ycsb_throughput(self.reports)
+        vectorized_seconds = time.time() - start
+        LOG.info("YCSB throughput analysis: loop %.3fs, vectorized %.3fs", loop_seconds,
+                 vectorized_seconds)
+        self.assertTrue(any(message.startswith('spiky') for message in expected))
+        self.assertTrue(any(message.startswith('long term') for message in expected))
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]['status'], 'fail')
+        self.assertEqual(results[0]['log_raw'],
+                         'File: {0}\n{1}'.format(log_path, '\n'.join(expected)))
+
+
+@benchmark
+class YcsbThroughputBenchmarkTestCase(VectorizedYcsbThroughputTestCase):
+    """Regression benchmark of the YCSB throughput analysis on a 24 hour long capture."""
+    hours = 24
@@ -0,0 +1,17 @@
+"""
+Benchmarks kept next to the unit tests.
+
+A benchmark compares an implementation with its slower reference on a realistic input, and only
+logs the timings. They are skipped unless the DSI_BENCHMARKS environment variable is set:
+
+    DSI_BENCHMARKS=1 python -m pytest -s --log-cli-level=INFO bin/tests/test_rules.py
+"""
+
+import os
+import unittest
+
+ENVIRONMENT_VARIABLE = 'DSI_BENCHMARKS'
+
+# pylint: disable=invalid-name
+benchmark = unittest.skipUnless(os.environ.get(ENVIRONMENT_VARIABLE),
+                                'Set {0} to run the benchmarks'.format(ENVIRONMENT_VARIABLE))